@@ -0,0 +1,133 @@
+# batch.py
+"""
+Bulk rewrite runner shared by ``POST /prompt-assist/batch`` and the CLI.
+
+Identical items are deduplicated before any upstream call and unique items
+run under a concurrency bound. Rate limits and ``Retry-After`` are handled by
+the shared upstream scheduler, so a batch queues behind interactive traffic
+instead of hammering Groq. Results are yielded as they finish.
+
+CLI usage (resumable through the checkpoint file):
+
+    python batch.py prompts.jsonl -o rewrites.jsonl --checkpoint rewrites.ckpt
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+
+from fastapi import HTTPException
+
+
+def item_key(item) -> str:
+    """Stable hash of a normalized ``AssistRequest``."""
+    payload = json.dumps(item.model_dump(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def run_batch(
+    items: Iterable,
+    assist_fn: Callable[..., Awaitable],
+    concurrency: int = 8,
+    skip_keys: set[str] | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Yield one record per *unique* item as soon as it completes:
+    ``{key, indices, prompt}`` on success or ``{key, indices, error}``.
+    ``indices`` lists every input position that shared the result.
+    """
+    groups: dict[str, list[int]] = {}
+    unique: dict[str, object] = {}
+    for i, item in enumerate(items):
+        key = item_key(item)
+        if skip_keys and key in skip_keys:
+            continue
+        groups.setdefault(key, []).append(i)
+        unique.setdefault(key, item)
+
+    sem = asyncio.Semaphore(concurrency)
+    results: asyncio.Queue[dict] = asyncio.Queue()
+
+    async def work(key: str, item) -> None:
+        record = {"key": key, "indices": groups[key]}
+        async with sem:
+            try:
+                record["prompt"] = (await assist_fn(item)).prompt
+            except HTTPException as e:
+                record["error"] = e.detail
+            except Exception as e:
+                record["error"] = str(e)
+        await results.put(record)
+
+    tasks = [asyncio.create_task(work(k, it)) for k, it in unique.items()]
+    try:
+        for _ in range(len(tasks)):
+            yield await results.get()
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+# ─── CLI ───
+def read_jsonl(path: str):
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_checkpoint(path: str | None) -> set[str]:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+async def main_async(args) -> None:
+    from main import AssistRequest, assist_async, close_async_client, local_backend
+
+    items = [AssistRequest(**row) for row in read_jsonl(args.input)]
+    done = load_checkpoint(args.checkpoint)
+    if done:
+        print(f"resuming: {len(done)} items already in checkpoint", file=sys.stderr)
+
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    ckpt = open(args.checkpoint, "a", encoding="utf-8") if args.checkpoint else None
+    n_ok = n_err = 0
+    # the app's lifespan doesn't run here; start what it would have started
+    if local_backend is not None:
+        await local_backend.start()
+    try:
+        async for record in run_batch(items, assist_fn=assist_async,
+                                      concurrency=args.concurrency, skip_keys=done):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in record:
+                n_err += 1
+                continue
+            n_ok += 1
+            if ckpt:
+                ckpt.write(record["key"] + "\n")
+                ckpt.flush()
+    finally:
+        if local_backend is not None:
+            await local_backend.close()
+        await close_async_client()
+        if out is not sys.stdout:
+            out.close()
+        if ckpt:
+            ckpt.close()
+    print(f"done: {n_ok} ok, {n_err} failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Bulk /prompt-assist rewrites from a JSONL file")
+    p.add_argument("input", help="JSONL of AssistRequest objects ('-' for stdin)")
+    p.add_argument("-o", "--output", help="append NDJSON results here (default: stdout)")
+    p.add_argument("--checkpoint", help="file of completed item keys; enables resume")
+    p.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(main_async(p.parse_args()))
@@ -0,0 +1,74 @@
+# bench/compare_tournament.py
+"""
+Upstream calls and wall time: N separate /compare requests vs one
+/compare/tournament for the same original and N rewrites.
+
+    python bench/compare_tournament.py
+    python bench/compare_tournament.py --sizes 2 4 8 12 --latency lognormal:0.4:0.5
+
+Each side gets its own prompts, so neither is served from the other's
+memoized answers; the separate /compare requests still reuse the original's
+answer from the second request on.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import types
+import uuid
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadtest  # noqa: E402
+
+MODES = ("rewrite", "shorten", "lengthen", "casual", "formal")
+
+
+async def measure(http: httpx.AsyncClient, mock: str, fn) -> tuple[int, float]:
+    before = (await http.get(f"{mock}/stats")).json()["calls"]
+    t0 = time.perf_counter()
+    await fn()
+    wall = time.perf_counter() - t0
+    return (await http.get(f"{mock}/stats")).json()["calls"] - before, wall
+
+
+async def main_async(args) -> None:
+    server = types.SimpleNamespace(latency=args.latency, error_500=0.0, error_429=0.0, workers=1)
+    procs, base, mock = loadtest.start_servers(server)
+    try:
+        print(f"{'N':>3} {'separate calls':>15} {'separate s':>11} {'tournament calls':>17} {'tournament s':>13}")
+        async with httpx.AsyncClient(base_url=base, timeout=120.0) as http:
+            for n in args.sizes:
+                original = f"Write a product description for our new kettle ({uuid.uuid4().hex[:8]})"
+                rewrites = [f"{MODES[i % len(MODES)]} #{i}: {original}, in 80 words" for i in range(n)]
+
+                async def separate():
+                    # what the UI does today: one /compare per mode, sequentially
+                    for r in rewrites:
+                        resp = await http.post("/compare", json={"original_prompt": original, "rewritten_prompt": r})
+                        resp.raise_for_status()
+
+                async def tournament():
+                    resp = await http.post("/compare/tournament",
+                                           json={"original_prompt": original + " (t)",
+                                                 "rewrites": [r + " (t)" for r in rewrites]})
+                    resp.raise_for_status()
+
+                sep_calls, sep_wall = await measure(http, mock, separate)
+                tour_calls, tour_wall = await measure(http, mock, tournament)
+                print(f"{n:>3} {sep_calls:>15} {sep_wall:>11.2f} {tour_calls:>17} {tour_wall:>13.2f}")
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=15)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--sizes", type=int, nargs="+", default=[2, 4, 8])
+    p.add_argument("--latency", default="lognormal:0.2:0.4", help="mock upstream latency spec")
+    asyncio.run(main_async(p.parse_args()))
@@ -0,0 +1,64 @@
+# bench/hedging.py
+"""
+Tail latency of /prompt-assist with and without hedged upstream calls.
+
+    python bench/hedging.py
+    python bench/hedging.py --latency lognormal:0.3:1.0 --percentile 0.95
+
+Runs the same load twice against the mock upstream with a heavy-tailed
+latency: once plain, once with ``HEDGE_STAGES=assist_rewrite``. Reports
+p50/p95/p99, the extra upstream calls the hedges cost and how many of them
+beat the original.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import types
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadtest  # noqa: E402
+
+
+async def run(args, hedged: bool) -> dict:
+    env = {"HEDGE_STAGES": "assist_rewrite" if hedged else "",
+           "HEDGE_PERCENTILE": str(args.percentile), "HEDGE_MAX_EXTRA": str(args.max_extra)}
+    server = types.SimpleNamespace(latency=args.latency, error_500=0.0, error_429=0.0, workers=1)
+    procs, base, mock = loadtest.start_servers(server, extra_env=env)
+    try:
+        # let the latency tracker fill before measuring
+        await loadtest.run_scenario(base, "prompt-assist", args.concurrency, args.warmup)
+        before = httpx.get(f"{mock}/stats").json()["calls"]
+        r = await loadtest.run_scenario(base, "prompt-assist", args.concurrency, args.requests)
+        calls = httpx.get(f"{mock}/stats").json()["calls"] - before
+        hedges = httpx.get(f"{base}/upstream/stats").json()["hedges"].get("assist_rewrite", {})
+        return {**r, "upstream_per_request": round(calls / args.requests, 3),
+                "fired": hedges.get("fired", 0), "won": hedges.get("won", 0),
+                "hedge_after_ms": hedges.get("hedge_after_ms")}
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=15)
+
+
+async def main_async(args) -> None:
+    print(f"{'mode':<8} {'p50':>7} {'p95':>7} {'p99':>7} {'upstream/req':>13} {'fired':>6} {'won':>5}")
+    for hedged in (False, True):
+        r = await run(args, hedged)
+        print(f"{'hedged' if hedged else 'plain':<8} {r['p50']:>7.3f} {r['p95']:>7.3f} {r['p99']:>7.3f} "
+              f"{r['upstream_per_request']:>13.3f} {r['fired']:>6} {r['won']:>5}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--latency", default="lognormal:0.2:1.5", help="mock upstream latency spec")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--requests", type=int, default=400)
+    p.add_argument("--warmup", type=int, default=60)
+    p.add_argument("--percentile", type=float, default=0.9)
+    p.add_argument("--max-extra", type=float, default=0.15)
+    asyncio.run(main_async(p.parse_args()))
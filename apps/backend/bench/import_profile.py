@@ -0,0 +1,85 @@
+# bench/import_profile.py
+"""
+Cold-start profile: how long ``import main`` takes and where it goes.
+
+Runs ``python -X importtime -c "import main"`` in fresh interpreters and
+reports the median wall time plus the slowest packages and app modules
+(cumulative import time, children included, so a package pulled in by
+another one is counted under both).
+
+    python bench/import_profile.py                 # compare with bench/import_profile.json
+    python bench/import_profile.py --save          # refresh the checked-in profile
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+PROFILE = os.path.join(HERE, "import_profile.json")
+LOCAL = {os.path.splitext(f)[0] for f in os.listdir(BACKEND) if f.endswith(".py")} | {"data"}
+
+SCRIPT = "import time; t0 = time.perf_counter(); import main; print(time.perf_counter() - t0)"
+
+
+def run_once() -> tuple[float, dict[str, int]]:
+    env = {
+        **os.environ,
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "profile"),
+        "ORIGINS":      "*",
+        "TEMPLATE_DB_PATH": "",
+    }
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT],
+                          cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+    wall = float(proc.stdout.strip().splitlines()[-1])
+    cumulative: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        # packages only (fastapi, not fastapi.routing); each is imported once
+        if "." not in name and name != "main":
+            cumulative[name] = int(cum)
+    return wall, cumulative
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=15)
+    p.add_argument("--save", action="store_true")
+    args = p.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    wall = statistics.median(w for w, _ in runs)
+    names = set().union(*(c for _, c in runs))
+    modules = {n: statistics.median(c.get(n, 0) for _, c in runs) / 1000 for n in names}
+
+    print(f"import main: {wall * 1000:.0f} ms (median of {args.runs})\n")
+    print(f"{'module':<32} {'cumulative ms':>14}")
+    for name, ms in sorted(modules.items(), key=lambda kv: -kv[1])[:args.top]:
+        tag = "  (app)" if name.split(".")[0] in LOCAL else ""
+        print(f"{name:<32} {ms:>14.1f}{tag}")
+
+    result = {
+        "python": sys.version.split()[0],
+        "wall_ms": round(wall * 1000, 1),
+        "modules_ms": {n: round(ms, 1) for n, ms in sorted(modules.items(), key=lambda kv: -kv[1])[:args.top]},
+    }
+    if args.save:
+        with open(PROFILE, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nprofile written to {PROFILE}")
+    elif os.path.exists(PROFILE):
+        with open(PROFILE) as f:
+            old = json.load(f)
+        print(f"\nchecked-in profile: {old['wall_ms']:.0f} ms  (now {result['wall_ms']:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# bench/json_extract.py
+"""
+Failure rate and speed of LLM-output JSON parsing: the old per-call-site
+parsers vs ``jsonextract``.
+
+    python bench/json_extract.py
+    python bench/json_extract.py --corpus my_recorded_replies.jsonl
+
+The corpus is JSONL of ``{site, case, text}`` where ``site`` is ``grade``
+(/compare), ``topics`` or ``meta`` (template pipeline). The bundled
+``fixtures/llm_outputs.jsonl`` catalogues the reply shapes seen from the
+models (fences, preambles, trailing notes, truncation); append real replies
+to it as they turn up.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonextract import JSONStream, extract_json  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXPECT = {"grade": dict, "topics": list, "meta": dict}
+
+
+# ─── The parsers each call site used before ───
+def old_compare(text: str):
+    return json.loads(re.sub(r"^```json|```$", "", text.strip(), flags=re.DOTALL).strip())
+
+
+OLD = {"grade": old_compare, "topics": json.loads, "meta": json.loads}
+
+
+def succeeds(fn, text: str, expect: type) -> bool:
+    try:
+        return isinstance(fn(text), expect)
+    except ValueError:
+        return False
+
+
+def per_call_us(fn, text: str, expect: type, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            fn(text, expect)
+        except ValueError:
+            pass
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def stream_us(text: str, chunk: int, repeat: int) -> tuple[float, float]:
+    """Incremental scan vs re-parsing the whole buffer after every chunk."""
+    chunks = [text[i:i + chunk] for i in range(0, len(text), chunk)]
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        s = JSONStream("{")
+        for c in chunks:
+            s.feed(c)
+    incremental = (time.perf_counter() - t0) / repeat * 1e6
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        buf = ""
+        for c in chunks:
+            buf += c
+            try:
+                extract_json(buf, dict)
+            except ValueError:
+                pass
+    reparse = (time.perf_counter() - t0) / repeat * 1e6
+    return incremental, reparse
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--corpus", default=os.path.join(HERE, "fixtures", "llm_outputs.jsonl"))
+    p.add_argument("--repeat", type=int, default=2000)
+    args = p.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    print(f"{'site':<7} {'case':<34} {'old':>4} {'new':>4}")
+    totals = {"old": 0, "new": 0}
+    for r in rows:
+        expect = EXPECT[r["site"]]
+        old = succeeds(OLD[r["site"]], r["text"], expect)
+        new = succeeds(lambda t: extract_json(t, expect), r["text"], expect)
+        totals["old"] += old
+        totals["new"] += new
+        print(f"{r['site']:<7} {r['case'][:34]:<34} {'ok' if old else 'FAIL':>4} {'ok' if new else 'FAIL':>4}")
+    n = len(rows)
+    print(f"\nfailure rate: old {100 * (1 - totals['old'] / n):.1f}%  new {100 * (1 - totals['new'] / n):.1f}%  ({n} replies)")
+
+    # speed on the same corpus
+    bare = [r for r in rows if r["case"] == "bare"]
+    noisy = [r for r in rows if r["case"] != "bare"]
+    for label, subset in (("bare JSON", bare), ("wrapped/noisy", noisy)):
+        new = sum(per_call_us(extract_json, r["text"], EXPECT[r["site"]], args.repeat) for r in subset) / len(subset)
+        ref = sum(per_call_us(lambda t, e: json.loads(t), r["text"], None, args.repeat) for r in subset) / len(subset)
+        print(f"{label:<14} extract_json {new:7.1f} µs/reply   (json.loads alone {ref:5.1f} µs)")
+
+    big = json.dumps({"criteria": [{"name": f"c{i}", "score_a": 3, "score_b": 4, "note": "x {y} \"z\""}
+                                   for i in range(200)]})
+    inc, rep = stream_us(big, 16, max(1, args.repeat // 100))
+    print(f"streaming {len(big) // 1024} KiB in 16-char chunks: incremental {inc / 1000:.2f} ms, "
+          f"re-parse per chunk {rep / 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
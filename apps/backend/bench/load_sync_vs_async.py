@@ -0,0 +1,110 @@
+# bench/load_sync_vs_async.py
+"""
+Concurrency scaling of /prompt-assist: legacy sync handler vs async handler.
+
+The Groq client is replaced by an in-process stand-in that sleeps for a
+fixed upstream latency, so the numbers only reflect how many requests the
+server can keep in flight — no quota is spent. The legacy handler (a plain
+``def`` making a blocking client call) lives here as the baseline; the app
+itself only has the async path.
+
+    python bench/load_sync_vs_async.py --latency 0.5 --levels 10 40 80 160
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ.setdefault("ORIGINS", "*")
+
+import httpx  # noqa: E402
+
+import llm  # noqa: E402
+import main  # noqa: E402
+
+UPSTREAM_LATENCY = 0.5
+
+
+def _completion(text: str = "rewritten prompt"):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class _SyncCompletions:
+    def create(self, **_):
+        time.sleep(UPSTREAM_LATENCY)
+        return _completion()
+
+
+class _AsyncCompletions:
+    async def create(self, **_):
+        await asyncio.sleep(UPSTREAM_LATENCY)
+        return _completion()
+
+
+async def _noop_close():
+    return None
+
+
+sync_client = SimpleNamespace(chat=SimpleNamespace(completions=_SyncCompletions()))
+llm._async_client = SimpleNamespace(
+    chat=SimpleNamespace(completions=_AsyncCompletions()),
+    close=_noop_close,
+)
+
+
+# legacy path: plain ``def`` handler running in the Starlette threadpool
+@main.app.post("/bench/prompt-assist-sync", response_model=main.AssistResponse)
+def _assist_sync(body: main.AssistRequest):
+    resp = sync_client.chat.completions.create(
+        model=main.MODEL, temperature=0.3, messages=main.build_messages(body.prompt, body))
+    return main.AssistResponse(prompt=resp.choices[0].message.content.strip())
+
+
+async def run_level(path: str, concurrency: int, total: int) -> dict:
+    transport = httpx.ASGITransport(app=main.app)
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        async def one():
+            async with sem:
+                t0 = time.perf_counter()
+                r = await http.post(path, json={"prompt": "write a haiku about the sea"})
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "rps": total / wall,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+async def main_async(args):
+    global UPSTREAM_LATENCY
+    UPSTREAM_LATENCY = args.latency
+    print(f"upstream latency {args.latency:.2f}s, {args.requests_per_worker} req per concurrent client\n")
+    print(f"{'conc':>5} | {'sync rps':>9} {'p95':>7} | {'async rps':>9} {'p95':>7}")
+    for level in args.levels:
+        total = level * args.requests_per_worker
+        s = await run_level("/bench/prompt-assist-sync", level, total)
+        a = await run_level("/prompt-assist", level, total)
+        print(f"{level:>5} | {s['rps']:>9.1f} {s['p95']:>7.2f} | {a['rps']:>9.1f} {a['p95']:>7.2f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--latency", type=float, default=0.5)
+    p.add_argument("--levels", type=int, nargs="+", default=[10, 40, 80, 160])
+    p.add_argument("--requests-per-worker", type=int, default=3)
+    asyncio.run(main_async(p.parse_args()))
@@ -0,0 +1,232 @@
+# bench/loadtest.py
+"""
+Offline load test: backend + local Groq stand-in, no quota spent.
+
+Starts ``bench/mock_groq.py`` and ``uvicorn main:app`` as subprocesses, then
+drives /prompt-assist, /compare and /templates at each concurrency level and
+reports p50/p95/p99 latency, throughput and error rate.
+
+    python bench/loadtest.py                         # run + compare with baseline
+    python bench/loadtest.py --save-baseline         # refresh bench/baseline.json
+    python bench/loadtest.py --levels 8 32 --error-500 0.05
+
+Every request carries a unique prompt so the response cache and single-flight
+layers don't flatter the numbers. Exit status is 1 when a scenario regresses
+past ``--tolerance`` against the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+BASELINE = os.path.join(HERE, "baseline.json")
+
+SCENARIOS = {
+    "prompt-assist": lambda: ("/prompt-assist", {
+        "prompt": f"Summarise this report for executives ({uuid.uuid4().hex})",
+        "mode": "rewrite",
+    }),
+    # few-shot examples come from the retrieval index once a similar prompt has been seen
+    "prompt-assist-synth": lambda: ("/prompt-assist", {
+        "prompt": f"Draft a product launch email for our new {uuid.uuid4().hex[:6]} line",
+        "mode": "rewrite",
+        "synth_examples": True,
+    }),
+    "compare": lambda: ("/compare", {
+        "original_prompt":  f"write about dogs {uuid.uuid4().hex}",
+        "rewritten_prompt": f"Write a 200-word explainer on dog breeds {uuid.uuid4().hex}",
+    }),
+    "templates": lambda: ("/templates", {"industry": f"Retail-{uuid.uuid4().hex[:6]}", "count": 3}),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_servers(args, extra_env: dict | None = None) -> tuple[list[subprocess.Popen], str, str]:
+    """Start the mock upstream and the API; returns (processes, api url, mock url)."""
+    mock_port, api_port = free_port(), free_port()
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "mock_groq.py"), "--port", str(mock_port),
+        "--latency", args.latency, "--error-500", str(args.error_500),
+        "--error-429", str(args.error_429),
+    ])
+    wait_ready(f"http://127.0.0.1:{mock_port}/stats")
+
+    env = {
+        **os.environ,
+        "GROQ_API_KEY":  "mock",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{mock_port}",
+        "ORIGINS":       "*",
+        # let the harness, not the limiter, decide the offered load
+        "GROQ_RPM":      "1000000",
+        "GROQ_TPM":      "1000000000",
+        # every /templates request uses a fresh industry, i.e. the cold-miss path;
+        # keep the catalog in memory and the background refresher off
+        "TEMPLATE_DB_PATH":         "",
+        "TEMPLATE_REFRESH_SECONDS": "0",
+        "FEWSHOT_INDEX_PATH":       "",
+        "JOBS_DB_PATH":             "",
+        # workers share cache and rate limits through a fresh store per run
+        "WEB_CONCURRENCY": str(args.workers),
+        "SHARED_STORE": "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "shared.sqlite3")
+                        if args.workers > 1 else "",
+        **(extra_env or {}),
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port),
+         "--workers", str(args.workers), "--log-level", "warning",
+         "--timeout-graceful-shutdown", "5"],
+        cwd=BACKEND, env=env,
+    )
+    base = f"http://127.0.0.1:{api_port}"
+    wait_ready(f"{base}/metrics")
+    return [api, mock], base, f"http://127.0.0.1:{mock_port}"
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_scenario(base: str, name: str, concurrency: int, total: int) -> dict:
+    make = SCENARIOS[name]
+    latencies: list[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, timeout=120.0, limits=limits) as http:
+        async def one():
+            nonlocal errors
+            path, body = make()
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await http.post(path, json=body)
+                    ok = r.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests":    total,
+        "throughput":  round(len(latencies) / wall, 2),
+        "error_rate":  round(errors / total, 4),
+        "p50":         round(percentile(latencies, 0.50), 4),
+        "p95":         round(percentile(latencies, 0.95), 4),
+        "p99":         round(percentile(latencies, 0.99), 4),
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for key, cur in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        if cur["p95"] > old["p95"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {old['p95']:.3f}s → {cur['p95']:.3f}s")
+        if cur["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {old['throughput']} → {cur['throughput']} req/s")
+        if cur["error_rate"] > old["error_rate"] + 0.01:
+            regressions.append(f"{key}: error rate {old['error_rate']} → {cur['error_rate']}")
+    return regressions
+
+
+async def main_async(args) -> int:
+    procs, base, _ = start_servers(args)
+    results: dict[str, dict] = {}
+    try:
+        print(f"{'scenario':<16} {'conc':>5} {'req/s':>8} {'err%':>6} {'p50':>7} {'p95':>7} {'p99':>7}")
+        for name in args.scenarios:
+            for level in args.levels:
+                total = max(level, int(level * args.requests_per_client))
+                r = await run_scenario(base, name, level, total)
+                results[f"{name}@{level}"] = r
+                print(f"{name:<16} {level:>5} {r['throughput']:>8.1f} {100 * r['error_rate']:>5.1f}% "
+                      f"{r['p50']:>7.3f} {r['p95']:>7.3f} {r['p99']:>7.3f}")
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+
+    payload = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("save_baseline", "baseline")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(payload, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(payload, f, indent=2)
+        print(f"\nbaseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        recorded = baseline.get("config", {})
+        if any(recorded.get(k) != getattr(args, k) for k in ("latency", "error_500", "error_429", "workers")):
+            print("\nbaseline was recorded with a different upstream/worker profile; skipping comparison")
+            return 0
+        regressions = compare_with_baseline(results, baseline["results"], args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS vs baseline:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("\nno regressions vs baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    p.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32])
+    p.add_argument("--requests-per-client", type=float, default=4)
+    p.add_argument("--latency", default="lognormal:0.2:0.4", help="mock upstream latency spec")
+    p.add_argument("--error-500", type=float, default=0.0)
+    p.add_argument("--error-429", type=float, default=0.0)
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    p.add_argument("--baseline", default=BASELINE)
+    p.add_argument("--save-baseline", action="store_true")
+    p.add_argument("-o", "--output", help="also write this run's results here")
+    sys.exit(asyncio.run(main_async(p.parse_args())))
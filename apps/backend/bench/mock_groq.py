@@ -0,0 +1,147 @@
+# bench/mock_groq.py
+"""
+Local stand-in for Groq's OpenAI-compatible chat-completions API.
+
+Point the backend at it with ``GROQ_BASE_URL=http://127.0.0.1:8088`` (the
+groq SDK and agno both honour that variable) and no quota is spent.
+
+    python bench/mock_groq.py --port 8088 --latency lognormal:0.4:0.5 \\
+        --error-500 0.02 --error-429 0.01
+
+Latency specs: ``fixed:S``, ``uniform:LO:HI``, ``lognormal:MEDIAN:SIGMA``.
+Streaming (``stream=true``) emits SSE chunks spread over the sampled latency.
+Responses are shaped by the prompt so /compare grading and the template
+pipeline get parseable JSON back.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LOREM = (
+    "### Task\nRewrite the request so an assistant can act on it directly.\n"
+    "### Steps\n1. Identify the goal.\n2. List required inputs.\n3. State the output format.\n"
+    "### Constraints\n- Keep the original intent.\n- Be specific and concise."
+)
+
+
+def parse_latency(spec: str):
+    kind, *params = spec.split(":")
+    p = [float(x) for x in params]
+    if kind == "fixed":
+        return lambda: p[0]
+    if kind == "uniform":
+        return lambda: random.uniform(p[0], p[1])
+    if kind == "lognormal":
+        median, sigma = p
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"unknown latency spec {spec!r}")
+
+
+def reply_for(messages: list[dict]) -> str:
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = messages[-1]["content"] if messages else ""
+    if "unbiased evaluator" in system and '"scores"' in system:
+        return json.dumps({"scores": [
+            {"id": i, **{n: random.randint(2, 5) for n in ("relevance", "completeness", "style", "conciseness")}}
+            for i in re.findall(r"^Answer (\w+):", user, flags=re.M)
+        ]})
+    if "unbiased evaluator" in system:
+        return json.dumps({"criteria": [
+            {"name": n, "score_a": random.randint(2, 5), "score_b": random.randint(2, 5)}
+            for n in ("relevance", "completeness", "style", "conciseness")
+        ]})
+    if "JSON array of strings" in user:
+        m = re.search(r"List (\d+) distinct", user)
+        n = int(m.group(1)) if m else 3
+        return json.dumps([f"Topic {i + 1}" for i in range(n)])
+    if "meta_prompt" in user:
+        m = re.search(r'"topic": "([^"]*)"', user)
+        return json.dumps({"topic": m.group(1) if m else "Topic", "meta_prompt": "System: " + LOREM})
+    return LOREM
+
+
+def make_app(latency, error_500: float, error_429: float, retry_after: float) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        delay = latency()
+
+        roll = random.random()
+        if roll < error_500:
+            await asyncio.sleep(delay / 4)
+            return JSONResponse({"error": {"message": "injected 500", "type": "internal_server_error"}},
+                                status_code=500)
+        if roll < error_500 + error_429:
+            return JSONResponse({"error": {"message": "injected 429", "type": "rate_limit_exceeded"}},
+                                status_code=429, headers={"retry-after": str(retry_after)})
+
+        text = reply_for(body.get("messages", []))
+        cid, created, model = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()), body.get("model", "mock")
+        usage = {
+            "prompt_tokens":     sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4,
+            "completion_tokens": len(text) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {
+                "id": cid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            }
+
+        words = re.findall(r"\S+\s*", text)
+
+        async def chunks():
+            # first token after ~30% of the latency, the rest spread evenly
+            await asyncio.sleep(delay * 0.3)
+            step = delay * 0.7 / max(1, len(words))
+            for w in words:
+                yield "data: " + json.dumps({
+                    "id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": w}, "finish_reason": None}],
+                }) + "\n\n"
+                await asyncio.sleep(step)
+            yield "data: " + json.dumps({
+                "id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"usage": usage},
+            }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": app.state.calls}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8088)
+    p.add_argument("--latency", default="lognormal:0.4:0.5")
+    p.add_argument("--error-500", type=float, default=0.0)
+    p.add_argument("--error-429", type=float, default=0.0)
+    p.add_argument("--retry-after", type=float, default=1.0)
+    a = p.parse_args()
+    uvicorn.run(make_app(parse_latency(a.latency), a.error_500, a.error_429, a.retry_after),
+                host=a.host, port=a.port, log_level="warning")
@@ -0,0 +1,122 @@
+# bench/worker_scaling.py
+"""
+Throughput as the uvicorn worker count grows, and proof that workers share
+one upstream budget.
+
+    python bench/worker_scaling.py                        # 1, 2, 4 workers
+    python bench/worker_scaling.py --workers 1 2 4 8 --concurrency 64
+    python bench/worker_scaling.py --save                 # write bench/worker_scaling.json
+
+Phase 1 drives each scenario at ``--concurrency`` against 1..N workers
+(multi-worker runs share a fresh SQLite store, see shared.py). Phase 2 starts
+each configuration with ``GROQ_RPM=--budget-rpm`` and fires twice that many
+requests at once: with a shared bucket the mock upstream sees about
+``budget-rpm`` calls in the window whatever the worker count, where
+per-process buckets would let through ``workers × budget-rpm``.
+
+Scaling needs cores: on an N-core box expect gains up to ~N workers (the mock
+upstream and this client share the same cores).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import types
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadtest  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = os.path.join(HERE, "worker_scaling.json")
+
+
+def server_args(args, workers: int):
+    return types.SimpleNamespace(latency=args.latency, error_500=0.0, error_429=0.0, workers=workers)
+
+
+async def throughput(args, workers: int) -> dict:
+    procs, base, _ = loadtest.start_servers(server_args(args, workers))
+    try:
+        results = {}
+        for name in args.scenarios:
+            # warm every worker's pools and lazy imports first
+            await loadtest.run_scenario(base, name, args.concurrency, args.concurrency)
+            results[name] = await loadtest.run_scenario(
+                base, name, args.concurrency, int(args.concurrency * args.requests_per_client))
+        return results
+    finally:
+        stop(procs)
+
+
+async def budget(args, workers: int, shared: bool = True) -> dict:
+    env = {"GROQ_RPM": str(args.budget_rpm), **({} if shared else {"SHARED_STORE": "off"})}
+    procs, base, mock = loadtest.start_servers(server_args(args, workers), extra_env=env)
+    try:
+        before = httpx.get(f"{mock}/stats").json()["calls"]
+        total = 2 * args.budget_rpm
+        limits = httpx.Limits(max_connections=total, max_keepalive_connections=total)
+        async with httpx.AsyncClient(base_url=base, timeout=120.0, limits=limits) as http:
+            def post():
+                path, body = loadtest.SCENARIOS["prompt-assist"]()
+                return asyncio.create_task(http.post(path, json=body))
+
+            tasks = [post() for _ in range(total)]
+            await asyncio.sleep(args.window)
+            calls = httpx.get(f"{mock}/stats").json()["calls"] - before
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        allowed = args.budget_rpm + args.budget_rpm / 60 * args.window
+        return {"upstream_calls": calls, "allowed": round(allowed, 1), "window_s": args.window}
+    finally:
+        stop(procs)
+
+
+def stop(procs) -> None:
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        p.wait(timeout=10)
+
+
+async def main_async(args) -> dict:
+    report = {"cpu_count": os.cpu_count(), "concurrency": args.concurrency, "latency": args.latency,
+              "throughput": {}, "budget": {}}
+    print(f"{'workers':>7} {'scenario':<16} {'req/s':>8} {'p95':>7} {'err%':>6}")
+    for w in args.workers:
+        report["throughput"][w] = await throughput(args, w)
+        for name, r in report["throughput"][w].items():
+            print(f"{w:>7} {name:<16} {r['throughput']:>8.1f} {r['p95']:>7.3f} {100 * r['error_rate']:>5.1f}%")
+
+    if args.budget_rpm:
+        print(f"\nshared budget: GROQ_RPM={args.budget_rpm}, {2 * args.budget_rpm} requests at once")
+        print(f"{'workers':>7} {'store':<12} {'upstream calls':>15} {'allowed':>8}")
+        for w in args.workers:
+            for shared in (True, False) if w > 1 else (True,):
+                r = await budget(args, w, shared)
+                report["budget"][f"{w}{'' if shared else '-per-process'}"] = r
+                print(f"{w:>7} {'shared' if shared else 'per-process':<12} "
+                      f"{r['upstream_calls']:>15} {r['allowed']:>8}")
+    return report
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--scenarios", nargs="+", default=["prompt-assist", "compare"], choices=list(loadtest.SCENARIOS))
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--requests-per-client", type=float, default=4)
+    p.add_argument("--latency", default="lognormal:0.2:0.4", help="mock upstream latency spec")
+    p.add_argument("--budget-rpm", type=int, default=60, help="0 skips the shared-budget check")
+    p.add_argument("--window", type=float, default=3.0)
+    p.add_argument("--save", action="store_true")
+    args = p.parse_args()
+    report = asyncio.run(main_async(args))
+    if args.save:
+        with open(OUTPUT, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwritten to {OUTPUT}")
@@ -0,0 +1,181 @@
+# cache.py
+"""
+Content-addressed response cache for /prompt-assist.
+
+Keys are a sha256 over (model, temperature, messages), so two requests that
+render to the same upstream call share one entry. Entries live in a
+size-bounded in-memory LRU and, when ``CACHE_DB_PATH`` is set, in a SQLite
+file that survives restarts. Both tiers honour the same TTL. With several
+workers the second tier comes from the shared store instead (see shared.py),
+so an entry written by one worker is a hit in all of them.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(model: str, temperature: float, messages: list[dict], variant: str = "") -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "messages": messages, "variant": variant},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """In-memory tier: ``OrderedDict`` with TTL checked on read."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires: float | None = None) -> None:
+        with self._lock:
+            self._data[key] = (expires or time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Optional persistent tier; expired rows are purged lazily."""
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[str, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            return row[0], row[1]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl),
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM response_cache WHERE expires < ?", (time.time(),))
+            return cur.rowcount
+
+
+class RedisCache:
+    """Second tier on Redis; expiry is Redis's own key TTL."""
+
+    def __init__(self, client, ttl: float, prefix: str = "cache:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = client
+
+    def get(self, key: str) -> tuple[str, float] | None:
+        value, pttl = self._client.pipeline().get(self.prefix + key).pttl(self.prefix + key).execute()
+        if value is None:
+            return None
+        return value, time.time() + max(pttl, 0) / 1000
+
+    def set(self, key: str, value: str) -> None:
+        self._client.set(self.prefix + key, value, ex=max(1, int(self.ttl)))
+
+    def purge_expired(self) -> int:
+        return 0
+
+
+class ResponseCache:
+    """
+    Two-tier cache front. ``get`` checks memory first, then disk (promoting
+    disk hits into memory); ``set`` writes through to both. The second tier
+    (SQLite or the shared store) is reached through ``asyncio.to_thread`` so
+    its I/O never blocks the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, db_path: str | None = None,
+                 shared=None):
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = shared or (SQLiteCache(db_path, ttl) if db_path else None)
+        self.shared = shared is not None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.disk is not None:
+            row = await asyncio.to_thread(self.disk.get, key)
+            if row is not None:
+                value, expires = row
+                self.memory.set(key, value, expires)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits":        self.hits,
+            "disk_hits":   self.disk_hits,
+            "misses":      self.misses,
+            "hit_ratio":   self.hits / lookups if lookups else 0.0,
+            "entries":     len(self.memory),
+            "persistent":  self.disk is not None,
+            "shared":      self.shared,
+        }
+
+
+def from_env(store=None) -> ResponseCache:
+    """``store`` is a shared.py store; its tier replaces ``CACHE_DB_PATH`` when given."""
+    ttl = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+    return ResponseCache(
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+        ttl=ttl,
+        db_path=os.getenv("CACHE_DB_PATH") or None,
+        shared=store.cache_tier(ttl) if store is not None else None,
+    )
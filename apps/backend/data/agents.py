@@ -1,29 +1,22 @@
 # data/agents.py
 from agno import Agent, World
-from groq import Groq
-from sqlalchemy import create_engine, Table, Column, String, MetaData, DateTime
-from sqlalchemy.dialects.postgresql import insert
-from datetime import datetime
-import json
-import os
-# — your Groq client for LLM calls —
-llm = Groq()
+from jsonextract import extract_json
+import functools
+import logging
 
-# — your SQLAlchemy setup for Postgres/Prisma-compatible tables —
-DATABASE_URL = os.environ["DATABASE_URL"]
-engine = create_engine(DATABASE_URL, echo=True)    
-meta   = MetaData()
-templates = Table(
-    "Template", meta,
-    Column("id",          String, primary_key=True),
-    Column("industry",    String, nullable=False),
-    Column("name",        String, nullable=False),
-    Column("description", String, nullable=False),
-    Column("prompt",      String, nullable=False),
-    Column("createdAt",   DateTime, default=datetime.utcnow)
-)
-meta.create_all(engine)
+from data.template_db import bulk_upsert, get_engine
 
+logger = logging.getLogger(__name__)
+
+# Nothing here connects at import: the Groq client and the engine (see
+# data/template_db.py) are created on first use, so importing this module
+# never needs the network or a live database.
+
+@functools.cache
+def get_llm():
+    """Groq client for LLM calls."""
+    from groq import Groq
+    return Groq()
 
 
 class IndustryLister(Agent[None, list[str]]):
@@ -51,29 +44,18 @@ Return strict JSON array; each item must have:
 - description (one sentence)
 - prompt (with {{placeholder}} syntax)
 """
-        resp = llm.chat.completions.create(
+        resp = get_llm().chat.completions.create(
             model="gpt-4o",
             temperature=0.7,
             messages=[{"role": "user", "content": prompt}]
         )
-        return json.loads(resp.choices[0].message.content)
+        return extract_json(resp.choices[0].message.content, list)
 
 
 class DBWriter(Agent[list[dict], None]):
     """
-    Persists each template into Postgres via SQLAlchemy.
+    Persists templates into Postgres via SQLAlchemy, in multi-row chunks.
     Upserts on id so it’s safe to re-run.
     """
     def run(self, items: list[dict]) -> None:
-        with engine.begin() as conn:
-            for t in items:
-                stmt = insert(templates).values(
-                    id          = t["id"],
-                    industry    = t["industry"],
-                    name        = t["name"],
-                    description = t["description"],
-                    prompt      = t["prompt"],
-                    createdAt   = datetime.utcnow()
-                ).on_conflict_do_nothing()
-                conn.execute(stmt)
-
+        self.last_stats = bulk_upsert(get_engine(), items)
@@ -1,78 +1,108 @@
+import asyncio
+import functools
 import json
+import logging
+import os
+from typing import Callable
 from agno.agent       import Agent, RunResponse
 from agno.models.groq import Groq
 from dotenv import load_dotenv
+
+from jsonextract import extract_json
+from llm import get_async_client
+from metrics import stage
+from scheduler import estimate_tokens, scheduler
 # import requests
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+# agno re-enables telemetry unless the env var is also off (see Agent.set_monitoring)
+os.environ.setdefault("AGNO_TELEMETRY", "false")
 
 # ─── 1) Spin up your three agents ───
-topic_agent = Agent(
-    name     = "TopicGenerator",
-    model    = Groq(id="llama-3.3-70b-versatile"),
-    markdown = False,
-)
-meta_agent = Agent(
-    name     = "MetaPromptCreator",
-    model    = Groq(id="llama-3.3-70b-versatile"),
-    markdown = False,
-)
-final_agent = Agent(
-    name     = "PromptProducer",
-    model    = Groq(id="llama-3.3-70b-versatile"),
-    markdown = False,
-)
+def new_agent(name: str, async_client=None) -> Agent:
+    """
+    agno Agents keep per-run state (memory, run_response) on the instance, so
+    concurrent async runs each get their own; construction is microseconds.
+    Pass the shared ``AsyncGroq`` client, otherwise agno builds a fresh httpx
+    client (and TLS context) on every call. Telemetry is off for the same
+    reason: it posts every run to agno's API from a new client.
+    """
+    return Agent(
+        name      = name,
+        model     = Groq(id="llama-3.3-70b-versatile", async_client=async_client),
+        markdown  = False,
+        telemetry = False,
+    )
+
+
+@functools.cache
+def shared_agent(name: str) -> Agent:
+    """Long-lived agents for the sync CLI helpers, built on first use."""
+    return new_agent(name)
 
 
 # ─── 2) Stage #1: Get topics ───
-def gen_topics(industry: str, count: int = 2) -> list[str]:
-    prompt = (
+def topics_prompt(industry: str, count: int) -> str:
+    return (
         f"You are an expert in prompt engineering.  List {count} distinct topic areas "
         f"for creating prompt templates in the **{industry}** industry.  "
         "Return ONLY a JSON array of strings."
     )
-    resp: RunResponse = topic_agent.run(prompt)
-    return json.loads(resp.content)
+
+
+def gen_topics(industry: str, count: int = 2) -> list[str]:
+    resp: RunResponse = shared_agent("TopicGenerator").run(topics_prompt(industry, count))
+    return extract_json(resp.content, list)
 
 
 # ─── 3) Stage #2: Build meta-prompts ───
+def meta_prompt(industry: str, topic: str) -> str:
+    return (
+        f"You are a senior prompt engineer. Return a JSON object in this EXACT format:\n"
+        "{\n"
+        f'  \"topic\": \"{topic}\",\n'
+        '  \"meta_prompt\": \"Your detailed LLM prompt here\"\n'
+        "}\n\n"
+        "Given the topic and **{industry}** above, generate a single user-facing prompt that can be sent straight into an LLM. "
+        "Your `meta_prompt` must:\n"
+        "• Begin with a clear role declaration (e.g., “System:” or a system message block).\n"
+        "• Specify the task in plain terms.\n"
+        "• Be structured into sections as needed (Task / Context / References / Evaluate / Iterate).\n"
+        "• Follow standard LLM prompting conventions (short sentences, explicit instructions).\n"
+        "Return ONLY the JSON object—no extra text, no markdown fences."
+    )
+
+
+def parse_meta(topic: str, content: str) -> dict:
+    logger.debug("raw meta response for topic %r:\n%s", topic, content)
+    try:
+        response = extract_json(content, dict)
+        if not isinstance(response, dict) or "topic" not in response or "meta_prompt" not in response:
+            raise ValueError("Response missing required fields")
+        return response
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.debug("unusable meta response for topic %r: %s", topic, e)
+        raise
+
+
 def make_meta(industry: str, topics: list[str]) -> list[dict]:
     metas = []
     for topic in topics:
-        p = (
-            f"You are a senior prompt engineer. Return a JSON object in this EXACT format:\n"
-            "{\n"
-            f'  \"topic\": \"{topic}\",\n'
-            '  \"meta_prompt\": \"Your detailed LLM prompt here\"\n'
-            "}\n\n"
-            "Given the topic and **{industry}** above, generate a single user-facing prompt that can be sent straight into an LLM. "
-            "Your `meta_prompt` must:\n"
-            "• Begin with a clear role declaration (e.g., “System:” or a system message block).\n"
-            "• Specify the task in plain terms.\n"
-            "• Be structured into sections as needed (Task / Context / References / Evaluate / Iterate).\n"
-            "• Follow standard LLM prompting conventions (short sentences, explicit instructions).\n"
-            "Return ONLY the JSON object—no extra text, no markdown fences."
-        )
-        raw = meta_agent.run(p)
-        print(f"\nDebug - Raw response for topic '{topic}':")
-        print(raw.content)
-        try:
-            response = json.loads(raw.content)
-            if not isinstance(response, dict) or "topic" not in response or "meta_prompt" not in response:
-                raise ValueError("Response missing required fields")
-            metas.append(response)
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"Error processing topic '{topic}':")
-            print("Error:", str(e))
-            raise
+        raw = shared_agent("MetaPromptCreator").run(meta_prompt(industry, topic))
+        metas.append(parse_meta(topic, raw.content))
     return metas
 
 
 # ─── 4) Stage #3: Generate final user prompts ───
+def final_prompt(meta: dict) -> str:
+    return meta["meta_prompt"]+"Use the meta prompt provided to generate a user prompt. Return the user prompt only, no other text."
+
+
 def generate_final(metas: list[dict]) -> list[dict]:
     finals = []
     for m in metas:
-        resp: RunResponse = final_agent.run(m["meta_prompt"]+"Use the meta prompt provided to generate a user prompt. Return the user prompt only, no other text.")
+        resp: RunResponse = shared_agent("PromptProducer").run(final_prompt(m))
         finals.append({
             "topic":       m["topic"],
             "user_prompt": resp.content.strip()
@@ -80,15 +110,121 @@ def generate_final(metas: list[dict]) -> list[dict]:
     return finals
 
 
-def generate_templates_for_industry(industry: str, count: int = 2) -> list[dict]:
+# ─── Async variants (used by the FastAPI handlers) ───
+def _est_tokens(prompt: str) -> int:
+    """Token-bucket charge for one agent run, estimated the same way as ``llm.py``."""
+    return estimate_tokens([{"role": "user", "content": prompt}])
+
+
+async def gen_topics_async(industry: str, count: int = 2) -> list[str]:
+    with stage("pipeline_topics"):
+        prompt = topics_prompt(industry, count)
+        resp: RunResponse = await scheduler.call(lambda: new_agent("TopicGenerator", get_async_client()).arun(prompt),
+                                                 est_tokens=_est_tokens(prompt))
+    return extract_json(resp.content, list)
+
+
+# ─── Pipelined executor: each topic runs meta → final on its own ───
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "4"))
+PIPELINE_RETRIES     = int(os.getenv("PIPELINE_RETRIES", "2"))   # re-asks for unparseable replies
+
+
+async def _with_retries(fn, retries: int):
+    """
+    Re-run a stage whose reply didn't parse. Upstream errors are not retried
+    here: ``scheduler.call`` has already retried them, and an open breaker
+    (UpstreamUnavailable) should fail the topic fast rather than be re-polled.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await fn()
+        except ValueError:          # includes JSONDecodeError
+            if attempt == retries:
+                raise
+
+
+async def run_topic(industry: str, topic: str, sem: asyncio.Semaphore, retries: int) -> dict:
+    """
+    Push one topic through meta → final. The semaphore bounds in-flight agent
+    calls, not topics, so a topic waiting on its final stage never blocks
+    another topic's meta stage from starting.
+    """
+    async def meta_stage():
+        prompt = meta_prompt(industry, topic)
+        async with sem:
+            with stage("pipeline_meta"):
+                raw = await scheduler.call(lambda: new_agent("MetaPromptCreator", get_async_client()).arun(prompt),
+                                           est_tokens=_est_tokens(prompt))
+        return parse_meta(topic, raw.content)
+
+    async def final_stage(m: dict):
+        prompt = final_prompt(m)
+        async with sem:
+            with stage("pipeline_final"):
+                resp: RunResponse = await scheduler.call(lambda: new_agent("PromptProducer", get_async_client()).arun(prompt),
+                                                         est_tokens=_est_tokens(prompt))
+        return {"topic": m["topic"], "user_prompt": resp.content.strip()}
+
+    m = await _with_retries(meta_stage, retries)
+    return await final_stage(m)     # free text: nothing to re-ask for
+
+
+async def run_topics_pipelined(
+    industry: str,
+    topics: list[str],
+    concurrency: int = PIPELINE_CONCURRENCY,
+    retries: int = PIPELINE_RETRIES,
+    progress: Callable[[str, dict], None] | None = None,
+) -> tuple[list[dict], list[dict]]:
+    """
+    Returns ``(finals, failures)``. Finals keep topic order; each failure is
+    ``{topic, error}`` so one bad topic never sinks the batch. ``progress``,
+    if given, is called with ``("topic_done", template)`` or
+    ``("topic_failed", {topic, error})`` as each topic finishes.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def tracked(topic: str) -> dict:
+        try:
+            final = await run_topic(industry, topic, sem, retries)
+        except Exception as e:
+            progress("topic_failed", {"topic": topic, "error": str(e)})
+            raise
+        progress("topic_done", final)
+        return final
+
+    results = await asyncio.gather(
+        *((tracked(t) if progress else run_topic(industry, t, sem, retries)) for t in topics),
+        return_exceptions=True,
+    )
+    finals, failures = [], []
+    for topic, r in zip(topics, results):
+        if isinstance(r, BaseException):
+            logger.warning("topic %r failed: %s", topic, r)
+            failures.append({"topic": topic, "error": str(r)})
+        else:
+            finals.append(r)
+    return finals, failures
+
+
+async def generate_templates_for_industry_async(
+    industry: str,
+    count: int = 2,
+    concurrency: int = PIPELINE_CONCURRENCY,
+    progress: Callable[[str, dict], None] | None = None,
+) -> list[dict]:
     """
-    Single entrypoint: given an industry name, returns a list of
-    { topic:…, user_prompt:… } dicts.
+    Async entrypoint used by the FastAPI handlers. Returns whatever topics
+    succeeded; raises only if every topic failed. ``progress`` gets
+    ``("topics", {topics})`` once they are chosen, then one event per topic
+    (see ``run_topics_pipelined``).
     """
-    topics = gen_topics(industry, count)
-    metas  = make_meta(industry, topics)
-    finals = generate_final(metas)
-    # Optionally attach timestamps or IDs here
+    topics = await _with_retries(lambda: gen_topics_async(industry, count), PIPELINE_RETRIES)
+    if progress:
+        progress("topics", {"topics": topics})
+    finals, failures = await run_topics_pipelined(industry, topics, concurrency, progress=progress)
+    if topics and not finals:
+        raise RuntimeError(f"All {len(topics)} topics failed: {failures[0]['error']}")
     return finals
 
 
@@ -0,0 +1,118 @@
+# data/template_db.py
+"""
+Template table, pooled engine and bulk upsert for ``agents.DBWriter``.
+
+Kept apart from the agents so the write path imports (and can be tested and
+benchmarked) with SQLAlchemy alone. Nothing connects at import: the engine
+and schema are created on first use.
+
+    DATABASE_URL=postgresql+psycopg://…      # or sqlite:///templates.db as a stand-in
+    DB_WRITE_CHUNK=1000                      # rows per executemany / multi-row VALUES page
+    DB_POOL_SIZE=5
+    DB_MAX_OVERFLOW=10
+    DB_ECHO=1                                # log SQL (every row)
+
+``bench/db_upsert.py`` compares ``bulk_upsert`` with the old per-row loop.
+"""
+import functools
+import logging
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DB_WRITE_CHUNK = int(os.getenv("DB_WRITE_CHUNK", "1000"))
+
+
+def make_engine(url: str) -> Engine:
+    """
+    Pooled engine; SQL echo only when ``DB_ECHO=1`` (it logs every row).
+    SQLite stand-ins keep SQLAlchemy's default pool for their driver.
+    """
+    kwargs = {"echo": os.getenv("DB_ECHO") == "1"}
+    if not url.startswith("sqlite"):
+        kwargs.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_pre_ping=True,     # survive server-side idle disconnects
+            pool_recycle=1800,
+            # rows per multi-row INSERT ... VALUES page on executemany
+            insertmanyvalues_page_size=DB_WRITE_CHUNK,
+        )
+    return create_engine(url, **kwargs)
+
+
+meta   = MetaData()
+templates = Table(
+    "Template", meta,
+    Column("id",          String, primary_key=True),
+    Column("industry",    String, nullable=False),
+    Column("name",        String, nullable=False),
+    Column("description", String, nullable=False),
+    Column("prompt",      String, nullable=False),
+    Column("createdAt",   DateTime, default=datetime.utcnow)
+)
+
+
+@functools.cache
+def get_engine() -> Engine:
+    """Engine for ``DATABASE_URL``, with the table created on first use."""
+    engine = make_engine(os.environ["DATABASE_URL"])
+    meta.create_all(engine)
+    return engine
+
+
+def _insert_for(dialect: str):
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise ValueError(f"bulk upsert needs Postgres or SQLite, not {dialect!r}")
+
+
+def bulk_upsert(target: Engine, items: list[dict], chunk_size: int = DB_WRITE_CHUNK) -> dict:
+    """
+    Write ``items`` in one transaction, ``chunk_size`` rows per executemany of
+    a single cached ``INSERT ... ON CONFLICT (id) DO NOTHING``. On Postgres,
+    SQLAlchemy renders each page as one multi-row VALUES statement, so a
+    chunk costs one round-trip instead of one per template.
+    """
+    stmt = _insert_for(target.dialect.name)(templates).on_conflict_do_nothing(index_elements=["id"])
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id":          t["id"],
+            "industry":    t["industry"],
+            "name":        t["name"],
+            "description": t["description"],
+            "prompt":      t["prompt"],
+            "createdAt":   now,
+        }
+        for t in items
+    ]
+
+    written = 0
+    t0 = time.perf_counter()
+    with target.begin() as conn:
+        for start in range(0, len(rows), chunk_size):
+            result = conn.execute(stmt, rows[start:start + chunk_size])
+            # some drivers can't report rowcount for executemany (-1)
+            if result.rowcount < 0:
+                written = None
+            elif written is not None:
+                written += result.rowcount
+    seconds = time.perf_counter() - t0
+    stats = {
+        "rows":         len(rows),
+        "written":      written,
+        "chunks":       -(-len(rows) // chunk_size),
+        "seconds":      round(seconds, 4),
+        "rows_per_sec": round(len(rows) / max(seconds, 1e-9), 1),
+    }
+    logger.info("DBWriter: %s", stats)
+    return stats
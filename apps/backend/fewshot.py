@@ -0,0 +1,312 @@
+# fewshot.py
+"""
+Few-shot examples for ``synth_examples`` requests.
+
+``FewShotIndex`` is a MinHash/LSH index over input → output pairs we already
+have: /compare pairs whose rewrite clearly out-scored the original, and the
+template catalog. A lookup hashes the prompt once, collects entries sharing an
+LSH band and ranks them by estimated Jaccard similarity — a millisecond or so,
+no upstream call. Callers send the pairs as demonstration turns, never inside
+the user's prompt.
+
+Examples the model synthesized for a prompt (source ``generated``) are not
+similarity-matched: they are only served back for that same prompt.
+
+    FEWSHOT_INDEX_PATH=                       # snapshot file; unset/empty → memory only
+    FEWSHOT_MIN_SIMILARITY=0.3
+    FEWSHOT_K=1
+    FEWSHOT_MAX_ENTRIES=50000
+    FEWSHOT_SNAPSHOT_SECONDS=300
+    FEWSHOT_INLINE_CHARS=1000  # longer prompts/keys are hashed off the event loop
+
+Inserts are incremental; the index is written to disk periodically (and on
+shutdown) by ``run``, atomically, and reloaded by ``open``. Every worker
+snapshots the same file: under a lock, ``snapshot`` first folds in entries
+other workers wrote, so each worker's inserts survive and the workers'
+indexes converge between restarts.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+# sources whose example belongs to one prompt: looked up by exact key, not similarity
+EXACT_SOURCES = frozenset({"generated"})
+NUM_PERM = 64
+ROWS = 2                     # 32 bands × 2 rows: pairs from ~0.2 Jaccard up become candidates
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_WORD = re.compile(r"\w+")
+
+LOOKUPS = metrics.Counter("fewshot_lookups_total", "Few-shot example lookups", ("result",))
+
+
+def signature(text: str) -> tuple[int, ...] | None:
+    """MinHash over word unigrams and bigrams; None for text without words."""
+    words = _WORD.findall(text.casefold())
+    grams = {zlib.crc32(g.encode()) for g in [*words, *map(" ".join, zip(words, words[1:]))]}
+    if not grams:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in grams) for a, b in _PERMS)
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def _bands(sig: tuple[int, ...]):
+    for i in range(0, NUM_PERM, ROWS):
+        yield (i,) + sig[i:i + ROWS]
+
+
+def _exact_key(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _upgrade_v1(e: dict) -> dict:
+    # version 1 stored pairs as one "Input: …\nOutput: …" text
+    prefix = f"Input: {e['key']}\nOutput: "
+    if e["source"] not in EXACT_SOURCES and e["example"].startswith(prefix):
+        return {**e, "example": e["example"][len(prefix):]}
+    return e
+
+
+def with_examples(prompt: str, examples: list[str]) -> str:
+    header = "### Example" if len(examples) == 1 else "### Examples"
+    return f"{prompt}\n\n{header}\n" + "\n\n".join(examples)
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    """Exclusive ``flock`` on ``path`` so workers sharing a snapshot write it one at a time."""
+    import fcntl
+
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class FewShotIndex:
+    def __init__(self, path: str | None, min_similarity: float = 0.3, k: int = 1,
+                 max_entries: int = 50_000, inline_chars: int = 1000):
+        self.path = path
+        self.inline_chars = inline_chars
+        self.min_similarity = min_similarity
+        self.k = k
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # id → {key, example, source, score, sig}; insertion order for eviction
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._buckets: dict[tuple, set[str]] = {}
+        self._exact: dict[str, str] = {}        # normalized key → id, for EXACT_SOURCES
+        self._dirty = False
+        self._opened = False
+        self.hits = 0
+        self.misses = 0
+        self.snapshots = 0
+
+    # ─── Loading / snapshots ───
+    def open(self) -> None:
+        """Load the snapshot, if any; called from the lifespan, or on first use."""
+        if self._opened:
+            return
+        with self._lock:
+            if self._opened:
+                return
+            self._opened = True
+            if self._merge(self._read()):
+                logger.info("few-shot index: %d examples loaded from %s", len(self._entries), self.path)
+
+    def _read(self) -> dict:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _merge(self, data: dict) -> int:
+        """Insert the snapshot entries this index doesn't have yet; caller holds ``_lock``."""
+        rehash = data.get("num_perm") != NUM_PERM
+        upgrade = data.get("version", SNAPSHOT_VERSION) < 2
+        merged = 0
+        for e in data.get("entries", []):
+            if e["id"] in self._entries:
+                continue
+            if upgrade:
+                e = _upgrade_v1(e)
+            if e["source"] in EXACT_SOURCES:
+                sig = None
+            else:
+                sig = signature(e["key"]) if rehash or not e.get("sig") else tuple(e["sig"])
+                if sig is None:
+                    continue
+            self._insert(e["id"], {**e, "sig": sig})
+            merged += 1
+        return merged
+
+    def snapshot(self) -> bool:
+        """
+        Write the index to ``path`` if it changed since the last snapshot,
+        after merging in what other workers have written there.
+        """
+        if not self.path or not self._dirty:
+            return False
+        with _file_lock(f"{self.path}.lock"):
+            on_disk = self._read()
+            with self._lock:
+                self._dirty = False
+                self._merge(on_disk)
+                entries = [{"id": id_, **e, "sig": list(e["sig"]) if e["sig"] else None}
+                           for id_, e in self._entries.items()]
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                       prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"version": SNAPSHOT_VERSION, "num_perm": NUM_PERM, "saved_at": time.time(),
+                               "entries": entries}, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        self.snapshots += 1
+        return True
+
+    async def run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.snapshot)
+            except OSError as e:
+                logger.warning("few-shot snapshot failed: %s", e)
+
+    # ─── Inserts ───
+    def _insert(self, id_: str, entry: dict) -> None:
+        self._entries[id_] = entry
+        if entry["sig"] is None:
+            self._exact[_exact_key(entry["key"])] = id_
+        else:
+            for band in _bands(entry["sig"]):
+                self._buckets.setdefault(band, set()).add(id_)
+        while len(self._entries) > self.max_entries:
+            old_id, old = self._entries.popitem(last=False)
+            if old["sig"] is None:
+                if self._exact.get(_exact_key(old["key"])) == old_id:
+                    del self._exact[_exact_key(old["key"])]
+                continue
+            for band in _bands(old["sig"]):
+                bucket = self._buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del self._buckets[band]
+
+    def add(self, key: str, example: str, source: str, score: float = 0.0, id: str | None = None) -> bool:
+        """
+        Index the pair ``key`` (an input prompt) → ``example`` (its output),
+        or, for ``EXACT_SOURCES``, an example written for the prompt ``key``.
+        ``id`` defaults to a digest of both, so re-adding the same pair is a no-op.
+        """
+        self.open()
+        id_ = id or f"{source}:" + hashlib.sha1(f"{key}\0{example}".encode("utf-8")).hexdigest()[:16]
+        if id_ in self._entries:
+            return False
+        if source in EXACT_SOURCES:
+            sig = None
+        else:
+            sig = signature(key)
+            if sig is None:
+                return False
+        with self._lock:
+            self._insert(id_, {"key": key, "example": example, "source": source, "score": score, "sig": sig})
+            self._dirty = True
+        return True
+
+    async def add_async(self, key: str, example: str, source: str, score: float = 0.0,
+                        id: str | None = None) -> bool:
+        """``add``, in a worker thread when ``key`` is long enough for hashing to stall the loop."""
+        if source in EXACT_SOURCES or len(key) <= self.inline_chars:
+            return self.add(key, example, source, score, id)
+        return await asyncio.to_thread(self.add, key, example, source, score, id)
+
+    # ─── Lookups ───
+    def nearest(self, text: str, k: int | None = None,
+                min_similarity: float | None = None) -> list[tuple[float, dict]]:
+        """Up to ``k`` ``(similarity, entry)`` pairs, most similar (then best scored) first."""
+        self.open()
+        sig = signature(text)
+        if sig is None:
+            return []
+        floor = self.min_similarity if min_similarity is None else min_similarity
+        with self._lock:
+            ids = set().union(*(self._buckets.get(band, ()) for band in _bands(sig)))
+            scored = [(similarity(sig, self._entries[i]["sig"]), self._entries[i]) for i in ids]
+        scored = [(s, e) for s, e in scored if s >= floor]
+        scored.sort(key=lambda se: (se[0], se[1]["score"]), reverse=True)
+        return scored[:k or self.k]
+
+    async def lookup_async(self, prompt: str) -> list[tuple[str, str]]:
+        """``lookup``, in a worker thread when ``prompt`` is long enough for hashing to stall the loop."""
+        if len(prompt) <= self.inline_chars:
+            return self.lookup(prompt)
+        return await asyncio.to_thread(self.lookup, prompt)
+
+    def lookup(self, prompt: str) -> list[tuple[str, str]]:
+        """``(input, output)`` pairs similar to ``prompt``; empty when nothing is similar enough."""
+        found = [(e["key"], e["example"]) for _, e in self.nearest(prompt)]
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        LOOKUPS.inc(result="hit" if found else "miss")
+        return found
+
+    def generated_for(self, prompt: str) -> str | None:
+        """The example synthesized earlier for exactly this prompt, if any."""
+        self.open()
+        with self._lock:
+            id_ = self._exact.get(_exact_key(prompt))
+            return self._entries[id_]["example"] if id_ is not None else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        by_source: dict[str, int] = {}
+        for e in list(self._entries.values()):
+            by_source[e["source"]] = by_source.get(e["source"], 0) + 1
+        return {
+            "entries":    len(self._entries),
+            "buckets":    len(self._buckets),
+            "hits":       self.hits,
+            "misses":     self.misses,
+            "snapshots":  self.snapshots,
+            "by_source":  by_source,
+            "persistent": bool(self.path),
+        }
+
+
+def from_env() -> FewShotIndex:
+    return FewShotIndex(
+        os.getenv("FEWSHOT_INDEX_PATH") or None,
+        min_similarity=float(os.getenv("FEWSHOT_MIN_SIMILARITY", "0.3")),
+        k=int(os.getenv("FEWSHOT_K", "1")),
+        max_entries=int(os.getenv("FEWSHOT_MAX_ENTRIES", "50000")),
+        inline_chars=int(os.getenv("FEWSHOT_INLINE_CHARS", "1000")),
+    )
@@ -0,0 +1,154 @@
+# hedge.py
+"""
+Hedged upstream calls.
+
+Groq's latency has a long tail, and one slow-but-alive call holds the whole
+request. For the stages listed in ``HEDGE_STAGES`` a call that hasn't
+returned by that stage's running ``HEDGE_PERCENTILE`` latency gets a second,
+identical call; whichever succeeds first is used and the other is cancelled.
+
+    HEDGE_STAGES=assist_rewrite,compare_answer    # opt-in; "*" for every hedgeable call
+    HEDGE_PERCENTILE=0.95
+    HEDGE_MAX_EXTRA=0.05       # hedges may add at most ~5% more upstream calls
+    HEDGE_MIN_DELAY_MS=50      # never hedge sooner than this
+    HEDGE_MIN_SAMPLES=20       # observed calls needed before a stage hedges
+
+Both calls go through the scheduler, so hedges count against the rate
+limits like any other request.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import metrics
+
+HEDGES = metrics.Counter(
+    "upstream_hedges_total", "Hedged upstream calls (fired, won by the hedge, or skipped by the cap)",
+    ("stage", "result"))
+
+
+class LatencyTracker:
+    """Recent latencies for one stage; the percentile is re-sorted every ``refresh`` samples."""
+
+    def __init__(self, window: int = 500, refresh: int = 10):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.refresh = refresh
+        self._since = 0
+        self._sorted: list[float] = []
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self._since += 1
+        if self._since >= self.refresh:
+            self._since = 0
+            self._sorted = sorted(self.samples)
+
+    def percentile(self, q: float) -> float | None:
+        if not self._sorted:
+            return None
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class Hedger:
+    def __init__(self, stages: set[str], percentile: float = 0.95, max_extra: float = 0.05,
+                 min_delay: float = 0.05, min_samples: int = 20, burst: float = 5.0):
+        self.stages = stages
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.burst = burst
+        # every call earns ``max_extra`` of a hedge, so hedges stay under that share of calls
+        self._credit = burst
+        self._trackers: dict[str, LatencyTracker] = {}
+        self.counts: dict[str, dict[str, int]] = {}
+
+    def enabled(self, stage: str | None) -> bool:
+        return stage is not None and ("*" in self.stages or stage in self.stages)
+
+    def delay(self, stage: str) -> float | None:
+        """Seconds to wait before hedging ``stage``; None while there is too little data."""
+        tracker = self._trackers.get(stage)
+        if tracker is None or len(tracker.samples) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile) or 0.0)
+
+    def _count(self, stage: str, result: str) -> None:
+        counts = self.counts.setdefault(stage, {"calls": 0, "fired": 0, "won": 0, "capped": 0})
+        counts[result] += 1
+        if result != "calls":
+            HEDGES.inc(stage=stage, result=result)
+
+    async def run(self, stage: str | None, call: Callable[[], Awaitable]):
+        """
+        ``await call()``, hedged when ``stage`` is enabled. ``call`` is a
+        zero-arg coroutine factory and is invoked at most twice.
+        """
+        if not self.enabled(stage):
+            return await call()
+        self._count(stage, "calls")
+        self._credit = min(self.burst, self._credit + self.max_extra)
+        delay = self.delay(stage)
+        tracker = self._trackers.setdefault(stage, LatencyTracker())
+        t0 = time.monotonic()
+
+        primary = asyncio.ensure_future(call())
+        # the tracker sees the primary's own latency, failures included, so the
+        # hedge delay isn't pulled down by hedges that won
+        primary.add_done_callback(lambda t: t.cancelled() or tracker.add(time.monotonic() - t0))
+        tasks = {primary}
+        winner = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    if self._credit >= 1.0:
+                        self._credit -= 1.0
+                        self._count(stage, "fired")
+                        tasks.add(asyncio.ensure_future(call()))
+                    else:
+                        self._count(stage, "capped")
+            result, winner = await self._first_success(tasks, primary)
+        finally:
+            if winner is not None and winner is not primary and not primary.done():
+                # the primary lost and is about to be cancelled: it took at least this long
+                tracker.add(time.monotonic() - t0)
+            for t in tasks:
+                t.cancel()
+        if winner is not primary:
+            self._count(stage, "won")
+        return result
+
+    @staticmethod
+    async def _first_success(tasks: set[asyncio.Future], primary: asyncio.Future):
+        """First successful ``(result, task)``; if every task fails, the primary's error."""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if not t.cancelled() and t.exception() is None:
+                    return t.result(), t
+        if primary.cancelled():
+            raise asyncio.CancelledError()
+        raise primary.exception()
+
+    def stats(self) -> dict:
+        return {
+            stage: {**counts, "hedge_after_ms": round(d * 1000, 1) if (d := self.delay(stage)) else None}
+            for stage, counts in self.counts.items()
+        }
+
+
+def from_env() -> Hedger:
+    return Hedger(
+        stages={s.strip() for s in os.getenv("HEDGE_STAGES", "").split(",") if s.strip()},
+        percentile=float(os.getenv("HEDGE_PERCENTILE", "0.95")),
+        max_extra=float(os.getenv("HEDGE_MAX_EXTRA", "0.05")),
+        min_delay=float(os.getenv("HEDGE_MIN_DELAY_MS", "50")) / 1000,
+        min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+    )
+
+
+hedger = from_env()
@@ -0,0 +1,271 @@
+# inference.py
+"""
+Pluggable inference backends for /prompt-assist.
+
+``main.GroqBackend`` is the default. ``LocalBackend`` serves the LoRA adapter
+produced by ``finetune/src/train.py`` in-process: the base model and adapter
+are merged once at startup, optionally quantized for CPU, and concurrent
+requests are micro-batched into a single ``generate`` call.
+
+    INFERENCE_BACKEND=local
+    LOCAL_BASE_MODEL=meta-llama/Llama-3.2-1B
+    LOCAL_ADAPTER_DIR=/models/prettyprompt-lora
+    LOCAL_QUANTIZE=int8          # none | int8 | int4
+    LOCAL_MODES=rewrite,shorten  # other modes still go to Groq
+
+torch/transformers/peft are only imported when the local backend is enabled
+(see requirements-local.txt).
+"""
+import abc
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# must match finetune/src/utils.PROMPT_TEMPLATE — the adapter only knows this format
+PROMPT_TEMPLATE = "MODE: {mode}\nTARGET: {target}\nPROMPT: {input}\n\nREWRITE:"
+
+
+def format_prompt(mode: str, target: str, inp: str) -> str:
+    return PROMPT_TEMPLATE.format(mode=mode, target=target, input=inp)
+
+
+class InferenceBackend(abc.ABC):
+    """What /prompt-assist needs from a model: one rewrite per request."""
+
+    name = "base"
+    model = ""
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def serves(self, req) -> bool:
+        return True
+
+    @abc.abstractmethod
+    async def rewrite(self, req) -> str:
+        ...
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "model": self.model}
+
+
+class MicroBatcher:
+    """
+    Collect concurrent ``submit`` calls for up to ``window`` seconds (or until
+    ``max_batch`` are waiting) and hand them to ``fn`` as one list. ``fn`` is
+    blocking and runs on a single dedicated thread, so batches never overlap
+    and the event loop stays free.
+    """
+
+    def __init__(self, fn, max_batch: int, window: float):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="local-infer")
+        self._task: asyncio.Task | None = None
+        self.requests = 0
+        self.batches = 0
+        self.max_seen = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, item):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # callers that gave up (client disconnect) don't need a slot
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+            self.requests += len(batch)
+            self.batches += 1
+            self.max_seen = max(self.max_seen, len(batch))
+            try:
+                with stage("local_generate"):
+                    results = await loop.run_in_executor(self._executor, self.fn, [i for i, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "requests":       self.requests,
+            "batches":        self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_seen,
+            "queued":         self._queue.qsize(),
+        }
+
+
+class LocalBackend(InferenceBackend):
+    name = "local"
+
+    def __init__(self, base_model: str, adapter_dir: str | None, quantize: str = "none",
+                 modes: set[str] | None = None, max_batch: int = 8, window_ms: float = 10.0,
+                 max_new_tokens: int = 256, max_input_length: int = 512, threads: int = 0):
+        self.base_model = base_model
+        self.adapter_dir = adapter_dir
+        self.quantize = quantize
+        self.modes = modes
+        self.max_new_tokens = max_new_tokens
+        self.max_input_length = max_input_length
+        self.threads = threads
+        self.model = f"local:{base_model}+{adapter_dir or '-'}:{quantize}"
+        self.batcher = MicroBatcher(self._generate, max_batch, window_ms / 1000)
+        self._lm = None
+        self._tokenizer = None
+        self.truncated = 0
+
+    def serves(self, req) -> bool:
+        # the adapter never saw few-shot examples or conversation context
+        return not req.synth_examples and not req.context and (self.modes is None or req.mode in self.modes)
+
+    async def start(self) -> None:
+        t0 = time.perf_counter()
+        await asyncio.to_thread(self._load)
+        logger.info("local backend %s ready in %.1fs", self.model, time.perf_counter() - t0)
+        self.batcher.start()
+
+    async def close(self) -> None:
+        await self.batcher.close()
+
+    def _load(self) -> None:
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        tokenizer = AutoTokenizer.from_pretrained(self.base_model, use_fast=True)
+        tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        tokenizer.truncation_side = "left"
+        lm = AutoModelForCausalLM.from_pretrained(self.base_model, torch_dtype=torch.float32)
+        if self.adapter_dir:
+            from peft import PeftModel
+
+            lm = PeftModel.from_pretrained(lm, self.adapter_dir).merge_and_unload()
+        lm = quantize_model(lm.eval(), self.quantize)
+        self._lm, self._tokenizer = lm, tokenizer
+
+    def _fit(self, mode: str, target: str, text: str) -> str:
+        """
+        The adapter prompt for ``text``, cutting the user's text rather than
+        the template: truncating the whole prompt would drop the trailing
+        "REWRITE:" and the adapter would continue the prompt instead.
+        """
+        tok = self._tokenizer
+        room = self.max_input_length - len(tok(format_prompt(mode, target, ""))["input_ids"])
+        ids = tok(text, add_special_tokens=False)["input_ids"]
+        if len(ids) > room:
+            text = tok.decode(ids[:max(room, 0)])
+            self.truncated += 1
+        return format_prompt(mode, target, text)
+
+    def _generate(self, items: list[tuple[str, str, str]]) -> list[str]:
+        import torch
+
+        tok = self._tokenizer
+        prompts = [self._fit(*item) for item in items]
+        # re-encoding a cut text can differ by a token at the seam; any excess
+        # comes off the front, never the "REWRITE:" the model continues from
+        enc = tok(prompts, return_tensors="pt", padding=True, truncation=True,
+                  max_length=self.max_input_length)
+        with torch.inference_mode():
+            out = self._lm.generate(
+                **enc,
+                max_new_tokens=self.max_new_tokens,
+                do_sample=False,
+                use_cache=True,
+                pad_token_id=tok.pad_token_id,
+                eos_token_id=tok.eos_token_id,
+            )
+        texts = tok.batch_decode(out[:, enc["input_ids"].shape[1]:], skip_special_tokens=True)
+        return [t.strip() for t in texts]
+
+    async def rewrite(self, req) -> str:
+        return await self.batcher.submit((req.mode, req.target_model, req.prompt))
+
+    def stats(self) -> dict:
+        return {**super().stats(), "loaded": self._lm is not None, "truncated": self.truncated,
+                **self.batcher.stats()}
+
+
+def quantize_model(lm, mode: str):
+    """CPU weight quantization: dynamic int8 via torch, 4-bit via optimum-quanto."""
+    if mode in ("", "none"):
+        return lm
+    if mode == "int8":
+        import torch
+
+        return torch.ao.quantization.quantize_dynamic(lm, {torch.nn.Linear}, dtype=torch.qint8)
+    if mode == "int4":
+        try:
+            from optimum.quanto import freeze, qint4, quantize
+        except ImportError as e:
+            raise RuntimeError("LOCAL_QUANTIZE=int4 needs optimum-quanto (pip install optimum-quanto)") from e
+        quantize(lm, weights=qint4)
+        freeze(lm)
+        return lm
+    raise ValueError(f"unknown LOCAL_QUANTIZE {mode!r} (expected none, int8 or int4)")
+
+
+def from_env() -> LocalBackend | None:
+    """The local backend when ``INFERENCE_BACKEND=local``, else None (Groq only)."""
+    if os.getenv("INFERENCE_BACKEND", "groq") != "local":
+        return None
+    base = os.getenv("LOCAL_BASE_MODEL")
+    if not base:
+        raise ValueError("INFERENCE_BACKEND=local needs LOCAL_BASE_MODEL")
+    modes = os.getenv("LOCAL_MODES")
+    return LocalBackend(
+        base_model=base,
+        adapter_dir=os.getenv("LOCAL_ADAPTER_DIR") or None,
+        quantize=os.getenv("LOCAL_QUANTIZE", "none"),
+        modes={m.strip() for m in modes.split(",") if m.strip()} if modes else None,
+        max_batch=int(os.getenv("LOCAL_MAX_BATCH", "8")),
+        window_ms=float(os.getenv("LOCAL_BATCH_WINDOW_MS", "10")),
+        max_new_tokens=int(os.getenv("LOCAL_MAX_NEW_TOKENS", "256")),
+        max_input_length=int(os.getenv("LOCAL_MAX_INPUT_LENGTH", "512")),
+        threads=int(os.getenv("LOCAL_THREADS", "0")),
+    )
@@ -0,0 +1,341 @@
+# jobs.py
+"""
+Local job queue for long-running generation.
+
+Jobs are rows in SQLite (``JOBS_DB_PATH``) so their state survives restarts
+and is readable from every worker process; a pool of ``JOB_WORKERS`` asyncio
+workers runs them. Handlers report progress as events (one per topic for
+template jobs), which callers poll or follow over SSE. Every query runs in a
+thread, so a busy database never stalls the event loop.
+
+    job = await jobs.submit("templates", {"industry": "Legal", "count": 5}, dedup_key="templates:legal:5")
+    await jobs.wait(job["id"])
+
+Submitting while an identical job (same ``dedup_key``) is queued or running
+returns that job instead. ``cancel`` drops a queued job or cancels a running
+one; a job running in another process is flagged and that process cancels it
+on its next heartbeat.
+
+Each process stamps the pending jobs it owns with a heartbeat every
+``JOBS_HEARTBEAT_SECONDS``. ``start(recover=True)`` (the leader worker) also
+takes over pending jobs whose owner has missed several heartbeats, i.e. died,
+and runs them again; jobs of live workers are left alone.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+PENDING = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+STALE_HEARTBEATS = 6        # missed heartbeats before an owner counts as dead
+
+# handler(params, progress) → JSON-serializable result; progress(event, data)
+Handler = Callable[[dict, Callable[[str, dict], None]], Awaitable[object]]
+
+_COLUMNS = "id, kind, params, status, events, result, error, created_at, updated_at, owner, cancel_requested"
+
+
+class JobQueue:
+    def __init__(self, db_path: str | None, workers: int = 8, keep_seconds: float = 7 * 86400,
+                 heartbeat: float = 5.0):
+        self.db_path = db_path or ":memory:"
+        self.workers = workers
+        self.keep_seconds = keep_seconds
+        self.heartbeat = heartbeat
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handlers: dict[str, Handler] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._running: dict[str, asyncio.Task] = {}
+        self._changed: dict[str, asyncio.Event] = {}
+        self._pool: list[asyncio.Task] = []
+        self._closing = False
+        self.counts = {"submitted": 0, "deduplicated": 0, "done": 0, "failed": 0, "cancelled": 0,
+                       "recovered": 0}
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    # ─── Storage ───
+    def open(self) -> None:
+        self._db()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10.0)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs ("
+                        " id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedup_key TEXT, params TEXT NOT NULL,"
+                        " status TEXT NOT NULL, events TEXT NOT NULL DEFAULT '[]', result TEXT, error TEXT,"
+                        " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+                    )
+                    # columns added after the first release of this table
+                    have = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                    for col, decl in (("owner", "TEXT"), ("heartbeat", "REAL NOT NULL DEFAULT 0"),
+                                      ("cancel_requested", "INTEGER NOT NULL DEFAULT 0")):
+                        if col not in have:
+                            conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} {decl}")
+                    conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status)")
+                    conn.execute("DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?",
+                                 (*FINISHED, time.time() - self.keep_seconds))
+                    self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, args: tuple) -> tuple[list, int]:
+        conn = self._db()
+        with self._lock:
+            cur = conn.execute(sql, args)
+            return cur.fetchall(), cur.rowcount
+
+    async def _exec(self, sql: str, args: tuple = ()) -> tuple[list, int]:
+        """``(rows, rowcount)``; sqlite can wait up to its busy timeout, so never on the loop."""
+        return await asyncio.to_thread(self._execute, sql, args)
+
+    @staticmethod
+    def _row(row) -> dict | None:
+        if row is None:
+            return None
+        id_, kind, params, status, events, result, error, created, updated, owner, cancel_requested = row
+        return {
+            "id": id_, "kind": kind, "status": status, "params": json.loads(params),
+            "events": json.loads(events), "result": json.loads(result) if result is not None else None,
+            "error": error, "created_at": created, "updated_at": updated,
+            "owner": owner, "cancel_requested": bool(cancel_requested),
+        }
+
+    async def get(self, job_id: str) -> dict | None:
+        rows, _ = await self._exec(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return self._row(rows[0] if rows else None)
+
+    async def _update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        await self._exec(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+        self._notify(job_id)
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    # ─── API ───
+    def _insert(self, kind: str, params: dict, dedup_key: str | None) -> tuple[str, bool]:
+        # check-and-insert under one lock hold and transaction, so concurrent
+        # identical submits (in any process) end up on one row
+        conn = self._db()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if dedup_key is not None:
+                    row = conn.execute(
+                        "SELECT id FROM jobs WHERE dedup_key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                        (dedup_key, *PENDING)).fetchone()
+                    if row is not None:
+                        return row[0], True
+                job_id = uuid.uuid4().hex
+                now = time.time()
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, dedup_key, params, status, created_at, updated_at, owner, heartbeat)"
+                    " VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                    (job_id, kind, dedup_key, json.dumps(params), now, now, self.owner, now))
+                return job_id, False
+            finally:
+                conn.execute("COMMIT")
+
+    async def submit(self, kind: str, params: dict, dedup_key: str | None = None) -> dict:
+        """Queue a job; returns it with ``deduplicated`` set if an identical one was pending."""
+        if kind not in self._handlers:
+            raise ValueError(f"unknown job kind {kind!r}")
+        job_id, deduplicated = await asyncio.to_thread(self._insert, kind, params, dedup_key)
+        if deduplicated:
+            self.counts["deduplicated"] += 1
+        else:
+            self.counts["submitted"] += 1
+            self._queue.put_nowait(job_id)
+        return {**await self.get(job_id), "deduplicated": deduplicated}
+
+    async def cancel(self, job_id: str) -> dict | None:
+        """
+        Cancel a queued or running job; finished jobs are returned unchanged.
+        A job running in another process comes back still ``running`` with
+        ``cancel_requested`` set; its owner cancels it within a heartbeat.
+        """
+        job = await self.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()       # the worker records the cancellation
+            await asyncio.wait({task})
+            return await self.get(job_id)
+        # still queued (here or in another worker): the claim in _run will fail
+        _, cancelled = await self._exec(
+            "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id))
+        if cancelled:
+            self.counts["cancelled"] += 1
+            self._notify(job_id)
+        else:
+            await self._exec("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                             (job_id,))
+        return await self.get(job_id)
+
+    def _watch(self, job_id: str) -> asyncio.Event:
+        # taken before reading the row, so a change between the read and the
+        # wait still wakes the waiter
+        return self._changed.setdefault(job_id, asyncio.Event())
+
+    @staticmethod
+    async def _changed_or(event: asyncio.Event, timeout: float = 1.0) -> None:
+        """Return when the job changes here, or after ``timeout`` (changes made by other processes)."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait(self, job_id: str) -> dict:
+        while True:
+            event = self._watch(job_id)
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return job
+            await self._changed_or(event)
+
+    async def follow(self, job_id: str):
+        """Yield ``(event, data)``: each progress event, then the final job state."""
+        seen = 0
+        while True:
+            event = self._watch(job_id)
+            job = await self.get(job_id)
+            if job is None:
+                return
+            for e in job["events"][seen:]:
+                yield e["event"], e
+            seen = len(job["events"])
+            if job["status"] in FINISHED:
+                yield job["status"], job
+                return
+            await self._changed_or(event)
+
+    # ─── Workers ───
+    def start(self, recover: bool = True) -> None:
+        """Start the worker pool and heartbeat; with ``recover``, also adopt dead owners' jobs."""
+        self._pool = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._pool.append(asyncio.create_task(self._beat(recover)))
+
+    async def close(self) -> None:
+        # running jobs stay 'running' in the table; once their heartbeat goes
+        # stale the next leader recovers them
+        self._closing = True
+        for task in self._pool:
+            task.cancel()
+        await asyncio.gather(*self._pool, return_exceptions=True)
+
+    async def _beat(self, recover: bool) -> None:
+        while True:
+            try:
+                await self._exec("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN (?, ?)",
+                                 (time.time(), self.owner, *PENDING))
+                if self._running:
+                    rows, _ = await self._exec(
+                        "SELECT id FROM jobs WHERE owner = ? AND status = 'running' AND cancel_requested = 1",
+                        (self.owner,))
+                    for (job_id,) in rows:
+                        task = self._running.get(job_id)
+                        if task is not None:
+                            task.cancel()
+                if recover:
+                    await self._recover()
+            except sqlite3.Error as e:
+                logger.warning("job heartbeat failed: %s", e)
+            await asyncio.sleep(self.heartbeat)
+
+    async def _recover(self) -> None:
+        stale = time.time() - STALE_HEARTBEATS * self.heartbeat
+        rows, _ = await self._exec(
+            "SELECT id FROM jobs WHERE status IN (?, ?) AND heartbeat < ? ORDER BY created_at",
+            (*PENDING, stale))
+        for (job_id,) in rows:
+            # conditional, so a job whose owner beat in the meantime stays put
+            _, adopted = await self._exec(
+                "UPDATE jobs SET status = 'queued', owner = ?, heartbeat = ? WHERE id = ? AND heartbeat < ?"
+                " AND status IN (?, ?)",
+                (self.owner, time.time(), job_id, stale, *PENDING))
+            if adopted:
+                logger.info("recovering job %s from a dead worker", job_id)
+                self.counts["recovered"] += 1
+                self._queue.put_nowait(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("job %s crashed the worker loop", job_id)
+
+    async def _run(self, job_id: str) -> None:
+        # claim it; fails if it was cancelled or another process took it
+        _, claimed = await self._exec(
+            "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, updated_at = ?"
+            " WHERE id = ? AND status = 'queued'",
+            (self.owner, time.time(), time.time(), job_id))
+        if not claimed:
+            return
+        self._notify(job_id)
+        job = await self.get(job_id)
+        events: list[dict] = []
+        writes: set[asyncio.Task] = set()
+
+        def progress(event: str, data: dict) -> None:
+            # handlers report synchronously; each write stores the whole list
+            # as it is when the write runs, so a late write is never stale
+            events.append({"event": event, "at": time.time(), **data})
+            write = asyncio.create_task(self._update(job_id, events=json.dumps(events)))
+            writes.add(write)
+            write.add_done_callback(writes.discard)
+
+        task = asyncio.create_task(self._handlers[job["kind"]](job["params"], progress))
+        self._running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self._closing:
+                raise
+            await self._update(job_id, status="cancelled", events=json.dumps(events))
+            self.counts["cancelled"] += 1
+        except Exception as e:
+            logger.warning("job %s (%s) failed: %s", job_id, job["kind"], e)
+            await self._update(job_id, status="failed", error=str(e), events=json.dumps(events))
+            self.counts["failed"] += 1
+        else:
+            await self._update(job_id, status="done", result=json.dumps(result), events=json.dumps(events))
+            self.counts["done"] += 1
+        finally:
+            self._running.pop(job_id, None)
+
+    def stats(self) -> dict:
+        return {**self.counts, "queued": self._queue.qsize(), "running": len(self._running),
+                "workers": self.workers}
+
+
+def from_env() -> JobQueue:
+    return JobQueue(
+        os.getenv("JOBS_DB_PATH", "jobs.sqlite3") or None,
+        workers=int(os.getenv("JOB_WORKERS", "8")),
+        keep_seconds=float(os.getenv("JOBS_KEEP_SECONDS", str(7 * 86400))),
+        heartbeat=float(os.getenv("JOBS_HEARTBEAT_SECONDS", "5")),
+    )
@@ -0,0 +1,130 @@
+# jsonextract.py
+"""
+Pull JSON out of LLM replies.
+
+Models wrap JSON in ``` fences, put a sentence in front of it or trail off
+after it. ``extract_json`` scans once for balanced ``{}``/``[]`` spans —
+ignoring braces inside string literals — and returns the first span that
+parses (optionally of the expected type). ``JSONStream`` does the same scan
+incrementally over streamed chunks and yields each top-level value the
+moment its closing brace arrives.
+
+    extract_json('Sure! ```json\\n{"a": {"b": 1}}\\n```')       # {'a': {'b': 1}}
+    extract_json('Topics: ["x", "y"]. Enjoy!', expect=list)    # ['x', 'y']
+"""
+import json
+import re
+
+_OPEN = {"{": "}", "[": "]"}
+_SPECIAL = re.compile(r'[{}\[\]"\\]')
+
+
+class JSONStream:
+    """
+    Incremental balanced-span scanner. ``feed`` only looks at new characters
+    (and jumps between brackets, quotes and backslashes with one regex), so a
+    reply streamed in N chunks is scanned once in total.
+    """
+
+    def __init__(self, kinds: str = "{["):
+        self.kinds = kinds
+        self._span: list[str] = []      # text of the open span from earlier chunks
+        self._stack: list[str] = []     # expected closers
+        self._in_string = False
+        self._escape = False            # chunk ended on a backslash inside a string
+
+    def feed(self, chunk: str) -> list:
+        """Scan ``chunk``; return every top-level value that completed and parses."""
+        return [value for _, value in self.scan(chunk)]
+
+    def scan(self, chunk: str):
+        """Like ``feed`` but yields ``(raw_text, value)`` pairs lazily."""
+        escaped_at = 0 if self._escape else -1
+        self._escape = False
+        span_start = 0
+        for m in _SPECIAL.finditer(chunk):
+            i, ch = m.start(), m.group()
+            if not self._stack:
+                if ch in self.kinds:
+                    self._stack.append(_OPEN[ch])
+                    self._span, span_start = [], i
+                continue
+
+            if self._in_string:
+                if i == escaped_at:
+                    continue
+                if ch == "\\":
+                    escaped_at = i + 1
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in _OPEN:
+                self._stack.append(_OPEN[ch])
+            elif ch in "}]":
+                if ch != self._stack[-1]:
+                    # mismatched closer: not JSON, drop the span and resync
+                    self._reset()
+                    continue
+                self._stack.pop()
+                if not self._stack:
+                    text = "".join(self._span) + chunk[span_start:i + 1]
+                    self._reset()
+                    try:
+                        value = json.loads(text)
+                    except ValueError:
+                        continue    # balanced but not JSON (e.g. "{name}" placeholders)
+                    yield text, value
+        if self._stack:
+            self._span.append(chunk[span_start:])
+            self._escape = escaped_at == len(chunk)
+
+    def _reset(self) -> None:
+        self._span = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def pending(self) -> str:
+        """The unfinished span so far (for progress display)."""
+        return "".join(self._span)
+
+
+def iter_json(text: str, kinds: str = "{["):
+    """Yield every top-level JSON value embedded in ``text``, in order."""
+    for _, value in JSONStream(kinds).scan(text):
+        yield value
+
+
+def _first(text: str, expect: type | None) -> tuple[str, object]:
+    kinds = {dict: "{", list: "["}.get(expect, "{[")
+    stripped = text.strip()
+    # fast path: the whole reply is the JSON we want
+    if stripped[:1] in kinds:
+        try:
+            value = json.loads(stripped)
+            if expect is None or isinstance(value, expect):
+                return stripped, value
+        except ValueError:
+            pass
+    # the generator stops scanning at the first match
+    for raw, value in JSONStream(kinds).scan(text):
+        if expect is None or isinstance(value, expect):
+            return raw, value
+    kind = {dict: "object", list: "array"}.get(expect, "value")
+    raise ValueError(f"No JSON {kind} detected in LLM response")
+
+
+def extract_json(text: str, expect: type | None = None):
+    """
+    First JSON value in ``text`` (of type ``expect`` when given). Raises
+    ValueError if there is none, so callers can keep catching ValueError /
+    JSONDecodeError as before.
+    """
+    return _first(text, expect)[1]
+
+
+def find_json(text: str, expect: type | None = dict) -> str:
+    """Like ``extract_json`` but returns the matching span as text."""
+    return _first(text, expect)[0]
@@ -0,0 +1,82 @@
+# llm.py
+"""
+Shared async Groq client.
+
+All async handlers go through ``get_async_client()`` so every request reuses
+one bounded httpx connection pool instead of opening sockets per call.
+"""
+import os
+
+import groq
+import httpx
+from groq import AsyncGroq
+
+from hedge import hedger
+from metrics import record_usage, stage
+from scheduler import estimate_tokens, scheduler
+
+# ─── Pool sizing (override through env in production) ───
+MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE   = int(os.getenv("GROQ_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT    = float(os.getenv("GROQ_TIMEOUT", "60"))
+
+_async_client: AsyncGroq | None = None
+
+
+def get_async_client() -> AsyncGroq:
+    """
+    Return the process-wide ``AsyncGroq`` client, creating it on first use.
+    """
+    global _async_client
+    if _async_client is None:
+        http_client = groq.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=5.0),
+        )
+        _async_client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            http_client=http_client,
+        )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Close the shared client (called from the app lifespan)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+async def call_groq_with_retry_async(model: str, temperature: float, messages: list[dict],
+                                     hedge: str | None = None, **kwargs):
+    """
+    Chat completion on the shared AsyncGroq client. Rate limits, retries, backoff
+    and the circuit breaker all live in the shared ``scheduler``. ``hedge``
+    names the stage whose latency decides when to send a backup call (see
+    hedge.py); it only takes effect for stages enabled in ``HEDGE_STAGES``.
+    """
+    client = get_async_client()
+    with stage("groq_call"):
+        resp = await hedger.run(hedge, lambda: scheduler.call(
+            lambda: client.chat.completions.create(
+                model=model,
+                temperature=temperature,
+                messages=messages,
+                **kwargs
+            ),
+            est_tokens=estimate_tokens(messages),
+        ))
+    record_usage(resp)
+    return resp
+
+
+async def open_groq_stream_with_retry_async(model: str, temperature: float, messages: list[dict]):
+    """
+    Open a ``stream=True`` completion. Retries only cover opening the stream;
+    once tokens flow, a failure is the caller's to report.
+    """
+    return await call_groq_with_retry_async(model, temperature, messages, stream=True)
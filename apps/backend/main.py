@@ -4,30 +4,141 @@ import os
 for v in ("HTTP_PROXY","HTTPS_PROXY","http_proxy","https_proxy"):
     os.environ.pop(v, None)
 
-from fastapi import FastAPI, HTTPException, APIRouter
-from pydantic import BaseModel
-from groq import Groq
+from fastapi import FastAPI, HTTPException, APIRouter, Request
+from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
 from fastapi.middleware.cors  import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import Optional, Literal, List
-from models import CompareRequest, CompareResponse, Criterion, TemplateRequest, TemplateOut
+from models import (
+    CompareRequest, CompareResponse, Criterion, RankedRewrite, TemplateRequest, TemplateOut, TemplatePage,
+    TournamentRequest, TournamentResponse,
+)
 
-from data.run_pipeline import generate_templates_for_industry
+from llm import (
+    call_groq_with_retry_async, close_async_client, get_async_client, open_groq_stream_with_retry_async,
+)
+from cache import cache_key, from_env as cache_from_env
+from batch import run_batch
+from scheduler import UpstreamUnavailable, scheduler
+from hedge import hedger
+from singleflight import SingleFlight, request_key
+from jsonextract import extract_json
+from prompt_budget import PromptTooLong, budgets_from_env, counter as token_counter, fit_context
+from inference import InferenceBackend, from_env as local_backend_from_env
+from template_store import from_env as template_store_from_env, normalize as normalize_industry, refresher_from_env
+from fewshot import from_env as fewshot_from_env, with_examples
+from jobs import from_env as jobs_from_env
+import metrics
+import shared
+import tracing
+from metrics import stage
 
-import re,json
+import json
 import groq
 from fastapi import HTTPException
+from contextlib import asynccontextmanager
+import asyncio
+import importlib
+import logging
 import time
+from collections import deque
+
 
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 api_key = os.getenv("GROQ_API_KEY")
 if not api_key:
     raise ValueError("GROQ_API_KEY environment variable is not set")
-client = Groq(api_key=api_key)
 MODEL = os.getenv("MODEL", "llama2-70b-4096")
+# with several workers the second cache tier and the rate-limit buckets live
+# in shared.store, so workers see each other's entries and one upstream budget
+response_cache = cache_from_env(shared.store)
+# synth_examples requests sample a few-shot pair at T=0.5, so their final
+# messages never repeat.  "reuse" keys them on the un-augmented request and
+# serves the first sampled rewrite again; "bypass" never caches them.
+CACHE_SYNTH_POLICY = os.getenv("CACHE_SYNTH_POLICY", "reuse")
+inflight = SingleFlight()
+template_store = template_store_from_env()
+# synth_examples: demonstrations retrieved from this index (similar /compare
+# winners and templates), or an example the LLM wrote for this exact prompt
+# when nothing similar is indexed (and FEWSHOT_LLM_FALLBACK isn't 0)
+fewshot_index = fewshot_from_env()
+FEWSHOT_LLM_FALLBACK = os.getenv("FEWSHOT_LLM_FALLBACK", "1") != "0"
+FEWSHOT_SNAPSHOT_SECONDS = float(os.getenv("FEWSHOT_SNAPSHOT_SECONDS", "300"))
+# /compare pairs become examples when the rewrite wins by at least this many points
+FEWSHOT_MIN_GAIN = int(os.getenv("FEWSHOT_MIN_GAIN", "2"))
+
+
+def index_templates(entries: list[dict]) -> None:
+    for e in entries:
+        fewshot_index.add(e["topic"], e["user_prompt"], "template",
+                          id=f"template:{e['id']}")
+
+async def index_new_templates(entries: list[dict]) -> None:
+    for e in entries:
+        await fewshot_index.add_async(e["topic"], e["user_prompt"], "template", id=f"template:{e['id']}")
+
+template_store.listeners.append(index_new_templates)
+
+
+_pipeline_import: asyncio.Future | None = None
+
+
+def load_pipeline() -> asyncio.Future:
+    """
+    Import ``data.run_pipeline`` (and agno) off the event loop, once. Started
+    in the background by the lifespan so it doesn't delay startup; the first
+    template generation awaits it if it hasn't finished yet.
+    """
+    global _pipeline_import
+    if _pipeline_import is None:
+        _pipeline_import = asyncio.ensure_future(asyncio.to_thread(importlib.import_module, "data.run_pipeline"))
+    return _pipeline_import
+
+
+async def generate_templates_for_industry_async(industry: str, count: int = 2, progress=None) -> list[dict]:
+    pipeline = await load_pipeline()
+    return await pipeline.generate_templates_for_industry_async(industry, count, progress=progress)
+
+template_refresher = refresher_from_env(template_store, generate_templates_for_industry_async)
 origins= os.getenv("ORIGINS")
-app = FastAPI(title="Promptly Analyzer", version="0.1.0")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_async_client()          # warm the shared connection pool
+    await asyncio.to_thread(template_store.open)
+    await asyncio.to_thread(fewshot_index.open)
+    await asyncio.to_thread(lambda: index_templates(template_store.entries()))
+    load_pipeline()
+    if local_backend is not None:
+        await local_backend.start()
+    loop_watch = asyncio.create_task(metrics.watch_event_loop())
+    # background jobs run in one worker only
+    leader = shared.acquire_leadership()
+    await asyncio.to_thread(jobs.open)
+    jobs.start(recover=leader)
+    refresh = asyncio.create_task(template_refresher.run()) \
+        if leader and template_refresher.interval > 0 else None
+    # every worker snapshots its own inserts; the index merges what the others wrote
+    snapshots = asyncio.create_task(fewshot_index.run(FEWSHOT_SNAPSHOT_SECONDS)) \
+        if fewshot_index.path and FEWSHOT_SNAPSHOT_SECONDS > 0 else None
+    yield
+    loop_watch.cancel()
+    if refresh is not None:
+        refresh.cancel()
+    if snapshots is not None:
+        snapshots.cancel()
+    await jobs.close()
+    await asyncio.to_thread(fewshot_index.snapshot)
+    if local_backend is not None:
+        await local_backend.close()
+    await close_async_client()
+    tracing.flush()
+
+app = FastAPI(title="Promptly Analyzer", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins= origins,  # or ["*"] during dev
@@ -36,23 +147,11 @@ app.add_middleware(
     allow_methods=["*"],      # <-- include OPTIONS automatically
     allow_headers=["*"],      # allow Content-Type, Authorization, etc.
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
-# ---------- Helper that grabs JSON ----------
-def grab_json(obj_str: str) -> str:
-    """
-    Return the first {...} block found in ``obj_str``.
-    Raises ValueError if no JSON object is detected.
-    """
-    # ① remove ``` fences if they exist
-    if obj_str.lstrip().startswith("```"):
-        obj_str = re.sub(r"^```(\w+)?\s*|```$", "", obj_str.strip(),
-                         flags=re.DOTALL).strip()
-
-    # ② pull the first {...} object (lazy so it stops at the matching })
-    match = re.search(r"\{[\s\S]*?\}", obj_str)
-    if not match:
-        raise ValueError("No JSON object detected in LLM response")
-    return match.group(0)
+@app.exception_handler(PromptTooLong)
+async def prompt_too_long_handler(request: Request, exc: PromptTooLong):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
 
 # ---------- Pydantic Schemas ----------
 
@@ -130,11 +229,7 @@ GUIDES = {
 }
 
 
-def build_prompt(base: str, req: AssistRequest) -> str:
-    instruction = MODE_INSTRUCTIONS[req.mode]
-    guide       = GUIDES[req.target_model]
-
-    prompt = f"""{instruction} the original prompt to be maximally clear, specific, and well-structured for an advanced LLM.
+PROMPT_TEMPLATE = """{instruction} the original prompt to be maximally clear, specific, and well-structured for an advanced LLM.
 
     ### Target model rules
     {guide}
@@ -144,72 +239,345 @@ def build_prompt(base: str, req: AssistRequest) -> str:
 
     ### Rewritten prompt
     """
+CONTEXT_HEADER = "\n\n--- Conversation context ---\n"
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "3"))
+PROMPT_BUDGETS, PROMPT_BUDGET_DEFAULT = budgets_from_env()
+
+def _compile_parts(mode: str, target: str) -> tuple[str, str, int]:
+    head, tail = PROMPT_TEMPLATE.format(
+        instruction=MODE_INSTRUCTIONS[mode], guide=GUIDES[target], base="\0").split("\0")
+    fixed = token_counter.messages([
+        {"role": "system", "content": PROMPT_ASSIST},
+        {"role": "user",   "content": head + tail},
+    ])
+    return head, tail, fixed
+
+# (mode, target_model) → (text before the prompt, text after it, tokens of everything fixed)
+PROMPT_PARTS = {(m, t): _compile_parts(m, t) for m in MODE_INSTRUCTIONS for t in GUIDES}
+
+def build_prompt(base: str, req: AssistRequest) -> str:
+    head, tail, _ = PROMPT_PARTS[(req.mode, req.target_model)]
+    return head + base + tail
+
+def fewshot_messages(req: AssistRequest) -> list[dict]:
+    return [
+        {"role":"system","content":"Generate ONE realistic input→output pair illustrating the prompt below."},
+        {"role":"user","content": req.prompt}
+    ]
+
+def demo_messages(source: str, output: str, req: AssistRequest) -> list[dict]:
+    """One retrieved pair as a worked user/assistant exchange under the same template."""
+    return [
+        {"role":"user",      "content": build_prompt(source, req)},
+        {"role":"assistant", "content": output}
+    ]
+
+def build_messages(base_prompt: str, req: AssistRequest, record: bool = True,
+                   demos: list[tuple[str, str]] = (), example: str | None = None) -> list[dict]:
+    """
+    System prompt + precompiled (mode, target) template around ``base_prompt``.
+    ``example``, written for this very prompt, goes inside it; retrieved
+    ``demos`` (other prompts' input → output pairs) become separate
+    demonstration turns before it. Then recent context turns, as far as the
+    upstream model's budget allows. Raises PromptTooLong only when the
+    prompt alone doesn't fit; examples are dropped before that.
+    """
+    _, _, fixed = PROMPT_PARTS[(req.mode, req.target_model)]
+    budget = PROMPT_BUDGETS.get(MODEL, PROMPT_BUDGET_DEFAULT)
+    used = fixed + token_counter.count(base_prompt)
+    if used > budget:
+        raise PromptTooLong(used, budget, MODEL)
+
+    if example is not None:
+        cost = fixed + token_counter.count(with_examples(base_prompt, [example]))
+        if cost <= budget:
+            base_prompt = with_examples(base_prompt, [example])
+            used = cost
+
+    # nearest demonstrations first; stop at the first that would overflow
+    shown: list[dict] = []
+    for source, output in demos:
+        turn = demo_messages(source, output, req)
+        cost = token_counter.messages(turn)
+        if used + cost > budget:
+            break
+        shown += turn
+        used += cost
+
+    user = build_prompt(base_prompt, req)
     if req.context:
-        prompt += "\n\n--- Conversation context ---\n" + "\n".join(req.context[-3:])
-    return prompt
+        available = budget - used - token_counter.count(CONTEXT_HEADER)
+        turns = fit_context(req.context, available, token_counter.count, CONTEXT_MAX_TURNS,
+                            model=MODEL if record else "")
+        if turns:
+            user += CONTEXT_HEADER + "\n".join(turns)
+    return [
+        {"role":"system","content": PROMPT_ASSIST},
+        *shown,
+        {"role":"user",  "content": user}
+    ]
 
-def call_groq_with_retry(model: str, temperature: float, messages: list[dict]):
-    max_attempts = 3
-    for attempt in range(1, max_attempts + 1):
-        try:
-            return client.chat.completions.create(
-                model=model,
-                temperature=temperature,
-                messages=messages
-            )
-        except groq.InternalServerError as e:
-            # if it's the last attempt, re-raise so our outer code can handle it
-            if attempt == max_attempts:
-                raise
-            # otherwise wait (2^attempt seconds) then retry
-            time.sleep(2 ** attempt)
-
-def assist(req: AssistRequest) -> AssistResponse:
-    base_prompt = req.prompt
+UPSTREAM_503 = "Upstream model service is unavailable; please try again shortly."
+# anything the scheduler gives up on maps to 503
+UPSTREAM_ERRORS = (groq.InternalServerError, groq.RateLimitError, groq.APIConnectionError, UpstreamUnavailable)
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def assist_cache_key(req: AssistRequest) -> str | None:
+    model = backend_for(req).model
     if req.synth_examples:
-        # generate example with retry
-        try:
-            fewshot_resp = call_groq_with_retry(
+        if CACHE_SYNTH_POLICY == "bypass":
+            return None
+        return cache_key(model, 0.3, build_messages(req.prompt, req, record=False), variant="synth@0.5")
+    return cache_key(model, 0.3, build_messages(req.prompt, req, record=False))
+
+def assist_flight_key(req: AssistRequest) -> str:
+    # built from the rendered messages, so it sees the same CONTEXT_MAX_TURNS window
+    return request_key(build_messages(req.prompt, req, record=False),
+                       variant=f"{backend_for(req).model}:synth={req.synth_examples}")
+
+async def synth_examples(req: AssistRequest) -> tuple[list[tuple[str, str]], str | None]:
+    """
+    Few-shot pre-stage: ``(demos, example)``. ``example`` is one the model
+    wrote for exactly this prompt (reused when the prompt comes again);
+    otherwise ``demos`` are the nearest indexed input → output pairs, and
+    only when there are none is a fresh example sampled from the model.
+    """
+    if not req.synth_examples:
+        return [], None
+    example = fewshot_index.generated_for(req.prompt)
+    if example is not None:
+        return [], example
+    with stage("assist_fewshot_lookup"):
+        demos = await fewshot_index.lookup_async(req.prompt)
+    if demos or not FEWSHOT_LLM_FALLBACK:
+        return demos, None
+    try:
+        with stage("assist_fewshot"):
+            fewshot_resp = await call_groq_with_retry_async(
                 model=MODEL,
                 temperature=0.5,
-                messages=[
-                    {"role":"system","content":"Generate ONE realistic input→output pair illustrating the prompt below."},
-                    {"role":"user","content": req.prompt}
-                ]
+                messages=fewshot_messages(req),
+                hedge="assist_fewshot"
             )
-            fewshot = fewshot_resp.choices[0].message.content.strip()
-            base_prompt = f"{req.prompt}\n\n### Example\n{fewshot}"
-        except groq.InternalServerError:
-            # give up on examples, but continue without them
-            base_prompt = req.prompt
-
-    messages = [
-        {"role":"system","content": PROMPT_ASSIST},
-        {"role":"user",  "content": build_prompt(base_prompt, req)}
-    ]
-    if req.context:
-        ctx = "\n\n--- Conversation context ---\n" + "\n".join(req.context[-3:])
-        messages[1]["content"] += ctx
+    except UPSTREAM_ERRORS:
+        # give up on examples, but continue without them
+        return [], None
+    fewshot = fewshot_resp.choices[0].message.content.strip()
+    fewshot_index.add(req.prompt, fewshot, "generated")
+    return [], fewshot
 
-    try:
-        resp = call_groq_with_retry(
-            model=MODEL,
-            temperature=0.3,
-            messages=messages
-        )
-    except groq.InternalServerError:
-        # translate to HTTP 503
-        raise HTTPException(
-            status_code=503,
-            detail="Upstream model service is unavailable; please try again shortly."
-        )
+async def assist_async(req: AssistRequest) -> AssistResponse:
+    """/prompt-assist on the shared AsyncGroq pool: cache, then coalesced upstream call."""
+    key = assist_cache_key(req)
+    if key is not None:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            return AssistResponse(prompt=cached)
 
-    text = resp.choices[0].message.content.strip()
+    text = await inflight.do(assist_flight_key(req), lambda: assist_upstream(req, key))
     return AssistResponse(prompt=text)
 
+async def assist_upstream(req: AssistRequest, key: str | None) -> str:
+    text = await backend_for(req).rewrite(req)
+    if key is not None:
+        await response_cache.set(key, text)
+    return text
+
+class GroqBackend(InferenceBackend):
+    """Default backend: the PROMPT_ASSIST system prompt on Groq."""
+    name = "groq"
+    model = MODEL
+
+    async def rewrite(self, req: AssistRequest) -> str:
+        demos, example = await synth_examples(req)
+        messages = build_messages(req.prompt, req, demos=demos, example=example)
+
+        try:
+            with stage("assist_rewrite"):
+                resp = await call_groq_with_retry_async(
+                    model=MODEL,
+                    temperature=0.3,
+                    messages=messages,
+                    hedge="assist_rewrite"
+                )
+        except UPSTREAM_ERRORS:
+            raise HTTPException(status_code=503, detail=UPSTREAM_503)
+        return resp.choices[0].message.content.strip()
+
+groq_backend = GroqBackend()
+# INFERENCE_BACKEND=local serves the fine-tuned adapter in-process for the
+# modes it covers; everything else keeps going to Groq
+local_backend = local_backend_from_env()
+
+def backend_for(req: AssistRequest) -> InferenceBackend:
+    if local_backend is not None and local_backend.serves(req):
+        return local_backend
+    return groq_backend
+
 @app.post("/prompt-assist", response_model=AssistResponse)
-def assist_endpoint(body: AssistRequest):
-    return assist(body)
+async def assist_endpoint(body: AssistRequest):
+    return await assist_async(body)
+
+class BatchRequest(BaseModel):
+    items: List[AssistRequest]
+    concurrency: int = 8
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+@app.post("/prompt-assist/batch")
+async def assist_batch_endpoint(request: Request):
+    """
+    Bulk rewrites. Body is either ``{"items": [...], "concurrency": n}`` or,
+    with ``Content-Type: application/x-ndjson``, one AssistRequest per line
+    (concurrency via ``?concurrency=``). Results stream back as NDJSON in
+    completion order, one line per unique item.
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            raw = (await request.body()).decode("utf-8")
+            items = [AssistRequest.model_validate_json(line) for line in raw.splitlines() if line.strip()]
+            concurrency = int(request.query_params.get("concurrency", 8))
+        else:
+            body = BatchRequest.model_validate(await request.json())
+            items, concurrency = body.items, body.concurrency
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+    async def lines():
+        async for record in run_batch(items, assist_fn=assist_async, concurrency=concurrency):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# time-to-first-token samples (ms) for the streaming endpoint
+ttft_samples: deque[float] = deque(maxlen=1000)
+
+@app.post("/prompt-assist/stream")
+async def assist_stream_endpoint(body: AssistRequest):
+    """
+    SSE variant of ``/prompt-assist``. Events: ``delta`` ({text}) per token
+    chunk, then ``done`` ({prompt, ttft_ms}). The upstream stream is opened
+    before the response starts, so an exhausted retry still surfaces as a
+    plain HTTP 503; failures after the first byte arrive as an ``error`` event.
+    """
+    t0 = time.perf_counter()
+    key = assist_cache_key(body)
+    cached = await response_cache.get(key) if key is not None else None
+
+    was_cached = cached is not None
+    if not was_cached and backend_for(body) is not groq_backend:
+        # local generation isn't token-streamed; send the finished rewrite as one delta
+        cached = (await assist_async(body)).prompt
+
+    if cached is None:
+        demos, example = await synth_examples(body)
+        messages = build_messages(body.prompt, body, demos=demos, example=example)
+        try:
+            stream = await open_groq_stream_with_retry_async(
+                model=MODEL,
+                temperature=0.3,
+                messages=messages
+            )
+        except UPSTREAM_ERRORS:
+            raise HTTPException(status_code=503, detail=UPSTREAM_503)
+
+    async def events():
+        if cached is not None:
+            ttft_ms = (time.perf_counter() - t0) * 1000
+            yield sse("delta", {"text": cached})
+            yield sse("done", {"prompt": cached, "ttft_ms": ttft_ms, "cached": was_cached})
+            return
+
+        parts: list[str] = []
+        ttft_ms = None
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - t0) * 1000
+                    ttft_samples.append(ttft_ms)
+                    metrics.TTFT.observe(ttft_ms / 1000)
+                parts.append(delta)
+                yield sse("delta", {"text": delta})
+        except groq.APIError as e:
+            yield sse("error", {"detail": UPSTREAM_503 if isinstance(e, UPSTREAM_ERRORS) else str(e)})
+            return
+        finally:
+            await stream.close()
+
+        text = "".join(parts).strip()
+        if key is not None:
+            await response_cache.set(key, text)
+        yield sse("done", {"prompt": text, "ttft_ms": ttft_ms, "cached": False})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/prompt-assist/stream/stats")
+async def assist_stream_stats():
+    samples = sorted(ttft_samples)
+    if not samples:
+        return {"count": 0}
+    return {
+        "count":   len(samples),
+        "ttft_p50_ms": samples[len(samples) // 2],
+        "ttft_p95_ms": samples[int(0.95 * (len(samples) - 1))],
+    }
+
+# ─── Metrics ───
+metrics.Gauge("response_cache", "Response cache counters", ("stat",),
+              fn=lambda: {k: v for k, v in response_cache.stats().items() if k not in ("persistent", "shared")})
+metrics.Gauge("singleflight", "Request coalescing counters", ("stat",), fn=inflight.stats)
+metrics.Gauge("upstream_scheduler", "Upstream scheduler state", ("stat",),
+              fn=lambda: {k: v for k, v in scheduler.stats().items() if isinstance(v, (int, float))})
+metrics.Gauge("upstream_circuit_open", "1 while the circuit breaker is open",
+              fn=lambda: float(scheduler.breaker.state == "open"))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+metrics.Gauge("local_inference", "Local backend micro-batching counters", ("stat",),
+              fn=lambda: {k: v for k, v in local_backend.stats().items() if isinstance(v, (int, float))}
+              if local_backend is not None else {})
+
+@app.get("/inference/stats")
+async def inference_stats():
+    return {"groq": groq_backend.stats(), "local": local_backend.stats() if local_backend else None}
+
+metrics.Gauge("prompt_token_cache", "Memoized prompt token counts", ("stat",), fn=token_counter.stats)
+metrics.Gauge("fewshot_index", "Few-shot example index counters", ("stat",),
+              fn=lambda: {k: v for k, v in fewshot_index.stats().items() if k not in ("persistent", "by_source")})
+
+@app.get("/fewshot/stats")
+async def fewshot_stats():
+    return fewshot_index.stats()
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    return {**scheduler.stats(), "hedges": hedger.stats()}
+
+@app.get("/singleflight/stats")
+async def singleflight_stats():
+    return inflight.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@app.get("/shared/stats")
+async def shared_stats():
+    """Which worker answered and what it shares; counters elsewhere are per worker."""
+    return shared.stats()
 
 
 GRADE_SYSTEM = """\
@@ -232,23 +600,45 @@ No extra text.
 """
 
 router = APIRouter()
-def ask_llm(prompt: str) -> str:
-    resp = client.chat.completions.create(
-        model=MODEL,
-        temperature=0.3,
-        messages=[{"role":"user","content":prompt}]
-    )
-    return resp.choices[0].message.content.strip()
+async def ask_llm(prompt: str) -> str:
+    return (await answer_prompt(prompt))[0]
 
-@app.post("/compare", response_model=CompareResponse)
-def compare(req: CompareRequest):
-    # 1. produce answers A and B
-    answer_a = ask_llm(req.original_prompt)
-    answer_b = ask_llm(req.rewritten_prompt)
+async def answer_prompt(prompt: str) -> tuple[str, bool]:
+    """
+    Memoized answer for /compare: comparing several rewrites of one original
+    answers the original upstream once. The flag is True when this caller
+    made no upstream call of its own: a cache hit, or a call already in
+    flight for someone else.
+    """
+    messages = [{"role":"user","content":prompt}]
+    key = cache_key(MODEL, 0.3, messages, variant="compare_answer")
+    cached = await response_cache.get(key)
+    if cached is not None:
+        return cached, True
+    text, led = await inflight.do_led(f"compare_answer:{key}", lambda: answer_upstream(messages, key))
+    return text, not led
+
+async def answer_upstream(messages: list[dict], key: str) -> str:
+    with stage("compare_answer"):
+        resp = await call_groq_with_retry_async(
+            model=MODEL,
+            temperature=0.3,
+            messages=messages,
+            hedge="compare_answer"
+        )
+    text = resp.choices[0].message.content.strip()
+    await response_cache.set(key, text)
+    return text
 
-    # 2. grade
+async def timed(coro) -> tuple[object, float]:
+    """Await ``coro`` and return (result, elapsed milliseconds)."""
+    t0 = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - t0) * 1000
+
+async def grade_answers(task_description: str | None, answer_a: str, answer_b: str) -> list[Criterion]:
     grading_payload = f"""
-Task: {req.task_description or 'Use the prompt itself to infer the task.'}
+Task: {task_description or 'Use the prompt itself to infer the task.'}
 
 Answer A:
 {answer_a}
@@ -256,48 +646,387 @@ Answer A:
 Answer B:
 {answer_b}
 """
-    raw = client.chat.completions.create(
-        model=MODEL,
-        temperature=0.0,
-        messages=[
-            {"role":"system","content":GRADE_SYSTEM},
-            {"role":"user","content":grading_payload}
-        ]
-    ).choices[0].message.content
+    with stage("compare_grade"):
+        raw = (await call_groq_with_retry_async(
+            model=MODEL,
+            temperature=0.0,
+            messages=[
+                {"role":"system","content":GRADE_SYSTEM},
+                {"role":"user","content":grading_payload}
+            ],
+            hedge="compare_grade"
+        )).choices[0].message.content
 
-    # strip fences if any
-    raw = re.sub(r"^```json|```$", "", raw.strip(), flags=re.DOTALL).strip()
-    data = json.loads(raw)
+    with stage("compare_parse"):
+        data = extract_json(raw, dict)
 
-    # 3. build response
-    criteria = [
+    return [
         Criterion(
             name=c["name"],
             score_original=c["score_a"],
             score_rewrite=c["score_b"]
         ) for c in data["criteria"]
     ]
-    tx = sum(c.score_original for c in criteria)
-    ty = sum(c.score_rewrite  for c in criteria)
 
+def build_compare_response(answer_a: str, answer_b: str, criteria: list[Criterion],
+                           timings: dict[str, float]) -> CompareResponse:
     return CompareResponse(
         answer_original = answer_a,
         answer_rewrite  = answer_b,
         criteria        = criteria,
-        total_original  = tx,
-        total_rewrite   = ty
+        total_original  = sum(c.score_original for c in criteria),
+        total_rewrite   = sum(c.score_rewrite  for c in criteria),
+        timings         = timings
     )
 
+async def learn_pair(original: str, rewrite: str, total_original: int, total_rewrite: int) -> None:
+    """A rewrite that clearly beat its original becomes a few-shot example."""
+    if total_rewrite - total_original >= FEWSHOT_MIN_GAIN:
+        await fewshot_index.add_async(original, rewrite, "compare", score=total_rewrite)
+
+async def learn_from_compare(req: CompareRequest, result: CompareResponse) -> None:
+    await learn_pair(req.original_prompt, req.rewritten_prompt, result.total_original, result.total_rewrite)
+
+@app.post("/compare", response_model=CompareResponse)
+async def compare(req: CompareRequest):
+    t0 = time.perf_counter()
+    try:
+        # 1. produce answers A and B concurrently — they don't depend on each
+        #    other; if one fails the task group cancels the other
+        async with asyncio.TaskGroup() as tg:
+            task_a = tg.create_task(timed(ask_llm(req.original_prompt)))
+            task_b = tg.create_task(timed(ask_llm(req.rewritten_prompt)))
+    except* UPSTREAM_ERRORS:
+        raise HTTPException(status_code=503, detail=UPSTREAM_503)
+    (answer_a, ms_a), (answer_b, ms_b) = task_a.result(), task_b.result()
+    answers_ms = (time.perf_counter() - t0) * 1000
+
+    # 2. grade as soon as both are in
+    try:
+        criteria, grading_ms = await timed(grade_answers(req.task_description, answer_a, answer_b))
+    except UPSTREAM_ERRORS:
+        raise HTTPException(status_code=503, detail=UPSTREAM_503)
+
+    # 3. build response
+    result = build_compare_response(answer_a, answer_b, criteria, {
+        "answer_original_ms": ms_a,
+        "answer_rewrite_ms":  ms_b,
+        "answers_ms":         answers_ms,
+        "grading_ms":         grading_ms,
+        "total_ms":           (time.perf_counter() - t0) * 1000,
+    })
+    await learn_from_compare(req, result)
+    return result
+
+@app.post("/compare/stream")
+async def compare_stream(req: CompareRequest):
+    """
+    Server-Sent Events flavour of ``/compare``: ``answer_original`` and
+    ``answer_rewrite`` ({text, ms}) the moment each is ready, then ``grades``
+    ({criteria, total_original, total_rewrite, ms}) and the final ``result``.
+    Failures arrive as an ``error`` event; a client that disconnects cancels
+    whatever is still running.
+    """
+    async def events():
+        t0 = time.perf_counter()
+        async def answer(name: str, prompt: str):
+            return name, await timed(ask_llm(prompt))
+
+        tasks = [
+            asyncio.create_task(answer("answer_original", req.original_prompt)),
+            asyncio.create_task(answer("answer_rewrite",  req.rewritten_prompt)),
+        ]
+        answers: dict[str, str] = {}
+        timings: dict[str, float] = {}
+        try:
+            for done in asyncio.as_completed(tasks):
+                name, (text, ms) = await done
+                answers[name] = text
+                timings[f"{name}_ms"] = ms
+                yield sse(name, {"text": text, "ms": ms})
+            timings["answers_ms"] = (time.perf_counter() - t0) * 1000
+
+            criteria, timings["grading_ms"] = await timed(grade_answers(
+                req.task_description, answers["answer_original"], answers["answer_rewrite"]))
+            timings["total_ms"] = (time.perf_counter() - t0) * 1000
+            result = build_compare_response(
+                answers["answer_original"], answers["answer_rewrite"], criteria, timings)
+            yield sse("grades", {
+                "criteria":       [c.model_dump() for c in result.criteria],
+                "total_original": result.total_original,
+                "total_rewrite":  result.total_rewrite,
+                "ms":             timings["grading_ms"],
+            })
+            await learn_from_compare(req, result)
+            yield sse("result", result.model_dump())
+        except UPSTREAM_ERRORS:
+            yield sse("error", {"detail": UPSTREAM_503})
+        except Exception:
+            logger.exception("/compare/stream failed")
+            yield sse("error", {"detail": "Comparison failed; please try again."})
+        finally:
+            # also runs when the client disconnects and the generator is closed
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ─── Tournament: one original vs N rewrites ───
+TOURNAMENT_GRADE_BATCH = int(os.getenv("TOURNAMENT_GRADE_BATCH", "4"))
+TOURNAMENT_MAX_REWRITES = int(os.getenv("TOURNAMENT_MAX_REWRITES", "12"))
+TOURNAMENT_GRADE_RETRIES = int(os.getenv("TOURNAMENT_GRADE_RETRIES", "1"))   # re-asks for answers a reply left out
+CRITERIA = ("relevance", "completeness", "style", "conciseness")
+
+GRADE_BATCH_SYSTEM = """\
+You are an unbiased evaluator. You'll receive:
+- Task description
+- Baseline answer O
+- Numbered candidate answers
+
+Score EVERY answer, including O, on each criterion with an integer 1-5 (higher is better) and return ONLY strict JSON:
+
+{
+  "scores": [
+    { "id": "O", "relevance": <int>, "completeness": <int>, "style": <int>, "conciseness": <int> },
+    { "id": "1", "relevance": <int>, "completeness": <int>, "style": <int>, "conciseness": <int> }
+  ]
+}
+No extra text.
+"""
+
+class GradeReplyError(ValueError):
+    """The grader's reply still lacked scores for some answers after re-asking."""
+
+async def grade_call(task_description: str | None, baseline: str,
+                     candidates: dict[str, str]) -> dict[str, dict[str, int]]:
+    """One grading call; returns the usable scores by answer id (possibly not all of them)."""
+    grading_payload = f"""
+Task: {task_description or 'Use the prompt itself to infer the task.'}
+
+Answer O:
+{baseline}
+
+""" + "\n\n".join(f"Answer {i}:\n{text}" for i, text in candidates.items())
+    with stage("compare_grade"):
+        raw = (await call_groq_with_retry_async(
+            model=MODEL,
+            temperature=0.0,
+            messages=[
+                {"role":"system","content":GRADE_BATCH_SYSTEM},
+                {"role":"user","content":grading_payload}
+            ],
+            hedge="compare_grade"
+        )).choices[0].message.content
+
+    with stage("compare_parse"):
+        scores = {}
+        for s in extract_json(raw, dict).get("scores") or []:
+            try:
+                scores[str(s["id"])] = {c: int(s[c]) for c in CRITERIA}
+            except (KeyError, TypeError, ValueError):
+                continue        # an entry we can't read counts as missing
+        return scores
+
+async def grade_batch(task_description: str | None, baseline: str,
+                      candidates: list[str]) -> tuple[dict[str, int], list[dict[str, int]], int]:
+    """
+    Grade the baseline and up to TOURNAMENT_GRADE_BATCH candidates in one
+    call. Answers the reply leaves out (or garbles) are asked for again, up
+    to TOURNAMENT_GRADE_RETRIES times; then GradeReplyError. Returns the
+    baseline's scores, each candidate's, and the number of grading calls.
+    """
+    ids = {str(i): text for i, text in enumerate(candidates, 1)}
+    scores: dict[str, dict[str, int]] = {}
+    calls = 0
+    missing = ["O", *ids]
+    while missing and calls <= TOURNAMENT_GRADE_RETRIES:
+        calls += 1
+        try:
+            got = await grade_call(task_description, baseline, {i: ids[i] for i in missing if i != "O"})
+        except ValueError:      # no JSON object in the reply (includes JSONDecodeError)
+            got = {}
+        for i in missing:
+            if i in got:
+                scores[i] = got[i]
+        missing = [i for i in missing if i not in scores]
+    if missing:
+        raise GradeReplyError(f"grader returned no usable scores for answer(s) {', '.join(missing)} "
+                              f"after {calls} attempts")
+    return scores["O"], [scores[i] for i in ids], calls
+
+@app.post("/compare/tournament", response_model=TournamentResponse)
+async def compare_tournament(req: TournamentRequest):
+    """
+    One original vs N rewrites (e.g. one per mode). All answers are generated
+    concurrently, the original's answer is memoized, identical rewrites are
+    answered once, and candidates are graded against the original in batches
+    of TOURNAMENT_GRADE_BATCH — about N+2 upstream calls instead of 3N.
+    Each batch is graded as soon as its answers are in.
+    """
+    if not 1 <= len(req.rewrites) <= TOURNAMENT_MAX_REWRITES:
+        raise HTTPException(422, detail=f"rewrites must have 1-{TOURNAMENT_MAX_REWRITES} entries")
+    t0 = time.perf_counter()
+    unique = list(dict.fromkeys(req.rewrites))
+    original = asyncio.ensure_future(timed(answer_prompt(req.original_prompt)))
+    answers = {p: asyncio.ensure_future(timed(answer_prompt(p))) for p in unique}
+
+    async def run_batch_grade(batch: list[str]):
+        (baseline, _), _ = await original
+        texts = [(await answers[p])[0][0] for p in batch]
+        return await timed(grade_batch(req.task_description, baseline, texts))
+
+    batches = [unique[i:i + TOURNAMENT_GRADE_BATCH] for i in range(0, len(unique), TOURNAMENT_GRADE_BATCH)]
+    try:
+        graded = await asyncio.gather(*(run_batch_grade(b) for b in batches))
+    except UPSTREAM_ERRORS:
+        raise HTTPException(status_code=503, detail=UPSTREAM_503)
+    except GradeReplyError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    finally:
+        for f in (original, *answers.values()):
+            f.cancel()
+
+    (answer_original, original_cached), original_ms = original.result()
+    scored: dict[str, tuple[dict[str, int], dict[str, int]]] = {}
+    for batch, ((base_scores, cand_scores, _), _) in zip(batches, graded):
+        for p, cand in zip(batch, cand_scores):
+            scored[p] = (base_scores, cand)
+
+    ranking = []
+    for index, p in enumerate(req.rewrites):
+        base_scores, cand = scored[p]
+        (answer, _), _ = answers[p].result()
+        ranking.append(RankedRewrite(
+            rank=0, index=index, rewritten_prompt=p, answer=answer,
+            criteria=[Criterion(name=c, score_original=base_scores[c], score_rewrite=cand[c]) for c in CRITERIA],
+            total_original=sum(base_scores.values()), total_rewrite=sum(cand.values()),
+        ))
+    ranking.sort(key=lambda r: (-r.total_rewrite, r.index))
+    for rank, r in enumerate(ranking, 1):
+        r.rank = rank
+    if ranking:
+        best = ranking[0]
+        await learn_pair(req.original_prompt, best.rewritten_prompt, best.total_original, best.total_rewrite)
+
+    # only answers this request led count: a cache hit or a joined call cost it nothing
+    answered_upstream = sum(not f.result()[0][1] for f in (original, *answers.values()))
+    return TournamentResponse(
+        answer_original=answer_original,
+        ranking=ranking,
+        upstream_calls=answered_upstream + sum(calls for (_, _, calls), _ in graded),
+        timings={
+            "answer_original_ms": original_ms,
+            "answers_ms":         max(f.result()[1] for f in (original, *answers.values())),
+            "grading_ms":         max(ms for _, ms in graded),
+            "total_ms":           (time.perf_counter() - t0) * 1000,
+        },
+    )
+
+
+async def templates_job(params: dict, progress) -> dict:
+    templates = await generate_templates_for_industry_async(params["industry"], params["count"], progress)
+    await template_store.add(params["industry"], templates)
+    return {"industry": params["industry"], "templates": templates}
+
+async def templates_grow_job(params: dict, progress) -> dict:
+    added = await template_refresher.grow(params["industry"], params["wanted"])
+    return {"industry": params["industry"], "added": added}
+
+jobs = jobs_from_env()
+jobs.register("templates", templates_job)
+jobs.register("templates_grow", templates_grow_job)
+
+
+async def submit_templates_job(industry: str, count: int) -> dict:
+    """Queue generation for ``industry``; an identical pending job is reused."""
+    return await jobs.submit("templates", {"industry": industry, "count": count},
+                       dedup_key=f"templates:{normalize_industry(industry)}:{count}")
+
+async def request_templates_growth(industry: str, wanted: int) -> None:
+    """
+    Ask for ``industry`` to be grown to ``wanted`` templates. Goes through the
+    job queue rather than process-local state so any worker can serve it; a
+    grow job already pending for the industry absorbs the request.
+    """
+    if wanted > template_refresher.max_per_industry:
+        wanted = template_refresher.max_per_industry
+    if template_store.count(industry) < wanted:
+        await jobs.submit("templates_grow", {"industry": industry, "wanted": wanted},
+                          dedup_key=f"templates_grow:{normalize_industry(industry)}")
 
 @app.post(
   "/templates",
   response_model=list[TemplateOut]
 )
 async def templates_endpoint(req: TemplateRequest):
-    try:
-        templates = generate_templates_for_industry(req.industry, req.count)
-        # ensure each dict has exactly the keys: "topic", "user_prompt"
-        return templates
-    except Exception as e:
-        print(e)
-        raise HTTPException(500, detail=str(e))
\ No newline at end of file
+    """
+    Served from the precomputed catalog. An industry the store has never seen
+    is generated once on the job queue (concurrent misses share the job) and
+    stored; a page that runs past what's stored queues a job to grow the
+    industry to that size (up to TEMPLATE_MAX_PER_INDUSTRY), and is served
+    short meanwhile. Clients that don't want to hold the
+    request open use /templates/jobs.
+    """
+    items, total = await template_store.page(req.industry, req.offset, req.count)
+    if total == 0:
+        job = await jobs.wait((await submit_templates_job(req.industry, req.count))["id"])
+        if job["status"] != "done":
+            raise HTTPException(500, detail=job["error"] or f"template job {job['status']}")
+        items, total = await template_store.page(req.industry, req.offset, req.count)
+    elif total < req.offset + req.count:
+        await request_templates_growth(req.industry, req.offset + req.count)
+    return [{"topic": t["topic"], "user_prompt": t["user_prompt"]} for t in items]
+
+@app.post("/templates/jobs", status_code=202)
+async def templates_job_submit(req: TemplateRequest):
+    """Queue generation and return the job at once; poll it or follow its events."""
+    return await submit_templates_job(req.industry, req.count)
+
+@app.get("/templates/jobs/{job_id}")
+async def templates_job_status(job_id: str):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Unknown job")
+    return job
+
+@app.get("/templates/jobs/{job_id}/events")
+async def templates_job_events(job_id: str):
+    """SSE: ``topics``, then ``topic_done``/``topic_failed`` per topic, then ``done``/``failed``/``cancelled``."""
+    if await jobs.get(job_id) is None:
+        raise HTTPException(404, detail="Unknown job")
+
+    async def events():
+        async for event, data in jobs.follow(job_id):
+            yield sse(event, data)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.delete("/templates/jobs/{job_id}")
+async def templates_job_cancel(job_id: str):
+    """200 with the final state, or 202 while the worker running it elsewhere gets to it."""
+    job = await jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Unknown job")
+    if job["status"] == "running":
+        return JSONResponse(job, status_code=202)
+    return job
+
+@app.get("/templates/catalog", response_model=TemplatePage)
+async def templates_catalog(industry: str, offset: int = 0, limit: int = 20):
+    """Read-only page of the stored catalog; never triggers generation."""
+    limit = max(1, min(limit, 100))
+    items, total = await template_store.page(industry, max(0, offset), limit)
+    return {"industry": industry, "total": total, "offset": offset, "limit": limit, "items": items}
+
+@app.get("/templates/industries")
+async def templates_industries():
+    return template_store.industries()
+
+@app.get("/templates/stats")
+async def templates_stats():
+    return {**template_store.stats(), "refresh": template_refresher.stats(), "jobs": jobs.stats()}
+
+metrics.Gauge("template_store", "Template catalog counters", ("stat",),
+              fn=lambda: {k: v for k, v in template_store.stats().items() if k != "persistent"})
+metrics.Gauge("template_jobs", "Template job queue counters", ("stat",), fn=jobs.stats)
@@ -0,0 +1,218 @@
+# metrics.py
+"""
+Minimal Prometheus text-format metrics, no client library needed.
+
+    REQUESTS.inc(endpoint="/compare", status="200")
+    with stage("groq_call"):
+        ...
+
+``render()`` produces the body served at ``GET /metrics``. Values computed at
+scrape time (cache stats, threadpool usage…) are registered with
+``Gauge(..., fn=...)``.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+import tracing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY: list = []
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *a, fn: Callable[[], float | dict] | None = None, **kw):
+        super().__init__(*a, **kw)
+        self._values: dict[tuple, float] = {}
+        self.fn = fn
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        if self.fn is not None:
+            value = self.fn()
+            # a dict return maps the single label's value → sample
+            if isinstance(value, dict):
+                self._values = {(str(k),): v for k, v in value.items()}
+            else:
+                self._values = {(): value}
+        return self.header() + [
+            f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *a, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kw):
+        super().__init__(*a, **kw)
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}   # key → [bucket counts…, sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, series in self._series.items():
+            for bound, n in zip(self.buckets, series):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {n}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(line for m in REGISTRY for line in m.render()) + "\n"
+
+
+# ─── Core metrics ───
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "End-to-end handler latency", ("endpoint",))
+REQUESTS = Counter(
+    "http_requests_total", "Requests by endpoint and status", ("endpoint", "status"))
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds", "Latency of internal/upstream stages", ("stage",))
+STAGE_ERRORS = Counter(
+    "stage_errors_total", "Stages that raised", ("stage",))
+UPSTREAM_503 = Counter(
+    "upstream_unavailable_total", "Requests answered with 503 because Groq gave up", ("endpoint",))
+TOKENS = Counter(
+    "groq_tokens_total", "Tokens reported by Groq usage", ("kind",))
+TTFT = Histogram(
+    "stream_time_to_first_token_seconds", "Time to first streamed token")
+LOOP_LAG = Gauge(
+    "event_loop_lag_seconds", "Scheduling delay of the event loop (last sample)")
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into ``stage_duration_seconds`` and open a trace span."""
+    t0 = time.perf_counter()
+    with tracing.span(name):
+        try:
+            yield
+        except BaseException:
+            STAGE_ERRORS.inc(stage=name)
+            raise
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - t0, stage=name)
+
+
+def record_usage(resp) -> None:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return
+    TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+    TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind="completion")
+
+
+async def watch_event_loop(interval: float = 0.5) -> None:
+    """Background task: how late does a ``sleep(interval)`` wake up?"""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.set(max(0.0, time.perf_counter() - t0 - interval))
+
+
+def _threadpool_usage() -> dict:
+    import anyio.to_thread
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {"borrowed": limiter.borrowed_tokens, "total": limiter.total_tokens}
+
+
+THREADPOOL = Gauge(
+    "threadpool_tokens", "Starlette/anyio worker threads (borrowed vs total)", ("state",),
+    fn=_threadpool_usage)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware so streaming responses are timed until the last
+    byte, not just until headers go out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        with tracing.span(f"{scope['method']} {scope['path']}", root=True):
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # label by route template, not raw path, to keep cardinality bounded
+                route = scope.get("route")
+                endpoint = route.path if route is not None else "<unmatched>"
+                REQUEST_LATENCY.observe(time.perf_counter() - t0, endpoint=endpoint)
+                REQUESTS.inc(endpoint=endpoint, status=str(status["code"]))
+                if status["code"] == 503:
+                    UPSTREAM_503.inc(endpoint=endpoint)
@@ -1,5 +1,5 @@
 # app/models.py  (if you keep models separately)
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class CompareRequest(BaseModel):
     original_prompt: str
@@ -17,11 +17,40 @@ class CompareResponse(BaseModel):
     criteria: list[Criterion]
     total_original: int
     total_rewrite: int
+    timings: dict[str, float] | None = None   # per-stage wall time in ms
+
+class TournamentRequest(BaseModel):
+    original_prompt: str
+    rewrites: list[str]                   # e.g. one per mode tried on the same original
+    task_description: str | None = None
+
+class RankedRewrite(BaseModel):
+    rank: int
+    index: int                            # position in the request's ``rewrites``
+    rewritten_prompt: str
+    answer: str
+    criteria: list[Criterion]
+    total_original: int                   # the original's total in this rewrite's grading batch
+    total_rewrite: int
+
+class TournamentResponse(BaseModel):
+    answer_original: str
+    ranking: list[RankedRewrite]          # best first
+    upstream_calls: int
+    timings: dict[str, float] | None = None
 
 class TemplateRequest(BaseModel):
     industry: str
-    count: int = 5
+    count: int = Field(5, ge=1, le=100)   # same cap as /templates/catalog's limit
+    offset: int = Field(0, ge=0)          # page through the stored catalog
 
 class TemplateOut(BaseModel):
     topic:       str
     user_prompt: str
+
+class TemplatePage(BaseModel):
+    industry: str
+    total:    int
+    offset:   int
+    limit:    int
+    items:    list[TemplateOut]
@@ -0,0 +1,103 @@
+# prompt_budget.py
+"""
+Token accounting for /prompt-assist prompts.
+
+``TokenCounter`` counts with a local tokenizer and memoizes per string, so
+conversation turns that are re-sent on every request are tokenized once
+(the character heuristic is cheaper than the lookup and isn't memoized).
+``fit_context`` keeps the most recent context turns that still fit in what
+is left of the upstream model's prompt budget.
+
+    PROMPT_TOKENIZER=tiktoken:cl100k_base      # or hf:/path/to/tokenizer.json
+    PROMPT_BUDGETS={"llama-3.3-70b-versatile": 6000}
+    PROMPT_BUDGET_DEFAULT=6000
+
+Without ``PROMPT_TOKENIZER`` counts fall back to ~4 characters per token, the
+same estimate the scheduler charges against the TPM bucket. The tokenizer
+packages are optional: ``pip install -r requirements-tokenizer.txt``.
+"""
+import json
+import math
+import os
+from functools import lru_cache
+from typing import Callable
+
+import metrics
+
+CONTEXT_DROPPED = metrics.Counter(
+    "prompt_context_turns_dropped_total", "Context turns trimmed to fit the prompt budget", ("model",))
+
+
+def heuristic_count(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def load_encoder(spec: str) -> Callable[[str], int]:
+    """``tiktoken:<encoding>`` or ``hf:<tokenizer.json path>``; empty → heuristic."""
+    if not spec:
+        return heuristic_count
+    kind, _, name = spec.partition(":")
+    if kind == "tiktoken":
+        import tiktoken
+
+        enc = tiktoken.get_encoding(name or "cl100k_base")
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    if kind == "hf":
+        from tokenizers import Tokenizer
+
+        tok = Tokenizer.from_file(name)
+        return lambda text: len(tok.encode(text, add_special_tokens=False).ids)
+    raise ValueError(f"unknown PROMPT_TOKENIZER {spec!r} (expected tiktoken:… or hf:…)")
+
+
+class TokenCounter:
+    def __init__(self, encode: Callable[[str], int], cache_size: int = 8192):
+        self.memoized = encode is not heuristic_count
+        self.count = lru_cache(maxsize=cache_size)(encode) if self.memoized else encode
+
+    def messages(self, messages: list[dict]) -> int:
+        # ~4 tokens of chat framing per message
+        return sum(self.count(m.get("content") or "") + 4 for m in messages)
+
+    def stats(self) -> dict:
+        if not self.memoized:
+            return {}
+        info = self.count.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
+
+
+class PromptTooLong(ValueError):
+    def __init__(self, tokens: int, budget: int, model: str):
+        super().__init__(f"Prompt needs ~{tokens} tokens but {model} allows {budget}; please shorten it.")
+        self.tokens, self.budget, self.model = tokens, budget, model
+
+
+def fit_context(turns: list[str], available: int, count: Callable[[str], int],
+                max_turns: int, model: str = "") -> list[str]:
+    """
+    Newest-first: keep up to ``max_turns`` recent turns whose tokens fit in
+    ``available``, stopping at the first that doesn't so the kept turns stay
+    contiguous. Returned in original order. Pass ``model`` to count the
+    dropped turns in ``prompt_context_turns_dropped_total``.
+    """
+    kept: list[str] = []
+    for turn in reversed(turns[-max_turns:] if max_turns else []):
+        cost = count(turn) + 1      # joining newline
+        if cost > available:
+            break
+        kept.append(turn)
+        available -= cost
+    dropped = min(len(turns), max_turns) - len(kept)
+    if dropped and model:
+        CONTEXT_DROPPED.inc(dropped, model=model)
+    return kept[::-1]
+
+
+def budgets_from_env() -> tuple[dict[str, int], int]:
+    return (
+        {k: int(v) for k, v in json.loads(os.getenv("PROMPT_BUDGETS", "{}")).items()},
+        int(os.getenv("PROMPT_BUDGET_DEFAULT", "6000")),
+    )
+
+
+counter = TokenCounter(load_encoder(os.getenv("PROMPT_TOKENIZER", "")))
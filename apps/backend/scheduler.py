@@ -0,0 +1,306 @@
+# scheduler.py
+"""
+Shared upstream-call scheduler.
+
+Every Groq call from the async handlers goes through ``scheduler.call`` so
+the process has one view of upstream pressure:
+
+• token buckets for requests/min and tokens/min (bursts queue, not fail),
+  held in the shared store when there is one so all workers draw on one budget
+• an AIMD concurrency limit that shrinks on errors or rising latency
+• retries with full-jitter backoff that honour ``Retry-After`` on 429
+• a circuit breaker that fails fast while Groq is down
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable
+
+import groq
+
+import shared
+
+RETRYABLE = (
+    groq.InternalServerError,
+    groq.RateLimitError,
+    groq.APIConnectionError,   # includes APITimeoutError
+)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling upstream while the circuit is open."""
+
+
+def retry_after_seconds(e: Exception) -> float | None:
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages: list[dict], max_completion: int = 512) -> int:
+    """Cheap pre-call estimate (~4 chars/token); corrected from ``usage`` afterwards."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + max_completion
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:          # FIFO: later callers queue behind this one
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    async def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) after the real cost is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    async def drain(self) -> None:
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class SharedTokenBucket:
+    """
+    ``TokenBucket`` whose state lives in a shared.py store, so every worker
+    process draws on the same budget. ``tokens`` is the last value seen and
+    is only for stats.
+    """
+
+    def __init__(self, store, name: str, per_minute: float):
+        self.store = store
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._lock = asyncio.Lock()
+
+    def _apply(self, op: str, amount: float) -> float:
+        wait, self.tokens = self.store.bucket(self.name, self.rate, self.capacity, op, amount)
+        return wait
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:          # local FIFO; other workers race at the store
+            while True:
+                wait = await asyncio.to_thread(self._apply, "take", amount)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    # the store round-trip (BEGIN IMMEDIATE on SQLite, a network hop on Redis)
+    # stays off the event loop, as in ``acquire``
+    async def adjust(self, delta: float) -> None:
+        await asyncio.to_thread(self._apply, "charge", delta)
+
+    async def drain(self) -> None:
+        await asyncio.to_thread(self._apply, "drain", 0.0)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            raise UpstreamUnavailable("circuit open: upstream failing, not calling")
+        if state == "half_open":
+            self._probing = True
+
+    def record(self, ok: bool) -> None:
+        if ok:
+            self.failures = 0
+            self.opened_at = None
+        else:
+            self.failures += 1
+            if self.failures >= self.threshold or self._probing:
+                self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """Free the half-open slot when a call ends without a verdict (cancelled, 4xx)."""
+        self._probing = False
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit. +1/limit per healthy call; ×0.7 on an error and
+    ×0.9 while the short-term latency average runs above ``tolerance`` × the
+    long-term one (upstream is queueing). Averages rather than single samples
+    so normal latency jitter doesn't collapse the limit.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, tolerance: float = 1.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.short_latency: float | None = None
+        self.long_latency: float | None = None
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, latency: float | None, ok: bool) -> None:
+        if not ok or latency is None:
+            self.limit = max(self.minimum, self.limit * 0.7)
+            return
+        if self.long_latency is None:
+            self.short_latency = self.long_latency = latency
+        else:
+            self.short_latency += 0.2 * (latency - self.short_latency)
+            self.long_latency += 0.01 * (latency - self.long_latency)
+        if self.short_latency > self.long_latency * self.tolerance:
+            self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+
+class UpstreamScheduler:
+    def __init__(
+        self,
+        rpm: float,
+        tpm: float,
+        max_attempts: int = 4,
+        initial_concurrency: int = 16,
+        min_concurrency: int = 2,
+        max_concurrency: int = 64,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 20.0,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 20.0,
+        store=None,
+    ):
+        if store is not None:
+            self.requests = SharedTokenBucket(store, "groq:rpm", rpm)
+            self.tokens = SharedTokenBucket(store, "groq:tpm", tpm)
+        else:
+            self.requests = TokenBucket(rpm)
+            self.tokens = TokenBucket(tpm)
+        self.limit = AdaptiveLimit(initial_concurrency, min_concurrency, max_concurrency)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.counts = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0, "short_circuited": 0}
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Awaitable], est_tokens: int = 0):
+        """
+        Run ``fn()`` (a zero-arg coroutine factory) under the limits above.
+        Retryable errors are retried up to ``max_attempts``; the last one is
+        re-raised unchanged so callers keep their existing handling.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            await self.requests.acquire(1)
+            if est_tokens:
+                await self.tokens.acquire(est_tokens)
+            try:
+                self.breaker.before_call()
+            except UpstreamUnavailable:
+                self.counts["short_circuited"] += 1
+                raise
+
+            wait = None
+            async with self.limit:
+                self.counts["calls"] += 1
+                t0 = time.monotonic()
+                try:
+                    result = await fn()
+                except RETRYABLE as e:
+                    self.limit.record(None, ok=False)
+                    if isinstance(e, groq.RateLimitError):
+                        self.counts["rate_limited"] += 1
+                        wait = retry_after_seconds(e)
+                        await self.requests.drain()  # everyone else backs off too
+                        self.breaker.record(ok=True)  # throttled, but alive
+                    else:
+                        self.breaker.record(ok=False)
+                    if attempt == self.max_attempts:
+                        self.counts["failures"] += 1
+                        raise
+                    self.counts["retries"] += 1
+                else:
+                    self.limit.record(time.monotonic() - t0, ok=True)
+                    self.breaker.record(ok=True)
+                    usage = getattr(result, "usage", None)
+                    if est_tokens and usage is not None and getattr(usage, "total_tokens", None):
+                        await self.tokens.adjust(usage.total_tokens - est_tokens)
+                    return result
+                finally:
+                    self.breaker.release_probe()
+
+            await asyncio.sleep(wait if wait is not None else self._backoff(attempt))
+
+    def stats(self) -> dict:
+        return {
+            **self.counts,
+            "concurrency_limit": round(self.limit.limit, 2),
+            "in_flight":         self.limit.in_flight,
+            "circuit":           self.breaker.state,
+            "rpm_available":     round(self.requests.tokens, 1),
+            "tpm_available":     round(self.tokens.tokens, 1),
+            "budget":            "shared" if isinstance(self.requests, SharedTokenBucket) else "local",
+        }
+
+
+def from_env() -> UpstreamScheduler:
+    return UpstreamScheduler(
+        rpm=float(os.getenv("GROQ_RPM", "300")),
+        tpm=float(os.getenv("GROQ_TPM", "300000")),
+        max_attempts=int(os.getenv("GROQ_MAX_ATTEMPTS", "4")),
+        initial_concurrency=int(os.getenv("GROQ_CONCURRENCY", "16")),
+        min_concurrency=int(os.getenv("GROQ_MIN_CONCURRENCY", "2")),
+        max_concurrency=int(os.getenv("GROQ_MAX_CONCURRENCY", "64")),
+        breaker_threshold=int(os.getenv("GROQ_BREAKER_THRESHOLD", "5")),
+        breaker_cooldown=float(os.getenv("GROQ_BREAKER_COOLDOWN", "20")),
+        store=shared.store,
+    )
+
+
+scheduler = from_env()
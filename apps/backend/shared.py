@@ -0,0 +1,196 @@
+# shared.py
+"""
+State shared between uvicorn worker processes.
+
+With ``WEB_CONCURRENCY`` > 1 every worker is its own process, so the response
+cache and the upstream rate-limit buckets would otherwise be per worker (N
+workers → N × GROQ_RPM against one Groq key). ``SHARED_STORE`` points them
+all at one store:
+
+    SHARED_STORE=sqlite:////var/run/prettyprompt/shared.sqlite3   # one host, no extra service
+    SHARED_STORE=redis://localhost:6379/0                         # pip install -r requirements-redis.txt
+
+Unset, a single worker keeps everything in-process and several workers
+default to a SQLite file in the temp directory (``SHARED_STORE=off`` opts
+out). The SQLite store is the local stand-in for Redis: both offer the same
+two things, a TTL'd key/value tier for the response cache and an atomic
+token-bucket update for the scheduler.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from cache import RedisCache, SQLiteCache
+
+# Redis side of ``bucket_step``; uses the server clock so every host agrees
+BUCKET_LUA = """
+local rate, cap, op, amount = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or cap
+local updated = tonumber(state[2]) or now
+tokens = math.min(cap, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if op == 'take' then
+  if tokens >= amount then tokens = tokens - amount else wait = (amount - tokens) / rate end
+elseif op == 'charge' then
+  tokens = math.min(cap, tokens - amount)
+elseif op == 'drain' then
+  tokens = math.min(tokens, 0)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(cap / rate) + 60)
+return {tostring(wait), tostring(tokens)}
+"""
+
+
+def bucket_step(tokens: float, updated: float, now: float, rate: float, capacity: float,
+                op: str, amount: float) -> tuple[float, float]:
+    """
+    One token-bucket update: refill since ``updated``, then ``take`` (deduct
+    ``amount`` if available, else report the wait), ``charge`` (deduct or
+    refund unconditionally) or ``drain`` (empty it). Returns ``(tokens, wait)``.
+    """
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    wait = 0.0
+    if op == "take":
+        if tokens >= amount:
+            tokens -= amount
+        else:
+            wait = (amount - tokens) / rate
+    elif op == "charge":
+        tokens = min(capacity, tokens - amount)
+    elif op == "drain":
+        tokens = min(tokens, 0.0)
+    return tokens, wait
+
+
+class SQLiteStore:
+    """One SQLite file (WAL) that every worker on the host opens."""
+
+    kind = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def cache_tier(self, ttl: float) -> SQLiteCache:
+        return SQLiteCache(self.path, ttl)
+
+    def bucket(self, name: str, rate: float, capacity: float, op: str, amount: float) -> tuple[float, float]:
+        """Apply ``bucket_step`` atomically across processes; returns ``(wait, tokens)``."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens, wait = bucket_step(*(row or (capacity, now)), now, rate, capacity, op, amount)
+                conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (name, tokens, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return wait, tokens
+
+    def lock_dir(self) -> str:
+        return os.path.dirname(os.path.abspath(self.path))
+
+    def describe(self) -> str:
+        return f"sqlite:///{self.path}"
+
+
+class RedisStore:
+    """Redis, or anything that speaks its protocol and runs Lua (Valkey, KeyDB, …)."""
+
+    kind = "redis"
+
+    def __init__(self, url: str, prefix: str = "prettyprompt:"):
+        import redis
+
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._bucket = self.client.register_script(BUCKET_LUA)
+
+    def cache_tier(self, ttl: float) -> RedisCache:
+        return RedisCache(self.client, ttl, prefix=f"{self.prefix}cache:")
+
+    def bucket(self, name: str, rate: float, capacity: float, op: str, amount: float) -> tuple[float, float]:
+        wait, tokens = self._bucket(keys=[f"{self.prefix}bucket:{name}"], args=[rate, capacity, op, amount])
+        return float(wait), float(tokens)
+
+    def lock_dir(self) -> str:
+        return tempfile.gettempdir()
+
+    def describe(self) -> str:
+        # drop credentials
+        scheme, _, rest = self.url.partition("://")
+        return f"{scheme}://{rest.rpartition('@')[2]}"
+
+
+_held_locks: dict[str, object] = {}
+
+
+def acquire_leadership(name: str = "background") -> bool:
+    """
+    True in exactly one worker per host (always, without a shared store).
+    Background jobs — the template refresher, job recovery — run only
+    there so workers don't repeat each other's work.
+    The lock is an ``flock`` held for the life of the process, so a worker
+    that replaces a dead leader picks it up.
+    """
+    if store is None:
+        return True
+    if name in _held_locks:
+        return True
+    import fcntl
+
+    f = open(os.path.join(store.lock_dir(), f"prettyprompt-{name}.lock"), "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _held_locks[name] = f
+    return True
+
+
+def stats() -> dict:
+    return {
+        "pid":     os.getpid(),
+        "store":   store.describe() if store is not None else None,
+        "leader":  sorted(_held_locks),
+    }
+
+
+def from_env():
+    url = os.getenv("SHARED_STORE", "")
+    if not url and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        url = "sqlite:///" + os.path.join(tempfile.gettempdir(), "prettyprompt-shared.sqlite3")
+    if not url or url == "off":
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    raise ValueError(f"unsupported SHARED_STORE {url!r} (expected sqlite:///… or redis://…)")
+
+
+store = from_env()
@@ -0,0 +1,78 @@
+# singleflight.py
+"""
+Request coalescing: concurrent callers with the same key share one upstream
+call instead of each starting their own.
+"""
+import asyncio
+import hashlib
+import json
+import re
+from typing import Awaitable, Callable
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def request_key(messages: list[dict], variant: str = "") -> str:
+    """
+    Key over the messages that will actually be sent (whitespace-normalized),
+    so requests only coalesce when their upstream calls would be identical;
+    ``variant`` separates anything else that changes the call (model, few-shot).
+    """
+    payload = json.dumps(
+        {
+            "messages": [{"role": m["role"], "content": normalize_text(m["content"])} for m in messages],
+            "variant":  variant,
+        },
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: dict[str, list] = {}    # key → [task, waiters]
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        """
+        Run ``fn()`` once per key at a time; later callers await the same task.
+        The task is shielded so a disconnecting caller doesn't cancel it for
+        everyone else waiting on it; when the last waiter goes, it is
+        cancelled, so nobody pays for an upstream call no one will read.
+        """
+        return (await self.do_led(key, fn))[0]
+
+    async def do_led(self, key: str, fn: Callable[[], Awaitable]) -> tuple[object, bool]:
+        """``do``, plus whether this caller started the call (True) or joined one in flight."""
+        entry = self._inflight.get(key)
+        led = entry is None
+        if entry is None:
+            self.leaders += 1
+            entry = [asyncio.create_task(fn()), 0]
+            self._inflight[key] = entry
+            entry[0].add_done_callback(lambda _: self._forget(key, entry))
+        else:
+            self.coalesced += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task), led
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                self._forget(key, entry)    # later callers start afresh
+                task.cancel()
+
+    def _forget(self, key: str, entry: list) -> None:
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "leaders":   self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
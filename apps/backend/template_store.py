@@ -0,0 +1,261 @@
+# template_store.py
+"""
+Precomputed template catalog for /templates.
+
+Templates generated by the agent pipeline are kept in SQLite
+(``TEMPLATE_DB_PATH``) and mirrored into an in-process index keyed by
+normalized industry (and topic, for dedup), so a request is a dict lookup
+plus a list slice. ``TemplateRefresher`` runs in the background and tops up
+industries that have fewer than ``TEMPLATE_MIN_PER_INDUSTRY`` templates;
+live generation is only the fallback for an industry the store has never
+seen.
+
+Other workers write to the same database, so ``page`` re-reads an industry
+from SQLite when it is short of the requested page or its copy is older than
+``TEMPLATE_RELOAD_SECONDS``. SQLite I/O runs in a thread, off the event loop.
+"""
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDUSTRIES = ("E-commerce", "Healthcare", "Legal", "Finance", "Education")
+SHORT_RELOAD_SECONDS = 1.0      # re-read a short industry at most this often
+
+
+def normalize(name: str) -> str:
+    return re.sub(r"\s+", " ", name).strip().casefold()
+
+
+class TemplateStore:
+    def __init__(self, db_path: str | None, reload_seconds: float = 60.0):
+        self.db_path = db_path
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._by_industry: dict[str, list[dict]] = {}
+        self._topics: dict[str, set[str]] = {}
+        self._names: dict[str, str] = {}        # normalized → display name
+        self._loaded_at: dict[str, float] = {}  # normalized → last read from SQLite
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        # awaited with the newly stored entries after every ``add``
+        self.listeners: list = []
+        self._conn = None
+        self._opened = False
+
+    def open(self) -> None:
+        """Connect and load the index; called from the lifespan, or on first use."""
+        if self._opened:
+            return
+        with self._lock:
+            if self._opened:
+                return
+            self._opened = True
+            if not self.db_path:
+                return
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS templates ("
+                " id TEXT PRIMARY KEY, industry_key TEXT NOT NULL, industry TEXT NOT NULL,"
+                " topic TEXT NOT NULL, user_prompt TEXT NOT NULL, created_at REAL NOT NULL,"
+                " UNIQUE (industry_key, topic))"
+            )
+            self._load()
+
+    async def _ensure_open(self) -> None:
+        if not self._opened:
+            await asyncio.to_thread(self.open)
+
+    def _load(self, key: str | None = None) -> int:
+        """Index rows not seen yet, for one industry or all; caller holds ``_lock``."""
+        sql = "SELECT id, industry_key, industry, topic, user_prompt, created_at FROM templates"
+        rows = self._conn.execute(
+            sql + (" WHERE industry_key = ?" if key else "") + " ORDER BY created_at, rowid",
+            (key,) if key else (),
+        ).fetchall()
+        loaded = 0
+        for id_, key_, industry, topic, prompt, created in rows:
+            if normalize(topic) in self._topics.get(key_, ()):
+                continue
+            self._index(key_, {"id": id_, "industry": industry, "topic": topic,
+                               "user_prompt": prompt, "created_at": created})
+            loaded += 1
+        now = time.time()
+        if key is not None:
+            self._loaded_at[key] = now
+        else:
+            self._loaded_at = dict.fromkeys(self._by_industry, now)
+            logger.info("template store: %d templates across %d industries", loaded, len(self._by_industry))
+        return loaded
+
+    def _index(self, key: str, entry: dict) -> None:
+        self._by_industry.setdefault(key, []).append(entry)
+        self._topics.setdefault(key, set()).add(normalize(entry["topic"]))
+        self._names.setdefault(key, entry["industry"])
+
+    async def add(self, industry: str, templates: list[dict]) -> int:
+        """Store ``{topic, user_prompt}`` dicts; topics already present are skipped."""
+        await self._ensure_open()
+        fresh = await asyncio.to_thread(self._add, industry, templates)
+        if fresh:
+            for listener in self.listeners:
+                await listener(fresh)
+        return len(fresh)
+
+    def _add(self, industry: str, templates: list[dict]) -> list[dict]:
+        key = normalize(industry)
+        now = time.time()
+        fresh = []
+        with self._lock:
+            seen = self._topics.setdefault(key, set())
+            for t in templates:
+                topic = normalize(t["topic"])
+                if topic in seen:
+                    continue
+                entry = {"id": uuid.uuid4().hex, "industry": industry, "topic": t["topic"],
+                         "user_prompt": t["user_prompt"], "created_at": now}
+                self._index(key, entry)
+                fresh.append(entry)
+            if self._conn is not None and fresh:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO templates VALUES (?, ?, ?, ?, ?, ?)",
+                    [(e["id"], key, e["industry"], e["topic"], e["user_prompt"], e["created_at"]) for e in fresh],
+                )
+        return fresh
+
+    def entries(self) -> list[dict]:
+        self.open()
+        with self._lock:
+            return [e for items in self._by_industry.values() for e in items]
+
+    def count(self, industry: str) -> int:
+        self.open()
+        return len(self._by_industry.get(normalize(industry), ()))
+
+    async def page(self, industry: str, offset: int = 0, limit: int = 20) -> tuple[list[dict], int]:
+        """``(items, total)`` for one industry, oldest first so pages are stable as it grows."""
+        await self._ensure_open()
+        key = normalize(industry)
+        if self._conn is not None:
+            # other workers may have added to it since we last read it
+            short = len(self._by_industry.get(key, ())) < offset + limit
+            age = time.time() - self._loaded_at.get(key, 0.0)
+            if age >= (SHORT_RELOAD_SECONDS if short else self.reload_seconds):
+                await asyncio.to_thread(self._reload, key)
+        items = self._by_industry.get(key, [])
+        if items:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return items[offset:offset + limit], len(items)
+
+    def _reload(self, key: str) -> None:
+        with self._lock:
+            self._load(key)
+        self.reloads += 1
+
+    def industries(self) -> dict[str, int]:
+        self.open()
+        return {self._names[k]: len(v) for k, v in self._by_industry.items()}
+
+    def stats(self) -> dict:
+        return {
+            "industries": len(self._by_industry),
+            "templates":  sum(len(v) for v in self._by_industry.values()),
+            "hits":       self.hits,
+            "misses":     self.misses,
+            "reloads":    self.reloads,
+            "persistent": self._conn is not None,
+        }
+
+
+class TemplateRefresher:
+    """
+    Background top-up: every ``interval`` seconds, industries below
+    ``min_per_industry`` get another ``batch`` generated. ``grow`` tops one
+    industry up toward the size a client paged up to (never past
+    ``max_per_industry``); handlers reach it through the job queue, so the
+    request is served by whichever worker picks the job up.
+    """
+
+    def __init__(self, store: TemplateStore, generate, industries: list[str],
+                 min_per_industry: int, batch: int, interval: float, max_per_industry: int = 100):
+        self.store = store
+        self.generate = generate
+        self.industries = list(industries)
+        self.min_per_industry = min_per_industry
+        self.max_per_industry = max(min_per_industry, max_per_industry)
+        self.batch = batch
+        self.interval = interval
+        self.runs = 0
+        self.generated = 0
+        self.failures = 0
+
+    def low(self) -> list[str]:
+        known = {normalize(name): name for name in [*self.industries, *self.store.industries()]}
+        return [i for i in known.values() if self.store.count(i) < self.min_per_industry]
+
+    async def top_up(self, industry: str) -> int:
+        try:
+            added = await self.store.add(industry, await self.generate(industry, self.batch))
+        except Exception as e:
+            self.failures += 1
+            logger.warning("template refresh for %r failed: %s", industry, e)
+            return 0
+        self.generated += added
+        return added
+
+    async def grow(self, industry: str, wanted: int) -> int:
+        """
+        Generate batches for ``industry`` until it has ``wanted`` templates
+        (capped at ``max_per_industry``), or until a batch adds nothing — a
+        failed generation, or only topics already stored — so it can't spin.
+        Returns how many were added.
+        """
+        wanted = min(wanted, self.max_per_industry)
+        total = 0
+        while self.store.count(industry) < wanted:
+            added = await self.top_up(industry)
+            if not added:
+                break
+            total += added
+        return total
+
+    async def run(self) -> None:
+        while True:
+            self.runs += 1
+            for industry in self.low():
+                await self.top_up(industry)
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "generated": self.generated, "failures": self.failures,
+                "tracked": len(self.industries)}
+
+
+def from_env() -> TemplateStore:
+    return TemplateStore(
+        os.getenv("TEMPLATE_DB_PATH", "templates.sqlite3") or None,
+        reload_seconds=float(os.getenv("TEMPLATE_RELOAD_SECONDS", "60")),
+    )
+
+
+def refresher_from_env(store: TemplateStore, generate) -> TemplateRefresher:
+    industries = os.getenv("TEMPLATE_INDUSTRIES")
+    return TemplateRefresher(
+        store,
+        generate,
+        industries=[i.strip() for i in industries.split(",") if i.strip()] if industries else list(DEFAULT_INDUSTRIES),
+        min_per_industry=int(os.getenv("TEMPLATE_MIN_PER_INDUSTRY", "10")),
+        max_per_industry=int(os.getenv("TEMPLATE_MAX_PER_INDUSTRY", "100")),
+        batch=int(os.getenv("TEMPLATE_REFRESH_BATCH", "5")),
+        interval=float(os.getenv("TEMPLATE_REFRESH_SECONDS", "600")),
+    )
@@ -0,0 +1,12 @@
+# tests/conftest.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py reads these at import; keep everything in memory and off the network
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("ORIGINS", "*")
+os.environ.setdefault("SHARED_STORE", "off")
+for name in ("FEWSHOT_INDEX_PATH", "JOBS_DB_PATH", "TEMPLATE_DB_PATH", "PROMPT_TOKENIZER"):
+    os.environ.setdefault(name, "")
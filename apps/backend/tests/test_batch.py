@@ -0,0 +1,93 @@
+# tests/test_batch.py
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import main
+from batch import item_key, run_batch
+from main import AssistRequest, AssistResponse
+
+
+@pytest.fixture
+def assist(monkeypatch):
+    """Fake assist_async: echoes upper-cased prompts, records peak concurrency, fails on 'boom'."""
+    state = {"calls": [], "active": 0, "peak": 0}
+
+    async def fake(req):
+        state["calls"].append(req.prompt)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        if req.prompt == "boom":
+            raise HTTPException(503, detail="upstream down")
+        return AssistResponse(prompt=req.prompt.upper())
+
+    monkeypatch.setattr(main, "assist_async", fake)
+    return state
+
+
+def post(content: bytes, content_type: str, params=None) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/prompt-assist/batch", content=content, params=params,
+                                     headers={"content-type": content_type})
+    return asyncio.run(run())
+
+
+def ndjson(*prompts) -> bytes:
+    return "".join(json.dumps({"prompt": p}) + "\n" for p in prompts).encode()
+
+
+def records(resp: httpx.Response) -> dict[str, dict]:
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    return {r["indices"][0]: r for r in map(json.loads, resp.text.splitlines())}
+
+
+def test_ndjson_lines_are_deduplicated_and_streamed_back(assist):
+    resp = post(ndjson("a", "b", "a", "boom") + b"\n", "application/x-ndjson")
+    assert resp.status_code == 200
+    out = records(resp)
+    assert sorted(assist["calls"]) == ["a", "b", "boom"]
+    assert out[0]["indices"] == [0, 2] and out[0]["prompt"] == "A"
+    assert out[1]["prompt"] == "B"
+    assert out[3]["error"] == "upstream down"
+    assert out[0]["key"] == item_key(AssistRequest(prompt="a"))
+
+
+def test_concurrency_is_capped(assist, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_CONCURRENCY", 2)
+    resp = post(ndjson(*map(str, range(8))), "application/x-ndjson", params={"concurrency": 50})
+    assert len(records(resp)) == 8
+    assert assist["peak"] == 2
+
+
+def test_json_body_form(assist):
+    body = json.dumps({"items": [{"prompt": "x"}, {"prompt": "y"}], "concurrency": 1}).encode()
+    out = records(post(body, "application/json"))
+    assert {r["prompt"] for r in out.values()} == {"X", "Y"}
+    assert assist["peak"] == 1
+
+
+@pytest.mark.parametrize("content", [
+    b'{"prompt": "a"}\n{"mode": "rewrite"}\n',   # second line misses the prompt
+    b'{"prompt": "a"}\nnot json\n',
+])
+def test_bad_ndjson_is_rejected(assist, content):
+    assert post(content, "application/x-ndjson").status_code == 422
+    assert assist["calls"] == []
+
+
+def test_run_batch_skips_checkpointed_items():
+    async def assist_fn(req):
+        return AssistResponse(prompt=req.prompt)
+
+    async def run():
+        items = [AssistRequest(prompt="a"), AssistRequest(prompt="b")]
+        return [r async for r in run_batch(items, assist_fn, skip_keys={item_key(items[0])})]
+
+    assert [r["prompt"] for r in asyncio.run(run())] == ["b"]
@@ -0,0 +1,83 @@
+# tests/test_cache.py
+import asyncio
+
+import pytest
+
+import cache
+from cache import LRUCache, ResponseCache, SQLiteCache, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_cache_key_covers_the_whole_call():
+    msgs = [{"role": "user", "content": "hi"}]
+    assert cache_key("m", 0.3, msgs) == cache_key("m", 0.3, [{"content": "hi", "role": "user"}])
+    assert cache_key("m", 0.3, msgs) != cache_key("m", 0.5, msgs)
+    assert cache_key("m", 0.3, msgs) != cache_key("m", 0.3, msgs, variant="compare_answer")
+
+
+def test_lru_evicts_the_least_recently_used(clock):
+    lru = LRUCache(max_entries=2, ttl=60)
+    lru.set("a", "1")
+    lru.set("b", "2")
+    assert lru.get("a") == "1"          # a is now the most recent
+    lru.set("c", "3")
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == ("1", "3")
+
+
+def test_lru_entries_expire(clock):
+    lru = LRUCache(max_entries=2, ttl=60)
+    lru.set("a", "1")
+    clock[0] += 61
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_sqlite_tier_survives_a_restart_and_keeps_its_expiry(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+
+    async def run():
+        first = ResponseCache(max_entries=8, ttl=60, db_path=path)
+        await first.set("k", "v")
+        clock[0] += 30
+        second = ResponseCache(max_entries=8, ttl=60, db_path=path)
+        hit = await second.get("k")
+        clock[0] += 31                  # past the original write's TTL, not a fresh one
+        return second, hit, await second.get("k")
+
+    second, hit, expired = asyncio.run(run())
+    assert hit == "v"
+    assert expired is None
+    assert second.stats() | {"hit_ratio": None} == {
+        "hits": 1, "disk_hits": 1, "misses": 1, "hit_ratio": None,
+        "entries": 0, "persistent": True, "shared": False,
+    }
+
+
+def test_sqlite_purges_expired_rows(tmp_path, clock):
+    disk = SQLiteCache(str(tmp_path / "cache.db"), ttl=10)
+    disk.set("old", "1")
+    clock[0] += 5
+    disk.set("new", "2")
+    clock[0] += 6
+    assert disk.purge_expired() == 1
+    assert disk.get("new") == ("2", clock[0] + 4)
+
+
+def test_memory_only_cache_counts_misses():
+    async def run():
+        c = ResponseCache(max_entries=8, ttl=60)
+        miss = await c.get("k")
+        await c.set("k", "v")
+        return c, miss, await c.get("k")
+
+    c, miss, hit = asyncio.run(run())
+    assert (miss, hit) == (None, "v")
+    assert c.stats()["hit_ratio"] == 0.5
+    assert not c.stats()["persistent"]
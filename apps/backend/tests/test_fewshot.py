@@ -0,0 +1,162 @@
+# tests/test_fewshot.py
+import asyncio
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+from fewshot import NUM_PERM, FewShotIndex, from_env, signature, similarity, with_examples
+
+
+def test_signature():
+    assert signature("!!! ...") is None
+    a = signature("Write a product launch email")
+    assert len(a) == NUM_PERM
+    assert a == signature("write a PRODUCT launch email")      # case-insensitive
+    assert similarity(a, a) == 1.0
+    assert similarity(a, signature("summarise a quarterly earnings call")) < 0.3
+
+
+def test_with_examples_header():
+    assert with_examples("p", ["e"]).endswith("### Example\ne")
+    assert "### Examples\n" in with_examples("p", ["e1", "e2"])
+
+
+def test_lookup_finds_similar_prompts_only():
+    index = FewShotIndex(None, min_similarity=0.3)
+    source = "write a launch email for our new shoes"
+    assert index.add(source, "rewritten", "compare")
+    assert not index.add(source, "rewritten", "compare")     # same id
+    assert index.lookup("write a launch email for our new boots") == [(source, "rewritten")]
+    assert index.lookup("explain quantum tunnelling to a child") == []
+    assert (index.hits, index.misses) == (1, 1)
+
+
+def test_generated_examples_only_serve_their_own_prompt():
+    index = FewShotIndex(None, min_similarity=0.0)
+    assert index.add("write a launch email for our new shoes", "example", "generated")
+    assert index.generated_for("write a launch  email for our new shoes") == "example"
+    assert index.generated_for("write a launch email for our new boots") is None
+    assert index.lookup("write a launch email for our new shoes") == []
+
+
+def test_persistence_is_opt_in(monkeypatch):
+    monkeypatch.delenv("FEWSHOT_INDEX_PATH", raising=False)
+    assert from_env().path is None
+
+
+def test_nearest_ranks_by_similarity_then_score():
+    index = FewShotIndex(None, min_similarity=0.0, k=3)
+    index.add("plan a trip to rome in spring", "low", "compare", score=1)
+    index.add("plan a trip to rome in spring", "high", "compare", score=9)
+    index.add("plan a trip to paris", "other", "template")
+    ranked = [e["example"] for _, e in index.nearest("plan a trip to rome in spring")]
+    assert ranked[:2] == ["high", "low"]
+
+
+def test_eviction_keeps_buckets_consistent():
+    index = FewShotIndex(None, max_entries=2)
+    for i, text in enumerate(["alpha beta gamma", "delta epsilon zeta", "eta theta iota"]):
+        index.add(text, f"e{i}", "template")
+    assert len(index) == 2
+    assert index.lookup("alpha beta gamma") == []
+    assert all(ids <= set(index._entries) for ids in index._buckets.values())
+
+
+def test_long_prompts_are_hashed_off_the_loop():
+    index = FewShotIndex(None, inline_chars=10)
+    index.add("write a poem about the sea", "ex", "compare")
+    seen = []
+    lookup = index.lookup
+    index.lookup = lambda prompt: seen.append(threading.current_thread()) or lookup(prompt)
+
+    async def run():
+        return await index.lookup_async("write a poem about the sea"), await index.lookup_async("short")
+
+    assert asyncio.run(run()) == ([("write a poem about the sea", "ex")], [])
+    assert seen[0] is not threading.main_thread()
+    assert seen[1] is threading.main_thread()
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = FewShotIndex(path)
+    index.add("write a poem about the sea", "ex", "compare", score=3)
+    assert index.snapshot()
+    assert not index.snapshot()             # unchanged since
+    index.add("write a haiku", "synthesized", "generated")
+    assert index.snapshot()
+    reopened = FewShotIndex(path)
+    reopened.open()
+    assert reopened.lookup("write a poem about the sea") == [("write a poem about the sea", "ex")]
+    assert reopened.generated_for("write a haiku") == "synthesized"
+
+
+def test_version_1_snapshots_are_upgraded(tmp_path):
+    path = tmp_path / "index.json"
+    key = "write a poem about the sea"
+    path.write_text(json.dumps({"version": 1, "num_perm": 32, "entries": [
+        {"id": "x", "key": key, "example": f"Input: {key}\nOutput: ex", "source": "compare",
+         "score": 0, "sig": [0, 1]}]}))
+    index = FewShotIndex(str(path))
+    assert index.lookup(key) == [(key, "ex")]
+
+
+def test_workers_sharing_a_snapshot_keep_each_others_inserts(tmp_path):
+    path = str(tmp_path / "index.json")
+    a, b = FewShotIndex(path), FewShotIndex(path)
+    a.add("write a poem about the sea", "from-a", "compare")
+    b.add("draft a launch email for shoes", "from-b", "generated")
+    writers = [threading.Thread(target=w.snapshot) for w in (a, b)]
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+
+    merged = FewShotIndex(path)
+    merged.open()
+    assert len(merged) == 2
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+
+def test_synth_examples_keeps_generated_examples_per_prompt(monkeypatch):
+    import main
+
+    calls = []
+
+    async def fake_call(**kw):
+        calls.append(kw["messages"][1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"example {len(calls)}"))])
+
+    monkeypatch.setattr(main, "fewshot_index", FewShotIndex(None))
+    monkeypatch.setattr(main, "call_groq_with_retry_async", fake_call)
+
+    async def run():
+        first = await main.synth_examples(main.AssistRequest(prompt="write a poem about the sea", synth_examples=True))
+        again = await main.synth_examples(main.AssistRequest(prompt="write a poem about the sea", synth_examples=True))
+        other = await main.synth_examples(main.AssistRequest(prompt="write a poem about the seas", synth_examples=True))
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first == again == ([], "example 1")
+    assert other == ([], "example 2")       # similar isn't enough: written for its own prompt
+    assert calls == ["write a poem about the sea", "write a poem about the seas"]
+
+
+def test_long_keys_are_indexed_off_the_loop(monkeypatch):
+    import fewshot
+
+    threads = []
+    real = fewshot.signature
+    monkeypatch.setattr(fewshot, "signature", lambda text: threads.append(threading.current_thread()) or real(text))
+    index = FewShotIndex(None, inline_chars=10)
+
+    async def run():
+        await index.add_async("write a poem about the sea", "ex", "compare")
+        await index.add_async("haiku", "ex", "compare")
+        await index.add_async("write a poem about the sea", "generated ex", "generated")
+
+    asyncio.run(run())
+    assert threads[0] is not threading.main_thread()
+    assert threads[1:] == [threading.main_thread()]     # short key; generated ones aren't hashed
+    assert len(index) == 3
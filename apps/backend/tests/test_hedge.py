@@ -0,0 +1,127 @@
+# tests/test_hedge.py
+import asyncio
+import time
+
+import pytest
+
+from hedge import Hedger, LatencyTracker
+
+
+def warmed(seconds: float = 0.02, samples: int = 20, **kw) -> Hedger:
+    hedger = Hedger({"s"}, min_delay=0.005, min_samples=samples, **kw)
+    tracker = hedger._trackers["s"] = LatencyTracker(refresh=1)
+    for _ in range(samples):
+        tracker.add(seconds)
+    return hedger
+
+
+def slow_then_fast():
+    """Coroutine factory: the first call hangs, any later one answers at once."""
+    calls = []
+
+    async def call():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+            return "primary"
+        return "hedge"
+    return call, calls
+
+
+def test_percentile():
+    tracker = LatencyTracker(refresh=1)
+    for ms in range(1, 101):
+        tracker.add(ms / 1000)
+    assert tracker.percentile(0.95) == 0.096
+    assert tracker.percentile(0.5) == 0.051
+
+
+def test_no_hedge_until_enough_samples():
+    hedger = Hedger({"s"}, min_samples=5)
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    assert asyncio.run(hedger.run("s", call)) == "ok"
+    assert hedger.delay("s") is None
+    assert hedger.counts["s"] == {"calls": 1, "fired": 0, "won": 0, "capped": 0}
+
+
+def test_disabled_stages_are_not_tracked():
+    hedger = Hedger({"s"})
+
+    async def call():
+        return "ok"
+
+    assert asyncio.run(hedger.run("other", call)) == "ok"
+    assert asyncio.run(hedger.run(None, call)) == "ok"
+    assert hedger.counts == {}
+
+
+def test_slow_primary_is_hedged_after_the_percentile_delay():
+    hedger = warmed(0.05)
+    call, calls = slow_then_fast()
+    t0 = time.monotonic()
+    assert asyncio.run(hedger.run("s", call)) == "hedge"
+    assert len(calls) == 2
+    assert calls[1] - t0 == pytest.approx(0.05, abs=0.03)
+    assert hedger.counts["s"] == {"calls": 1, "fired": 1, "won": 1, "capped": 0}
+    # the cancelled primary still records how long it had been running
+    assert hedger._trackers["s"].samples[-1] >= 0.05
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = warmed(0.05)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "primary"
+
+    assert asyncio.run(hedger.run("s", call)) == "primary"
+    assert calls == [1] and hedger.counts["s"]["fired"] == 0
+
+
+def test_hedges_are_capped_by_credit():
+    hedger = warmed(0.01, burst=1.0, max_extra=0.0)
+
+    async def both():
+        first = await hedger.run("s", slow_then_fast()[0])
+        second = asyncio.create_task(hedger.run("s", slow_then_fast()[0]))
+        await asyncio.sleep(0.05)
+        second.cancel()
+        return first
+
+    assert asyncio.run(both()) == "hedge"
+    assert hedger.counts["s"]["fired"] == 1
+    assert hedger.counts["s"]["capped"] == 1
+
+
+def test_a_failing_primary_falls_back_to_the_hedge():
+    hedger = warmed(0.01)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(0.03)
+            raise ConnectionError("primary died")
+        await asyncio.sleep(0.05)
+        return "hedge"
+
+    assert asyncio.run(hedger.run("s", call)) == "hedge"
+
+
+def test_the_primarys_error_surfaces_when_both_fail():
+    hedger = warmed(0.01)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        n = len(calls)
+        await asyncio.sleep(0.03)
+        raise ConnectionError(f"call {n}")
+
+    with pytest.raises(ConnectionError, match="call 1"):
+        asyncio.run(hedger.run("s", call))
@@ -0,0 +1,132 @@
+# tests/test_inference.py
+import asyncio
+
+import pytest
+
+from inference import LocalBackend, MicroBatcher, format_prompt
+
+
+def word_tokenizer(words):
+    """A tiny whitespace-level fast tokenizer, so no model download is needed."""
+    pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {w: i for i, w in enumerate(["<eos>", "<unk>", *words])}
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tok.decoder = decoders.WordPiece(prefix="##")       # joins words back with spaces
+    fast = PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<eos>", unk_token="<unk>")
+    fast.pad_token = fast.eos_token
+    fast.padding_side = fast.truncation_side = "left"
+    return fast
+
+
+def test_long_prompts_keep_the_rewrite_marker():
+    words = "MODE: TARGET: PROMPT: REWRITE: rewrite gpt4o word".split()
+    backend = LocalBackend("base", None, max_input_length=16)
+    backend._tokenizer = word_tokenizer(words)
+
+    prompt = backend._fit("rewrite", "gpt4o", " ".join(["word"] * 50))
+    ids = backend._tokenizer(prompt)["input_ids"]
+    assert prompt.endswith("REWRITE:")
+    assert prompt.startswith("MODE: rewrite")
+    assert len(ids) == 16
+    assert backend.truncated == 1
+
+    short = backend._fit("rewrite", "gpt4o", "word word")
+    assert short == format_prompt("rewrite", "gpt4o", "word word")
+    assert backend.truncated == 1
+
+
+def test_generate_batches_fitted_prompts():
+    torch = pytest.importorskip("torch")
+    words = "MODE: TARGET: PROMPT: REWRITE: rewrite shorten gpt4o word done".split()
+    backend = LocalBackend("base", None, max_input_length=12)
+    tok = backend._tokenizer = word_tokenizer(words)
+    seen = []
+
+    class LM:
+        def generate(self, input_ids, attention_mask, **_):
+            seen.append(input_ids)
+            done = torch.full((input_ids.shape[0], 1), tok.convert_tokens_to_ids("done"))
+            return torch.cat([input_ids, done], dim=1)
+
+    backend._lm = LM()
+    out = backend._generate([("rewrite", "gpt4o", "word " * 40), ("shorten", "gpt4o", "word")])
+    assert out == ["done", "done"]
+    rewrite_id = tok.convert_tokens_to_ids("REWRITE:")
+    assert seen[0][:, -1].tolist() == [rewrite_id, rewrite_id]
+
+
+def run_batcher(fn, coro_factory, max_batch=4, window=0.02):
+    async def run():
+        batcher = MicroBatcher(fn, max_batch=max_batch, window=window)
+        batcher.start()
+        try:
+            return await coro_factory(batcher), batcher.stats()
+        finally:
+            await batcher.close()
+    return asyncio.run(run())
+
+
+def test_concurrent_submits_share_one_call():
+    calls = []
+
+    def fn(items):
+        calls.append(list(items))
+        return [i * 10 for i in items]
+
+    results, stats = run_batcher(fn, lambda b: asyncio.gather(*(b.submit(i) for i in range(6))))
+    assert results == [0, 10, 20, 30, 40, 50]
+    assert [len(c) for c in calls] == [4, 2]        # max_batch caps each call
+    assert stats["batches"] == 2 and stats["max_batch_size"] == 4
+
+
+def test_a_failed_batch_fails_its_callers_only():
+    def fn(items):
+        if "bad" in items:
+            raise RuntimeError("generate failed")
+        return items
+
+    async def scenario(b):
+        first = await asyncio.gather(b.submit("bad"), b.submit("ok"), return_exceptions=True)
+        return first, await b.submit("later")
+
+    (first, later), _ = run_batcher(fn, scenario)
+    assert all(isinstance(r, RuntimeError) for r in first)
+    assert later == "later"
+
+
+def test_cancelled_callers_are_dropped_before_generating():
+    calls = []
+
+    def fn(items):
+        calls.append(list(items))
+        return items
+
+    async def scenario(b):
+        gone = asyncio.create_task(b.submit("gone"))
+        await asyncio.sleep(0)              # queued
+        gone.cancel()
+        return await b.submit("kept")
+
+    result, stats = run_batcher(fn, scenario)
+    assert result == "kept"
+    assert calls == [["kept"]] and stats["requests"] == 1
+
+
+@pytest.mark.parametrize("fields, served", [
+    ({"mode": "rewrite"}, True),
+    ({"mode": "formal"}, False),                        # not an adapter mode
+    ({"mode": "rewrite", "synth_examples": True}, False),
+    ({"mode": "rewrite", "context": ["earlier turn"]}, False),
+])
+def test_requests_route_to_the_local_backend_only_when_it_serves_them(monkeypatch, fields, served):
+    import main
+
+    local = LocalBackend("base", None, modes={"rewrite", "shorten"})
+    monkeypatch.setattr(main, "local_backend", local)
+    req = main.AssistRequest(prompt="p", **fields)
+    assert local.serves(req) is served
+    assert main.backend_for(req) is (local if served else main.groq_backend)
@@ -0,0 +1,151 @@
+# tests/test_jobs.py
+import asyncio
+import time
+
+import pytest
+
+from jobs import STALE_HEARTBEATS, JobQueue
+
+
+async def echo(params, progress):
+    for i in range(params.get("steps", 0)):
+        progress("step", {"i": i})
+        await asyncio.sleep(0)
+    return {"echo": params}
+
+
+async def boom(params, progress):
+    raise RuntimeError("handler failed")
+
+
+async def hang(params, progress):
+    await asyncio.sleep(60)
+
+
+def make_queue(path=None, workers=2, heartbeat=0.05) -> JobQueue:
+    queue = JobQueue(path, workers=workers, heartbeat=heartbeat)
+    for kind, handler in (("echo", echo), ("boom", boom), ("hang", hang)):
+        queue.register(kind, handler)
+    return queue
+
+
+def run_with(queue: JobQueue, body, recover: bool = True):
+    async def run():
+        queue.start(recover=recover)
+        try:
+            return await asyncio.wait_for(body(), 10)
+        finally:
+            await queue.close()
+
+    return asyncio.run(run())
+
+
+def test_submit_runs_to_done_with_events():
+    queue = make_queue()
+
+    async def body():
+        job = await queue.submit("echo", {"steps": 3})
+        seen = [event async for event, _ in queue.follow(job["id"])]
+        return seen, await queue.get(job["id"])
+
+    seen, job = run_with(queue, body)
+    assert seen == ["step", "step", "step", "done"]
+    assert job["status"] == "done"
+    assert job["result"] == {"echo": {"steps": 3}}
+    assert [e["i"] for e in job["events"]] == [0, 1, 2]
+
+
+def test_failures_are_recorded():
+    queue = make_queue()
+
+    async def body():
+        return await queue.wait((await queue.submit("boom", {}))["id"])
+
+    job = run_with(queue, body)
+    assert job["status"] == "failed"
+    assert job["error"] == "handler failed"
+    assert queue.counts["failed"] == 1
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError, match="unknown job kind"):
+        asyncio.run(make_queue().submit("nope", {}))
+
+
+def test_identical_pending_jobs_are_deduplicated():
+    queue = make_queue()
+
+    async def body():
+        jobs = await asyncio.gather(*(queue.submit("hang", {}, dedup_key="k") for _ in range(5)))
+        other = await queue.submit("hang", {}, dedup_key="other")
+        await queue.cancel(jobs[0]["id"])
+        again = await queue.submit("hang", {}, dedup_key="k")
+        return jobs, other, again
+
+    jobs, other, again = run_with(queue, body)
+    assert len({j["id"] for j in jobs}) == 1
+    assert sum(j["deduplicated"] for j in jobs) == 4
+    assert other["id"] != jobs[0]["id"]
+    assert again["id"] != jobs[0]["id"] and not again["deduplicated"]   # the first was cancelled
+
+
+def test_cancel_queued_and_running():
+    queue = make_queue(workers=1)
+
+    async def body():
+        running = await queue.submit("hang", {})
+        queued = await queue.submit("hang", {})
+        while (await queue.get(running["id"]))["status"] != "running":
+            await asyncio.sleep(0.01)
+        return await queue.cancel(queued["id"]), await queue.cancel(running["id"])
+
+    queued, running = run_with(queue, body)
+    assert queued["status"] == "cancelled"
+    assert running["status"] == "cancelled"
+    assert queue.counts["cancelled"] == 2
+
+
+def test_cancel_reaches_a_job_running_in_another_process(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    owner, other = make_queue(path), make_queue(path)
+
+    async def body():
+        owner.start()
+        try:
+            job = await owner.submit("hang", {})
+            while (await other.get(job["id"]))["status"] != "running":
+                await asyncio.sleep(0.01)
+            requested = await other.cancel(job["id"])
+            return requested, await asyncio.wait_for(other.wait(job["id"]), 5)
+        finally:
+            await owner.close()
+
+    requested, final = asyncio.run(body())
+    assert requested["status"] == "running" and requested["cancel_requested"]
+    assert final["status"] == "cancelled"
+
+
+def test_recovery_adopts_only_dead_owners_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    dead, live, leader = make_queue(path), make_queue(path), make_queue(path)
+
+    async def body():
+        orphan = await dead.submit("echo", {})       # never started: its owner "died"
+        live.start(recover=False)
+        kept = await live.submit("hang", {})
+        # age the dead owner's heartbeat past the threshold
+        await dead._exec("UPDATE jobs SET heartbeat = ? WHERE id = ?",
+                         (time.time() - 2 * STALE_HEARTBEATS * dead.heartbeat, orphan["id"]))
+        leader.start(recover=True)
+        try:
+            done = await asyncio.wait_for(leader.wait(orphan["id"]), 5)
+            await asyncio.sleep(STALE_HEARTBEATS * leader.heartbeat * 2)
+            return done, await leader.get(kept["id"])
+        finally:
+            await leader.close()
+            await live.close()
+
+    done, kept = asyncio.run(body())
+    assert done["status"] == "done" and done["owner"] == leader.owner
+    assert kept["status"] == "running" and kept["owner"] == live.owner
+    assert leader.counts["recovered"] == 1
@@ -0,0 +1,55 @@
+# tests/test_jsonextract.py
+import pytest
+
+from jsonextract import JSONStream, extract_json, find_json, iter_json
+
+
+def test_whole_reply():
+    assert extract_json('{"a": 1}') == {"a": 1}
+
+
+def test_fenced_with_prose():
+    assert extract_json('Sure! ```json\n{"a": {"b": 1}}\n``` Hope that helps.') == {"a": {"b": 1}}
+
+
+def test_expect_skips_other_kinds():
+    assert extract_json('{"x": 1} then ["y"]', expect=list) == ["y"]
+    assert find_json('Topics: ["x"] and {"k": "v"}') == '{"k": "v"}'
+
+
+def test_braces_inside_strings():
+    text = 'note {"msg": "a } brace and a \\" quote {", "n": 2} done'
+    assert extract_json(text) == {"msg": 'a } brace and a " quote {', "n": 2}
+
+
+def test_skips_balanced_non_json():
+    assert extract_json('Fill in {name}, then {"ok": true}') == {"ok": True}
+
+
+def test_no_json_raises_value_error():
+    with pytest.raises(ValueError, match="No JSON object"):
+        extract_json("nothing here", expect=dict)
+
+
+def test_iter_json_yields_every_value():
+    assert list(iter_json('[1] x {"a": 2} y [3]')) == [[1], {"a": 2}, [3]]
+
+
+def test_stream_across_chunk_boundaries():
+    stream = JSONStream()
+    text = 'pre {"a": "x\\"}", "b": [1, 2]} mid {"c": 3} post'
+    values = []
+    for i in range(0, len(text), 3):
+        values += stream.feed(text[i:i + 3])
+    assert values == [{"a": 'x"}', "b": [1, 2]}, {"c": 3}]
+
+
+def test_stream_escape_split_at_chunk_end():
+    stream = JSONStream()
+    assert stream.feed('{"a": "x\\') == []
+    assert stream.pending == '{"a": "x\\'
+    assert stream.feed('"}"}') == [{"a": 'x"}'}]
+
+
+def test_stream_resyncs_after_mismatched_closer():
+    assert JSONStream().feed('{"a": ] {"b": 1}') == [{"b": 1}]
@@ -0,0 +1,82 @@
+# tests/test_prompt_budget.py
+import pytest
+
+from prompt_budget import PromptTooLong, TokenCounter, fit_context, heuristic_count, load_encoder
+
+
+def test_heuristic_counter_is_not_memoized():
+    counter = TokenCounter(heuristic_count)
+    assert not counter.memoized
+    assert counter.count("abcdefgh") == 2
+    assert counter.stats() == {}
+
+
+def test_tokenizer_counts_are_memoized():
+    calls = []
+
+    def encode(text):
+        calls.append(text)
+        return len(text.split())
+
+    counter = TokenCounter(encode)
+    assert counter.count("one two") == counter.count("one two") == 2
+    assert calls == ["one two"]
+    assert counter.stats()["hits"] == 1
+
+
+def test_messages_adds_framing():
+    counter = TokenCounter(heuristic_count)
+    assert counter.messages([{"content": "abcd"}, {"content": None}]) == 1 + 4 + 0 + 4
+
+
+def test_load_encoder():
+    assert load_encoder("") is heuristic_count
+    with pytest.raises(ValueError, match="unknown PROMPT_TOKENIZER"):
+        load_encoder("spacy:en")
+
+
+def test_fit_context_keeps_recent_contiguous_turns():
+    turns = ["a" * 40, "b" * 4, "c" * 4]          # 10, 1 and 1 tokens, +1 per join
+    assert fit_context(turns, available=100, count=heuristic_count, max_turns=5) == turns
+    assert fit_context(turns, available=4, count=heuristic_count, max_turns=5) == ["b" * 4, "c" * 4]
+    assert fit_context(turns, available=100, count=heuristic_count, max_turns=1) == ["c" * 4]
+    assert fit_context(turns, available=100, count=heuristic_count, max_turns=0) == []
+
+
+def test_fit_context_stops_at_first_overflow():
+    turns = ["a" * 4, "b" * 400, "c" * 4]
+    assert fit_context(turns, available=20, count=heuristic_count, max_turns=5) == ["c" * 4]
+
+
+def test_prompt_too_long_is_a_value_error():
+    e = PromptTooLong(7000, 6000, "m")
+    assert isinstance(e, ValueError)
+    assert (e.tokens, e.budget, e.model) == (7000, 6000, "m")
+
+
+def test_examples_are_dropped_before_the_prompt_overflows(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "PROMPT_BUDGET_DEFAULT", 600)
+    monkeypatch.setattr(main, "PROMPT_BUDGETS", {})
+    req = main.AssistRequest(prompt="write a haiku")
+    messages = main.build_messages(req.prompt, req, record=False, example="x" * 4000,
+                                   demos=[("write a limerick", "short"), ("write an ode", "y" * 4000)])
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[2]["content"] == "short"
+    assert "x" * 100 not in messages[-1]["content"]
+    with pytest.raises(PromptTooLong):
+        main.build_messages("y" * 4000, req, record=False)
+
+
+def test_retrieved_demos_stay_out_of_the_original_prompt():
+    import main
+
+    req = main.AssistRequest(prompt="write a haiku about rain")
+    messages = main.build_messages(req.prompt, req, record=False, demos=[("write a haiku about snow", "better")],
+                                   example="Input: rain\nOutput: a haiku")
+    assert messages[1]["content"] == main.build_prompt("write a haiku about snow", req)
+    assert messages[2] == {"role": "assistant", "content": "better"}
+    # only the example written for this prompt sits inside it
+    assert messages[3]["content"] == main.build_prompt(
+        "write a haiku about rain\n\n### Example\nInput: rain\nOutput: a haiku", req)
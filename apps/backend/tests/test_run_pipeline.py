@@ -0,0 +1,61 @@
+# tests/test_run_pipeline.py
+import asyncio
+import json
+import types
+
+import pytest
+
+import data.run_pipeline as pipeline
+
+
+class FakeAgent:
+    def __init__(self, name):
+        self.name = name
+
+    async def arun(self, prompt):
+        if self.name == "TopicGenerator":
+            return types.SimpleNamespace(content='["Contracts", "Billing"]')
+        if self.name == "MetaPromptCreator":
+            topic = "Billing" if "Billing" in prompt else "Contracts"
+            return types.SimpleNamespace(content=json.dumps({"topic": topic, "meta_prompt": f"Write about {topic}."}))
+        return types.SimpleNamespace(content=f"  final for {prompt[:20]}  ")
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    async def call(fn, est_tokens=0):
+        calls.append(est_tokens)
+        return await fn()
+
+    monkeypatch.setattr(pipeline, "new_agent", lambda name, client=None: FakeAgent(name))
+    monkeypatch.setattr(pipeline, "get_async_client", lambda: None)
+    monkeypatch.setattr(pipeline.scheduler, "call", call)
+    return calls
+
+
+def test_every_stage_charges_the_token_bucket(calls):
+    finals = asyncio.run(pipeline.generate_templates_for_industry_async("Legal", count=2))
+    assert [f["topic"] for f in finals] == ["Contracts", "Billing"]
+    assert len(calls) == 5                      # topics + 2 × (meta, final)
+    assert calls[0] == pipeline._est_tokens(pipeline.topics_prompt("Legal", 2))
+    assert all(est > 512 for est in calls)      # prompt estimate + completion allowance
+
+
+def test_failures_are_logged_not_printed(calls, monkeypatch, caplog, capsys):
+    class Garbled(FakeAgent):
+        async def arun(self, prompt):
+            if self.name == "MetaPromptCreator" and "Billing" in prompt:
+                return types.SimpleNamespace(content="not json")
+            return await super().arun(prompt)
+
+    monkeypatch.setattr(pipeline, "new_agent", lambda name, client=None: Garbled(name))
+    with caplog.at_level("DEBUG", logger=pipeline.logger.name):
+        finals, failures = asyncio.run(pipeline.run_topics_pipelined("Legal", ["Contracts", "Billing"], retries=1))
+    assert [f["topic"] for f in finals] == ["Contracts"]
+    assert [f["topic"] for f in failures] == ["Billing"]
+    warnings = [r for r in caplog.records if r.levelname == "WARNING"]
+    assert len(warnings) == 1 and "'Billing' failed" in warnings[0].getMessage()
+    assert any("raw meta response" in r.getMessage() for r in caplog.records if r.levelname == "DEBUG")
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,143 @@
+# tests/test_scheduler.py
+import asyncio
+
+import groq
+import httpx
+import pytest
+
+from scheduler import (AdaptiveLimit, CircuitBreaker, SharedTokenBucket, TokenBucket, UpstreamScheduler,
+                       UpstreamUnavailable, estimate_tokens, retry_after_seconds)
+from shared import SQLiteStore
+
+
+def upstream_error(cls, status: int, headers: dict | None = None):
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "http://upstream"))
+    return cls("upstream", response=response, body=None)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens([{"content": "a" * 40}, {"content": None}], max_completion=10) == 20
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(upstream_error(groq.RateLimitError, 429, {"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(upstream_error(groq.RateLimitError, 429)) is None
+    assert retry_after_seconds(ValueError()) is None
+
+
+def test_token_bucket_adjust_and_drain():
+    async def run():
+        bucket = TokenBucket(60)
+        await bucket.acquire(10)
+        await bucket.adjust(-5)             # refund
+        after_refund = bucket.tokens
+        await bucket.drain()
+        return after_refund, bucket.tokens
+
+    after_refund, drained = asyncio.run(run())
+    assert after_refund == pytest.approx(55, abs=0.1)
+    assert drained <= 0.01
+
+
+def test_shared_bucket_is_one_budget(tmp_path):
+    store = SQLiteStore(str(tmp_path / "shared.sqlite3"))
+
+    async def run():
+        a = SharedTokenBucket(store, "rpm", 60)
+        b = SharedTokenBucket(store, "rpm", 60)
+        await a.acquire(50)
+        await b.adjust(5)
+        await b.acquire(1)
+        await a.adjust(0)
+        return a.tokens
+
+    # 60 - 50 taken by one worker, 5 charged and 1 taken by the other
+    assert asyncio.run(run()) == pytest.approx(4, abs=0.1)
+
+
+def test_breaker_opens_then_lets_one_probe_through():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.0)
+    breaker.record(ok=False)
+    assert breaker.state == "closed"
+    breaker.record(ok=False)
+    assert breaker.state == "half_open"     # cooldown 0: straight to half-open
+    breaker.before_call()                   # the probe
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+    breaker.record(ok=True)
+    assert breaker.state == "closed"
+
+
+def test_adaptive_limit_backs_off_on_errors():
+    limit = AdaptiveLimit(initial=10, minimum=2, maximum=20)
+    limit.record(None, ok=False)
+    assert limit.limit == pytest.approx(7)
+    for _ in range(10):
+        limit.record(None, ok=False)
+    assert limit.limit == 2
+
+
+def make_scheduler(**kw) -> UpstreamScheduler:
+    return UpstreamScheduler(rpm=6000, tpm=10**6, backoff_base=0, **kw)
+
+
+def test_call_retries_retryable_errors():
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise upstream_error(groq.InternalServerError, 500)
+        return "ok"
+
+    sched = make_scheduler(max_attempts=4)
+    assert asyncio.run(sched.call(fn)) == "ok"
+    assert len(attempts) == 3
+    assert sched.counts["retries"] == 2
+
+
+def test_call_reraises_the_last_error():
+    async def fn():
+        raise upstream_error(groq.InternalServerError, 500)
+
+    sched = make_scheduler(max_attempts=2, breaker_threshold=10)
+    with pytest.raises(groq.InternalServerError):
+        asyncio.run(sched.call(fn))
+    assert sched.counts["calls"] == 2
+    assert sched.counts["failures"] == 1
+
+
+def test_call_does_not_retry_other_errors():
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(make_scheduler().call(fn))
+    assert len(attempts) == 1
+
+
+def test_open_circuit_fails_fast():
+    async def fn():
+        raise AssertionError("must not be called")
+
+    sched = make_scheduler(breaker_threshold=1, breaker_cooldown=60)
+    sched.breaker.record(ok=False)
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(sched.call(fn))
+    assert sched.counts["short_circuited"] == 1
+
+
+def test_usage_corrects_the_token_estimate():
+    class Result:
+        class usage:
+            total_tokens = 100
+
+    async def fn():
+        return Result()
+
+    sched = make_scheduler()
+    asyncio.run(sched.call(fn, est_tokens=1000))
+    assert sched.tokens.tokens == pytest.approx(10**6 - 100, abs=50)
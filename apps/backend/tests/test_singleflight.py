@@ -0,0 +1,129 @@
+# tests/test_singleflight.py
+import asyncio
+
+import pytest
+
+import main
+from singleflight import SingleFlight, request_key
+
+
+def msgs(*contents):
+    return [{"role": "user", "content": c} for c in contents]
+
+
+def test_request_key_normalizes_whitespace():
+    assert request_key(msgs("a  b\n c")) == request_key(msgs(" a b c "))
+    assert request_key(msgs("a b")) != request_key(msgs("a b"), variant="synth")
+    assert request_key(msgs("a b")) != request_key(msgs("a c"))
+
+
+@pytest.mark.parametrize("max_turns", [3, 5])
+def test_flight_key_sees_the_whole_context_window(monkeypatch, max_turns):
+    # turns beyond the last three used to be left out of the key, so requests
+    # whose upstream calls differed shared one answer
+    monkeypatch.setattr(main, "CONTEXT_MAX_TURNS", max_turns)
+    turns = [f"turn {i}" for i in range(max_turns)]
+    a = main.AssistRequest(prompt="p", context=turns)
+    b = main.AssistRequest(prompt="p", context=["changed"] + turns[1:])
+    assert main.assist_flight_key(a) != main.assist_flight_key(b)
+    # a turn outside the window doesn't change the call, so it shouldn't split the key
+    c = main.AssistRequest(prompt="p", context=["older"] + turns)
+    assert main.assist_flight_key(a) == main.assist_flight_key(c)
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight, calls = SingleFlight(), []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(run())
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert stats == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def run():
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream")
+
+        results = await asyncio.gather(*(flight.do("k", boom) for _ in range(3)), return_exceptions=True)
+
+        async def ok():
+            return "fine"
+
+        return results, await flight.do("k", ok)
+
+    results, after = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert after == "fine"
+
+
+def test_one_waiter_leaving_does_not_cancel_the_call():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def fn():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        first = asyncio.create_task(flight.do("k", fn))
+        await started.wait()
+        second = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "answer"
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def run():
+        flight = SingleFlight()
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def fn():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flight.do("k", fn))
+        await started.wait()
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        async def fresh():
+            return "fresh"
+
+        # the next caller starts a new call rather than joining the cancelled one
+        return await flight.do("k", fresh), flight.stats()["in_flight"]
+
+    assert asyncio.run(run()) == ("fresh", 0)
+
+
+def test_do_led_tells_the_leader_from_followers():
+    async def run():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            return "x"
+
+        return await asyncio.gather(*(flight.do_led("k", fn) for _ in range(3)))
+
+    assert asyncio.run(run()) == [("x", True), ("x", False), ("x", False)]
@@ -0,0 +1,60 @@
+# tests/test_template_db.py
+import types
+
+import pytest
+from sqlalchemy import func, select
+
+from data.template_db import bulk_upsert, make_engine, meta, templates
+
+
+def rows(n: int, start: int = 0) -> list[dict]:
+    return [{"id": f"t{i}", "industry": "Legal", "name": f"n{i}", "description": "d", "prompt": f"p{i}"}
+            for i in range(start, start + n)]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'templates.db'}")
+    meta.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def count(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(templates)).scalar_one()
+
+
+def test_bulk_upsert_writes_in_chunks(engine):
+    stats = bulk_upsert(engine, rows(25), chunk_size=10)
+    assert stats["rows"] == 25
+    assert stats["chunks"] == 3
+    assert stats["written"] in (25, None)
+    assert count(engine) == 25
+    with engine.connect() as conn:
+        assert conn.execute(select(templates.c.prompt).where(templates.c.id == "t7")).scalar_one() == "p7"
+
+
+def test_bulk_upsert_is_idempotent(engine):
+    bulk_upsert(engine, rows(10))
+    stats = bulk_upsert(engine, rows(15), chunk_size=4)
+    assert count(engine) == 15
+    assert stats["written"] in (5, None)
+
+
+def test_bulk_upsert_keeps_existing_rows(engine):
+    bulk_upsert(engine, rows(1))
+    bulk_upsert(engine, [{**rows(1)[0], "prompt": "changed"}])
+    with engine.connect() as conn:
+        assert conn.execute(select(templates.c.prompt)).scalar_one() == "p0"
+
+
+def test_bulk_upsert_empty(engine):
+    assert bulk_upsert(engine, [])["chunks"] == 0
+    assert count(engine) == 0
+
+
+def test_bulk_upsert_rejects_other_dialects():
+    mysql = types.SimpleNamespace(dialect=types.SimpleNamespace(name="mysql"))
+    with pytest.raises(ValueError, match="Postgres or SQLite"):
+        bulk_upsert(mysql, rows(1))
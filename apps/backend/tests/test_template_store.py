@@ -0,0 +1,180 @@
+# tests/test_template_store.py
+import asyncio
+
+import pydantic
+import pytest
+
+from models import TemplateRequest
+from template_store import TemplateStore, normalize
+
+
+def templates(*topics):
+    return [{"topic": t, "user_prompt": f"prompt for {t}"} for t in topics]
+
+
+def test_normalize():
+    assert normalize("  E-Commerce \n Retail ") == "e-commerce retail"
+
+
+def test_add_skips_known_topics_and_pages_oldest_first():
+    store = TemplateStore(None)
+    seen = []
+
+    async def listener(fresh):
+        seen.extend(e["topic"] for e in fresh)
+
+    store.listeners.append(listener)
+
+    async def run():
+        first = await store.add("Legal", templates("NDA", "Lease"))
+        again = await store.add(" legal ", templates("nda", "Will"))
+        return first, again, await store.page("LEGAL", 1, 5)
+
+    first, again, (items, total) = asyncio.run(run())
+    assert (first, again) == (2, 1)
+    assert [t["topic"] for t in items] == ["Lease", "Will"] and total == 3
+    assert seen == ["NDA", "Lease", "Will"]
+    assert store.industries() == {"Legal": 3}
+
+
+def test_reloads_what_other_workers_stored(tmp_path):
+    path = str(tmp_path / "templates.sqlite3")
+    leader, worker = TemplateStore(path), TemplateStore(path, reload_seconds=3600)
+
+    async def run():
+        await leader.add("Legal", templates("NDA"))
+        _, before = await worker.page("Legal", 0, 1)
+        await leader.add("Legal", templates("Lease", "Will"))
+        _, full_page = await worker.page("Legal", 0, 1)       # page satisfied, copy is fresh
+        worker._loaded_at[normalize("Legal")] = 0.0           # as if the copy were old
+        _, short_page = await worker.page("Legal", 0, 10)
+        return before, full_page, short_page
+
+    assert asyncio.run(run()) == (1, 1, 3)
+    assert TemplateStore(path).count("legal") == 3
+
+
+def test_short_pages_reread_the_database(tmp_path, monkeypatch):
+    import template_store
+
+    monkeypatch.setattr(template_store, "SHORT_RELOAD_SECONDS", 0.0)
+    path = str(tmp_path / "templates.sqlite3")
+    leader, worker = TemplateStore(path), TemplateStore(path, reload_seconds=3600)
+
+    async def run():
+        await leader.add("Legal", templates("NDA"))
+        await worker.page("Legal", 0, 5)
+        await leader.add("Legal", templates("Lease"))
+        return await worker.page("Legal", 0, 5)
+
+    items, total = asyncio.run(run())
+    assert total == 2 and worker.reloads == 2
+
+
+def test_short_pages_queue_a_grow_job(monkeypatch):
+    import main
+    from jobs import JobQueue
+    from template_store import TemplateRefresher
+
+    async def generate(industry, count, progress=None):
+        return templates(*(f"{industry} {i}" for i in range(count)))
+
+    store = TemplateStore(None)
+    refresher = TemplateRefresher(store, generate, [], min_per_industry=0, batch=5, interval=0,
+                                  max_per_industry=8)
+    queue = JobQueue(None, workers=1)
+    queue.register("templates_grow", main.templates_grow_job)
+    monkeypatch.setattr(main, "template_store", store)
+    monkeypatch.setattr(main, "template_refresher", refresher)
+    monkeypatch.setattr(main, "jobs", queue)
+
+    async def run():
+        await store.add("Legal", templates("NDA"))
+        queue.start(recover=False)
+        try:
+            served = await main.templates_endpoint(main.TemplateRequest(industry="Legal", count=5))
+            while queue.counts["done"] < 1:
+                await asyncio.sleep(0.01)
+            return served
+        finally:
+            await queue.close()
+
+    served = asyncio.run(run())
+    assert len(served) == 1                 # served short, grown in the background
+    assert store.count("Legal") == 6
+
+
+class Generator:
+    """Fake pipeline: fresh topics each call, optionally failing or repeating itself."""
+
+    def __init__(self, fail: bool = False, repeat: bool = False):
+        self.calls = 0
+        self.fail = fail
+        self.repeat = repeat
+
+    async def __call__(self, industry, count, progress=None):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("upstream down")
+        start = 0 if self.repeat else (self.calls - 1) * count
+        return templates(*(f"{industry} {i}" for i in range(start, start + count)))
+
+
+def make_refresher(generate, **kw):
+    from template_store import TemplateRefresher
+
+    defaults = dict(industries=["Legal", "Finance"], min_per_industry=3, batch=5, interval=0)
+    return TemplateRefresher(TemplateStore(None), generate, **{**defaults, **kw})
+
+
+def test_low_lists_configured_and_stored_industries_below_the_minimum():
+    refresher = make_refresher(Generator())
+
+    async def run():
+        await refresher.store.add("Finance", templates("a", "b", "c"))
+        await refresher.store.add("Retail", templates("a"))
+        return refresher.low()
+
+    assert sorted(asyncio.run(run())) == ["Legal", "Retail"]
+
+
+def test_grow_keeps_going_until_the_target():
+    # 10 stored, 50 wanted: one batch of 5 used to stop at 15
+    generate = Generator()
+    refresher = make_refresher(generate)
+
+    async def run():
+        await refresher.store.add("Legal", templates(*(f"seed {i}" for i in range(10))))
+        return await refresher.grow("Legal", 50)
+
+    assert asyncio.run(run()) == 40
+    assert refresher.store.count("Legal") == 50
+    assert generate.calls == 8
+
+
+def test_grow_is_capped():
+    refresher = make_refresher(Generator(), max_per_industry=12)
+    asyncio.run(refresher.grow("Legal", 50))
+    assert refresher.store.count("Legal") == 15       # stops at the first batch past the cap
+
+
+def test_grow_stops_when_a_batch_adds_nothing():
+    failing, repeating = Generator(fail=True), Generator(repeat=True)
+    assert asyncio.run(make_refresher(failing).grow("Legal", 50)) == 0
+    assert failing.calls == 1
+    refresher = make_refresher(repeating)
+    assert asyncio.run(refresher.grow("Legal", 50)) == 5
+    assert repeating.calls == 2
+    assert refresher.failures == 0
+
+
+def test_top_up_counts_failures():
+    refresher = make_refresher(Generator(fail=True))
+    assert asyncio.run(refresher.top_up("Legal")) == 0
+    assert refresher.failures == 1 and refresher.generated == 0
+
+
+@pytest.mark.parametrize("bad", [{"count": 0}, {"count": 101}, {"offset": -1}])
+def test_template_request_bounds(bad):
+    with pytest.raises(pydantic.ValidationError):
+        TemplateRequest(industry="Legal", **bad)
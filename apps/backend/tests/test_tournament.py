@@ -0,0 +1,82 @@
+# tests/test_tournament.py
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from cache import ResponseCache
+from fewshot import FewShotIndex
+from singleflight import SingleFlight
+
+
+def reply(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def scores(*ids, best: str | None = None) -> str:
+    return json.dumps({"scores": [{"id": i, **{c: 5 if i == best else 3 for c in main.CRITERIA}} for i in ids]})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake Groq: answers echo the prompt; grading replies come from ``grades`` in order."""
+    state = SimpleNamespace(answers=[], grades=[], graded=[])
+
+    async def fake_call(model, temperature, messages, hedge=None, **kw):
+        if messages[0]["role"] == "system":
+            state.graded.append(messages[1]["content"])
+            return reply(state.grades.pop(0))
+        state.answers.append(messages[0]["content"])
+        await asyncio.sleep(0.01)
+        return reply(f"answer to {messages[0]['content']}")
+
+    monkeypatch.setattr(main, "call_groq_with_retry_async", fake_call)
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    monkeypatch.setattr(main, "inflight", SingleFlight())
+    monkeypatch.setattr(main, "fewshot_index", FewShotIndex(None))
+    monkeypatch.setattr(main, "TOURNAMENT_GRADE_BATCH", 2)
+    return state
+
+
+def tournament(*rewrites, original="orig"):
+    return main.compare_tournament(main.TournamentRequest(original_prompt=original, rewrites=list(rewrites)))
+
+
+def test_ranks_rewrites_and_dedupes_answers(upstream):
+    upstream.grades = [scores("O", "1", "2", best="2"), scores("O", "1")]
+    result = asyncio.run(tournament("a", "b", "a", "c"))
+    assert sorted(upstream.answers) == ["a", "b", "c", "orig"]     # "a" answered once
+    assert [r.rewritten_prompt for r in result.ranking][0] == "b"
+    assert [r.index for r in result.ranking if r.rewritten_prompt == "a"] == [0, 2]
+    assert result.upstream_calls == 4 + 2
+
+
+def test_missing_ids_are_asked_for_again(upstream):
+    upstream.grades = [scores("O", "1"), scores("O", "2", best="2")]
+    result = asyncio.run(tournament("a", "b"))
+    assert result.ranking[0].rewritten_prompt == "b"
+    assert "Answer 1:" not in upstream.graded[1] and "Answer 2:" in upstream.graded[1]
+    assert result.upstream_calls == 3 + 2
+
+
+def test_unusable_grades_are_a_502(upstream):
+    upstream.grades = ["no json at all", scores("O")]
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(tournament("a"))
+    assert e.value.status_code == 502
+    assert "answer(s) 1" in e.value.detail
+
+
+def test_upstream_calls_count_only_calls_this_request_led(upstream):
+    upstream.grades = [scores("O", "1"), scores("O", "1")]
+
+    async def run():
+        return await asyncio.gather(tournament("shared"), tournament("shared"))
+
+    first, second = asyncio.run(run())
+    assert sorted(upstream.answers) == ["orig", "shared"]
+    # two answers and two grading calls between them, not four answers
+    assert first.upstream_calls + second.upstream_calls == 2 + 2
@@ -0,0 +1,87 @@
+# tracing.py
+"""
+Opt-in request tracing.
+
+Set ``TRACE_EXPORT_URL`` (e.g. ``http://localhost:9411/api/v2/spans`` for a
+local Zipkin/Jaeger/OTel collector) to export spans in Zipkin v2 JSON, or
+``TRACE_FILE`` to append them as NDJSON. With neither set ``span()`` is a
+no-op apart from a contextvar lookup.
+"""
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+EXPORT_URL  = os.getenv("TRACE_EXPORT_URL")
+EXPORT_FILE = os.getenv("TRACE_FILE")
+SERVICE     = os.getenv("TRACE_SERVICE", "prettyprompt-backend")
+ENABLED     = bool(EXPORT_URL or EXPORT_FILE)
+FLUSH_EVERY = 64
+
+_current: contextvars.ContextVar[dict | None] = contextvars.ContextVar("span", default=None)
+_buffer: list[dict] = []
+_lock = threading.Lock()
+
+
+@contextmanager
+def span(name: str, root: bool = False, **tags):
+    if not ENABLED:
+        yield None
+        return
+    parent = None if root else _current.get()
+    s = {
+        "traceId":       parent["traceId"] if parent else secrets.token_hex(16),
+        "id":            secrets.token_hex(8),
+        "name":          name,
+        "timestamp":     int(time.time() * 1_000_000),
+        "localEndpoint": {"serviceName": SERVICE},
+        "tags":          {k: str(v) for k, v in tags.items()},
+    }
+    if parent:
+        s["parentId"] = parent["id"]
+    token = _current.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s["tags"]["error"] = type(e).__name__
+        raise
+    finally:
+        s["duration"] = max(1, int((time.perf_counter() - t0) * 1_000_000))
+        _current.reset(token)
+        _record(s)
+
+
+def _record(s: dict) -> None:
+    with _lock:
+        _buffer.append(s)
+        if len(_buffer) < FLUSH_EVERY:
+            return
+        batch = _buffer[:]
+        _buffer.clear()
+    threading.Thread(target=_export, args=(batch,), daemon=True).start()
+
+
+def flush() -> None:
+    with _lock:
+        batch = _buffer[:]
+        _buffer.clear()
+    if batch:
+        _export(batch)
+
+
+def _export(batch: list[dict]) -> None:
+    if EXPORT_FILE:
+        with open(EXPORT_FILE, "a", encoding="utf-8") as f:
+            for s in batch:
+                f.write(json.dumps(s) + "\n")
+    if EXPORT_URL:
+        try:
+            httpx.post(EXPORT_URL, json=batch, timeout=2.0)
+        except httpx.HTTPError as e:
+            print(f"trace export failed: {e}")
@@ -0,0 +1,241 @@
+# evaluate.py
+"""
+Offline evaluation of LoRA adapters saved by ``train.py``.
+
+Loads the base model (plus each adapter, merged) on CPU, generates rewrites
+for the test split in length-sorted batches with greedy decoding and the KV
+cache on, then scores them with local metrics: BLEU-4, ROUGE-L, length ratio
+and constraint retention (numbers, quoted strings, code spans, URLs and proper
+nouns from the input that survive into the rewrite).
+
+    python evaluate.py --model_name_or_path meta-llama/Llama-3.2-1B \\
+        --adapters base ../outputs/lora-r8 ../outputs/lora-r16 \\
+        --test_file ../data/processed/test.jsonl --output eval.json
+
+Decoding is deterministic and the report records the test file digest and
+generation settings, so reports from different runs are comparable.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import re
+import statistics
+from collections import Counter
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from utils import Timer, fit_prompts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_CONSTRAINT = re.compile(
+    r"https?://\S+"            # URLs
+    r"|`[^`]+`"                # code spans
+    r"|\"[^\"]+\"|'[^']{2,}'"  # quoted strings
+    r"|\b\d[\d.,:%]*\b"        # numbers, dates, percentages
+    r"|(?<=[a-z,;] )[A-Z][\w-]+"  # proper nouns (capitalised mid-sentence)
+)
+
+
+# ─── Metrics ───
+def tokens(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def bleu(pred: list[str], ref: list[str], max_n: int = 4) -> float:
+    """Sentence BLEU-4 with add-one smoothing on the higher-order precisions."""
+    if not pred or not ref:
+        return 0.0
+    log_p = 0.0
+    for n in range(1, max_n + 1):
+        p_ngrams = Counter(tuple(pred[i:i + n]) for i in range(len(pred) - n + 1))
+        r_ngrams = Counter(tuple(ref[i:i + n]) for i in range(len(ref) - n + 1))
+        overlap = sum((p_ngrams & r_ngrams).values())
+        total = max(1, sum(p_ngrams.values()))
+        log_p += math.log((overlap + (n > 1)) / (total + (n > 1)) or 1e-9) / max_n
+    brevity = min(0.0, 1 - len(ref) / len(pred))
+    return math.exp(log_p + brevity)
+
+
+def rouge_l(pred: list[str], ref: list[str]) -> float:
+    """ROUGE-L F1 from the longest common subsequence."""
+    if not pred or not ref:
+        return 0.0
+    prev = [0] * (len(ref) + 1)
+    for p in pred:
+        cur = [0]
+        for j, r in enumerate(ref):
+            cur.append(prev[j] + 1 if p == r else max(prev[j + 1], cur[j]))
+        prev = cur
+    lcs = prev[-1]
+    if lcs == 0:
+        return 0.0
+    precision, recall = lcs / len(pred), lcs / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def constraint_retention(source: str, pred: str) -> float | None:
+    """Share of hard details in ``source`` that appear verbatim in ``pred``; None if there are none."""
+    found = {m.strip("\"'`").lower() for m in _CONSTRAINT.findall(source)}
+    if not found:
+        return None
+    pred = pred.lower()
+    return sum(c in pred for c in found) / len(found)
+
+
+def score(example: dict, pred: str) -> dict:
+    p, r = tokens(pred), tokens(example["output"])
+    return {
+        "bleu":         bleu(p, r),
+        "rouge_l":      rouge_l(p, r),
+        "length_ratio": len(p) / max(1, len(r)),
+        "retention":    constraint_retention(example["input"], pred),
+    }
+
+
+# ─── Generation ───
+def load_model(model_name_or_path: str, adapter: str | None):
+    model = AutoModelForCausalLM.from_pretrained(model_name_or_path, torch_dtype=torch.float32)
+    if adapter:
+        from peft import PeftModel
+
+        # merging folds the LoRA deltas into the base weights: no adapter overhead per token
+        model = PeftModel.from_pretrained(model, adapter).merge_and_unload()
+    return model.eval()
+
+
+@torch.inference_mode()
+def generate_all(model, tokenizer, prompts: list[str], args) -> tuple[list[str], list[dict]]:
+    """
+    Generate in batches of similar prompt length (longest first, so memory
+    problems surface immediately) and return predictions in input order plus
+    per-batch timings. ``prompts`` come from ``fit_prompts``, so the
+    truncation here only ever trims a token at the front.
+    """
+    lengths = [len(ids) for ids in tokenizer(prompts, truncation=True, max_length=args.max_input_length)["input_ids"]]
+    order = sorted(range(len(prompts)), key=lambda i: -lengths[i])
+
+    preds: list[str] = [""] * len(prompts)
+    batches = []
+    for start in range(0, len(order), args.batch_size):
+        idx = order[start:start + args.batch_size]
+        enc = tokenizer([prompts[i] for i in idx], return_tensors="pt", padding=True,
+                        truncation=True, max_length=args.max_input_length)
+        with Timer() as t:
+            out = model.generate(
+                **enc,
+                max_new_tokens=args.max_new_tokens,
+                do_sample=False,
+                use_cache=True,
+                pad_token_id=tokenizer.pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+            )
+        new = out[:, enc["input_ids"].shape[1]:]
+        generated = int((new != tokenizer.pad_token_id).sum())
+        for i, text in zip(idx, tokenizer.batch_decode(new, skip_special_tokens=True)):
+            preds[i] = text.strip()
+        batches.append({"size": len(idx), "seconds": t.seconds, "generated_tokens": generated})
+    return preds, batches
+
+
+def summarize(examples: list[dict], preds: list[str], batches: list[dict]) -> dict:
+    scores = [score(ex, p) for ex, p in zip(examples, preds)]
+    retained = [s["retention"] for s in scores if s["retention"] is not None]
+    seconds = sum(b["seconds"] for b in batches)
+    per_example = sorted(b["seconds"] / b["size"] for b in batches for _ in range(b["size"]))
+    return {
+        "examples":            len(examples),
+        "bleu":                round(statistics.fmean(s["bleu"] for s in scores), 4),
+        "rouge_l":             round(statistics.fmean(s["rouge_l"] for s in scores), 4),
+        "length_ratio":        round(statistics.median(s["length_ratio"] for s in scores), 3),
+        "constraint_retention": round(statistics.fmean(retained), 4) if retained else None,
+        "seconds":             round(seconds, 2),
+        "examples_per_sec":    round(len(examples) / max(seconds, 1e-9), 2),
+        "gen_tokens_per_sec":  round(sum(b["generated_tokens"] for b in batches) / max(seconds, 1e-9), 1),
+        "latency_p50":         round(per_example[len(per_example) // 2], 4),
+        "latency_p95":         round(per_example[min(len(per_example) - 1, int(0.95 * len(per_example)))], 4),
+    }
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--model_name_or_path", required=True)
+    p.add_argument("--adapters", nargs="+", default=["base"],
+                   help="adapter dirs to evaluate; 'base' means the model without an adapter")
+    p.add_argument("--test_file",        default="../data/processed/test.jsonl")
+    p.add_argument("--limit",            type=int, default=0, help="evaluate only the first N examples")
+    p.add_argument("--batch_size",       type=int, default=8)
+    p.add_argument("--max_input_length", type=int, default=512)
+    p.add_argument("--max_new_tokens",   type=int, default=256)
+    p.add_argument("--threads",          type=int, default=0, help="torch CPU threads (0 = torch default)")
+    p.add_argument("--output",           default="eval.json")
+    p.add_argument("--predictions",      default=None, help="also write per-example predictions (JSONL)")
+    args = p.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with open(args.test_file, encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    if args.limit:
+        examples = examples[:args.limit]
+    if not examples:
+        p.error(f"{args.test_file} has no examples; run preprocess.py with a test split first")
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, use_fast=True)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"   # decoder-only batching: pad before the prompt
+    tokenizer.truncation_side = "left"
+    prompts, truncated = fit_prompts(tokenizer, [ex["mode"] for ex in examples], [ex["target"] for ex in examples],
+                                     [ex["input"] for ex in examples], args.max_input_length)
+    if truncated:
+        logger.warning(f"{truncated}/{len(examples)} inputs cut to fit --max_input_length {args.max_input_length}")
+
+    report = {
+        "config": {
+            "model":            args.model_name_or_path,
+            "test_file":        args.test_file,
+            "test_digest":      file_digest(args.test_file),
+            "examples":         len(examples),
+            "truncated_inputs": truncated,
+            "batch_size":       args.batch_size,
+            "max_input_length": args.max_input_length,
+            "max_new_tokens":   args.max_new_tokens,
+            "threads":          torch.get_num_threads(),
+        },
+        "results": {},
+    }
+    pred_rows = []
+    for adapter in args.adapters:
+        model = load_model(args.model_name_or_path, None if adapter == "base" else adapter)
+        preds, batches = generate_all(model, tokenizer, prompts, args)
+        report["results"][adapter] = summarize(examples, preds, batches)
+        logger.info(f"{adapter}: {report['results'][adapter]}")
+        pred_rows += [{"adapter": adapter, **ex, "prediction": pr} for ex, pr in zip(examples, preds)]
+        del model
+
+    cols = ("bleu", "rouge_l", "length_ratio", "constraint_retention", "examples_per_sec", "latency_p50")
+    logger.info("%-28s " + " ".join("%12s" for _ in cols), "adapter", *cols)
+    for adapter, r in report["results"].items():
+        logger.info("%-28s " + " ".join("%12s" for _ in cols), adapter[-28:], *(r[c] for c in cols))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.predictions:
+        with open(args.predictions, "w", encoding="utf-8") as f:
+            for row in pred_rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
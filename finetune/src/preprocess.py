@@ -0,0 +1,382 @@
+# preprocess.py
+"""
+Offline preprocessing for the LoRA trainer.
+
+``split``: stream ``data/raw/prompts_raw.jsonl`` through a process pool,
+normalize each record to the ``mode/target/input/output`` schema, drop exact
+and near-duplicates (MinHash LSH) and write a deterministic
+train/dev/test split.
+
+    python preprocess.py split --raw_file ../data/raw/prompts_raw.jsonl \\
+        --out_dir ../data/processed --workers 8
+
+``tokenize``: tokenize the processed splits once and store them as flat
+token arrays plus offsets, keyed by tokenizer fingerprint, max_seq_length
+and the split files' content hash. ``train.py --token_cache DIR`` then
+memory-maps the arrays instead of re-tokenizing every run.
+
+    python preprocess.py tokenize --model_name_or_path meta-llama/Llama-3.2-1B \\
+        --train_file ../data/processed/train.jsonl \\
+        --validation_file ../data/processed/dev.jsonl \\
+        --cache_dir ../data/cache
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils import encode_examples
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+ENCODE_BATCH = 1024
+
+# ─── Raw → processed ───
+INPUT_KEYS = ("input", "prompt", "original", "original_prompt", "raw_prompt")
+OUTPUT_KEYS = ("output", "rewrite", "rewritten", "rewritten_prompt", "completion")
+TARGET_KEYS = ("target", "target_model")
+DEFAULT_MODE = "rewrite"
+DEFAULT_TARGET = "gpt4o"
+
+SPLIT_CHUNK = 5000           # raw lines per worker task
+SHINGLE = 3                  # word n-grams hashed into the MinHash
+NUM_PERM = 64
+BANDS = 8                    # 8 bands × 8 rows: ~77% Jaccard threshold
+MASK32 = np.uint64((1 << 32) - 1)
+
+_rng = np.random.default_rng(0x5EED)
+PERM_A = _rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+_WS = re.compile(r"[ \t\u00a0]+")
+_BLANKS = re.compile(r"\n{3,}")
+
+
+def clean_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", str(text)).replace("\r\n", "\n").replace("\r", "\n")
+    text = "\n".join(_WS.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANKS.sub("\n\n", text).strip()
+
+
+def _first(rec: dict, keys: tuple[str, ...]):
+    return next((rec[k] for k in keys if rec.get(k)), None)
+
+
+def normalize_record(rec: dict) -> dict | None:
+    """Map a raw record onto the training schema, or None if it's unusable."""
+    inp, out = _first(rec, INPUT_KEYS), _first(rec, OUTPUT_KEYS)
+    if not isinstance(inp, str) or not isinstance(out, str):
+        return None
+    inp, out = clean_text(inp), clean_text(out)
+    if not inp or not out or inp == out:
+        return None
+    return {
+        "mode":   str(rec.get("mode") or DEFAULT_MODE).strip().lower(),
+        "target": str(_first(rec, TARGET_KEYS) or DEFAULT_TARGET).strip().lower(),
+        "input":  inp,
+        "output": out,
+    }
+
+
+def _h64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def minhash_bands(text: str) -> list[int]:
+    """One 64-bit key per LSH band; records sharing any band are near-duplicates."""
+    words = text.lower().split() or [""]
+    w = np.fromiter((zlib.crc32(t.encode()) for t in words), dtype=np.uint64, count=len(words))
+    # combine word hashes into SHINGLE-gram hashes without building the strings
+    x = w[: max(1, len(w) - SHINGLE + 1)].copy()
+    for k in range(1, min(SHINGLE, len(w))):
+        x = (x * np.uint64(0x9E3779B1) + w[k : k + len(x)]) & MASK32
+    sig = ((np.outer(x, PERM_A) + PERM_B) & MASK32).min(axis=0).astype(np.uint32)
+    return [_h64(bytes([b]) + band.tobytes()) for b, band in enumerate(sig.reshape(BANDS, -1))]
+
+
+def process_chunk(lines: list[str]) -> tuple[list[tuple], Counter]:
+    """
+    Worker side: parse, normalize and fingerprint one chunk. Returns
+    ``(record, exact_key, band_keys, split_key)`` tuples in input order.
+    """
+    out, rejected = [], Counter()
+    for line in lines:
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError:
+            rejected["bad_json"] += 1
+            continue
+        rec = normalize_record(rec) if isinstance(rec, dict) else None
+        if rec is None:
+            rejected["missing_fields"] += 1
+            continue
+        prompt = rec["input"].lower()
+        exact = _h64("\x1f".join((rec["mode"], rec["target"], prompt, rec["output"])).encode())
+        bands = minhash_bands(f"{rec['mode']} {rec['target']} {rec['input']} {rec['output']}")
+        # split on the prompt alone so rewrites of one prompt never straddle splits
+        out.append((rec, exact, bands, hashlib.sha256(prompt.encode()).digest()))
+    return out, rejected
+
+
+def iter_line_chunks(path: str, size: int):
+    chunk = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                chunk.append(line)
+                if len(chunk) == size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+
+def ordered_pool_map(fn, items, workers: int):
+    """
+    ``executor.map`` submits every item up front; this keeps at most
+    ``2 * workers`` chunks in flight so memory stays flat on huge inputs,
+    and still yields results in input order.
+    """
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    with ProcessPoolExecutor(workers) as ex:
+        pending = deque()
+        for item in items:
+            pending.append(ex.submit(fn, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def assign_split(split_key: bytes, seed: str, dev_frac: float, test_frac: float) -> str:
+    u = int.from_bytes(hashlib.sha256(seed.encode() + split_key).digest()[:8], "big") / 2 ** 64
+    if u < test_frac:
+        return "test"
+    if u < test_frac + dev_frac:
+        return "dev"
+    return "train"
+
+
+def split_raw(raw_file: str, out_dir: str, workers: int, dev_frac: float = 0.05,
+              test_frac: float = 0.05, seed: str = "prettyprompt", near_dedup: bool = True) -> dict:
+    """
+    Dedup runs in the parent, in input order, so the first occurrence wins and
+    the output is identical for any worker count.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    seen_exact: set[int] = set()
+    seen_bands: set[int] = set()
+    stats = Counter()
+    t0 = time.perf_counter()
+    outs = {s: open(os.path.join(out_dir, f"{s}.jsonl"), "w", encoding="utf-8") for s in ("train", "dev", "test")}
+    try:
+        for results, rejected in ordered_pool_map(process_chunk, iter_line_chunks(raw_file, SPLIT_CHUNK), workers):
+            stats.update(rejected)
+            for rec, exact, bands, split_key in results:
+                if exact in seen_exact:
+                    stats["exact_duplicates"] += 1
+                    continue
+                seen_exact.add(exact)
+                if near_dedup:
+                    if any(b in seen_bands for b in bands):
+                        stats["near_duplicates"] += 1
+                        continue
+                    seen_bands.update(bands)
+                split = assign_split(split_key, seed, dev_frac, test_frac)
+                outs[split].write(json.dumps(rec, ensure_ascii=False) + "\n")
+                stats[split] += 1
+    finally:
+        for f in outs.values():
+            f.close()
+
+    seconds = time.perf_counter() - t0
+    stats["kept"] = stats["train"] + stats["dev"] + stats["test"]
+    read = stats["kept"] + stats["exact_duplicates"] + stats["near_duplicates"] \
+        + stats["bad_json"] + stats["missing_fields"]
+    return {**stats, "read": read, "seconds": round(seconds, 2),
+            "records_per_sec": round(read / max(seconds, 1e-9), 1)}
+
+
+# ─── Cache keys ───
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hash of everything that changes token ids: vocab/merges, normalizer, specials."""
+    h = hashlib.sha256()
+    h.update(type(tokenizer).__name__.encode())
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        spec = json.loads(backend.to_str())
+        # runtime truncation/padding settings are stored here too; they change
+        # after the first encode call and don't affect the ids we cache
+        spec.pop("truncation", None)
+        spec.pop("padding", None)
+        h.update(json.dumps(spec, sort_keys=True).encode())
+    else:
+        h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def cache_path(cache_dir: str, tokenizer, max_seq_length: int, files: dict[str, str]) -> str:
+    key = hashlib.sha256(json.dumps({
+        "version":        CACHE_VERSION,
+        "tokenizer":      tokenizer_fingerprint(tokenizer),
+        "max_seq_length": max_seq_length,
+        "files":          {split: file_digest(p) for split, p in sorted(files.items())},
+    }, sort_keys=True).encode()).hexdigest()[:20]
+    return os.path.join(cache_dir, key)
+
+
+# ─── Writing ───
+def iter_jsonl_batches(path: str, batch_size: int):
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def token_dtype(tokenizer):
+    return np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32
+
+
+def write_split(path: str, out_dir: str, split: str, tokenizer, max_seq_length: int) -> dict:
+    """
+    Stream ``path`` in batches, appending token ids to ``{split}.tokens.bin``.
+    ``{split}.offsets.npy`` holds N+1 int64 boundaries into that array.
+    """
+    dtype = token_dtype(tokenizer)
+    offsets = [0]
+    tmp = os.path.join(out_dir, f"{split}.tokens.bin.tmp")
+    with open(tmp, "wb") as out:
+        for batch in iter_jsonl_batches(path, ENCODE_BATCH):
+            seqs = encode_examples(
+                tokenizer,
+                [r["mode"] for r in batch], [r["target"] for r in batch],
+                [r["input"] for r in batch], [r["output"] for r in batch],
+                max_seq_length,
+            )
+            for ids in seqs:
+                np.asarray(ids, dtype=dtype).tofile(out)
+                offsets.append(offsets[-1] + len(ids))
+    os.replace(tmp, os.path.join(out_dir, f"{split}.tokens.bin"))
+    np.save(os.path.join(out_dir, f"{split}.offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    return {"examples": len(offsets) - 1, "tokens": offsets[-1]}
+
+
+def build_token_cache(tokenizer, files: dict[str, str], max_seq_length: int, cache_dir: str) -> str:
+    """Return the cache directory for ``files``, building it if it's missing."""
+    out_dir = cache_path(cache_dir, tokenizer, max_seq_length, files)
+    meta_file = os.path.join(out_dir, "meta.json")
+    if os.path.exists(meta_file):
+        logger.info(f"Token cache hit: {out_dir}")
+        return out_dir
+
+    os.makedirs(out_dir, exist_ok=True)
+    meta = {
+        "version":        CACHE_VERSION,
+        "tokenizer":      tokenizer_fingerprint(tokenizer),
+        "max_seq_length": max_seq_length,
+        "dtype":          np.dtype(token_dtype(tokenizer)).name,
+        "splits":         {},
+    }
+    for split, path in files.items():
+        meta["splits"][split] = write_split(path, out_dir, split, tokenizer, max_seq_length)
+        logger.info(f"Tokenized {split}: {meta['splits'][split]}")
+    # meta.json last: its presence marks a complete cache
+    with open(meta_file, "w") as f:
+        json.dump(meta, f, indent=2)
+    return out_dir
+
+
+# ─── Reading ───
+class TokenizedSplit:
+    """
+    Memory-mapped view of one split. Items come back in the same shape as
+    ``train.tokenize_examples`` rows, so the same collator works on both.
+    """
+
+    def __init__(self, cache: str, split: str):
+        with open(os.path.join(cache, "meta.json")) as f:
+            meta = json.load(f)
+        path = os.path.join(cache, f"{split}.tokens.bin")
+        # mmap refuses empty files; an empty split is just an empty array
+        self.tokens = (np.memmap(path, dtype=meta["dtype"], mode="r") if os.path.getsize(path)
+                       else np.zeros(0, dtype=meta["dtype"]))
+        self.offsets = np.load(os.path.join(cache, f"{split}.offsets.npy"), mmap_mode="r")
+        self.lengths = np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> dict:
+        ids = self.tokens[self.offsets[i]:self.offsets[i + 1]].astype(np.int64).tolist()
+        return {"input_ids": ids, "attention_mask": [1] * len(ids), "labels": list(ids)}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("split", help="normalize, dedup and split the raw corpus")
+    s.add_argument("--raw_file",  default="../data/raw/prompts_raw.jsonl")
+    s.add_argument("--out_dir",   default="../data/processed")
+    s.add_argument("--workers",   type=int, default=os.cpu_count() or 1)
+    s.add_argument("--dev_frac",  type=float, default=0.05)
+    s.add_argument("--test_frac", type=float, default=0.05)
+    s.add_argument("--seed",      default="prettyprompt", help="salt for the split hash")
+    s.add_argument("--no_near_dedup", dest="near_dedup", action="store_false",
+                   help="exact dedup only")
+
+    t = sub.add_parser("tokenize", help="build the memory-mapped token cache")
+    t.add_argument("--model_name_or_path", required=True)
+    t.add_argument("--train_file",         required=True)
+    t.add_argument("--validation_file",    required=True)
+    t.add_argument("--max_seq_length", type=int, default=512)
+    t.add_argument("--cache_dir",      default="../data/cache")
+
+    args = p.parse_args()
+    if args.command == "split":
+        stats = split_raw(args.raw_file, args.out_dir, args.workers, args.dev_frac,
+                          args.test_frac, args.seed, args.near_dedup)
+        logger.info(f"Split done: {stats}")
+    elif args.command == "tokenize":
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, use_fast=True)
+        tokenizer.pad_token = tokenizer.eos_token
+        out = build_token_cache(
+            tokenizer,
+            {"train": args.train_file, "validation": args.validation_file},
+            args.max_seq_length,
+            args.cache_dir,
+        )
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
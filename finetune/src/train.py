@@ -1,20 +1,27 @@
 # train.py
 import argparse
+import json
 import logging
 import os
 from dataclasses import dataclass
 
 import torch
 from datasets import load_dataset
+from torch.utils.data import DataLoader
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
     Trainer,
     TrainingArguments,
     DataCollatorForLanguageModeling,
+    DataCollatorForSeq2Seq,
 )
+from transformers.trainer_pt_utils import LengthGroupedSampler
 from peft import LoraConfig, get_peft_model, TaskType
 
+from preprocess import TokenizedSplit, build_token_cache
+from utils import Timer, TokenCounter, encode_examples, format_prompt
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -32,6 +39,11 @@ class ScriptArgs:
     lora_alpha: int
     lora_dropout: float = 0.05
     max_seq_length: int = 512
+    padding: str = "dynamic"
+    packing: bool = False
+    group_by_length: bool = True
+    benchmark_steps: int = 0
+    token_cache: str | None = None
 
 def parse_args() -> ScriptArgs:
     p = argparse.ArgumentParser()
@@ -47,6 +59,16 @@ def parse_args() -> ScriptArgs:
     p.add_argument("--lora_alpha",     type=int, default=16)
     p.add_argument("--lora_dropout",   type=float, default=0.05)
     p.add_argument("--max_seq_length", type=int, default=512)
+    p.add_argument("--padding", choices=["dynamic", "max_length"], default="dynamic",
+                   help="dynamic: pad per batch; max_length: legacy fixed-length path")
+    p.add_argument("--packing", action="store_true",
+                   help="concatenate short examples into max_seq_length sequences")
+    p.add_argument("--no_group_by_length", dest="group_by_length", action="store_false",
+                   help="disable length-bucketed batching")
+    p.add_argument("--benchmark_steps", type=int, default=0,
+                   help="time N forward/backward steps per data path, print tokens/s, and exit")
+    p.add_argument("--token_cache", default=None, metavar="DIR",
+                   help="memory-map pre-tokenized splits from DIR (built by preprocess.py if missing)")
     args = p.parse_args()
     return ScriptArgs(**vars(args))
 
@@ -56,7 +78,7 @@ def preprocess_examples(examples, tokenizer, max_seq_length):
         examples["mode"], examples["target"], examples["input"], examples["output"]
     ):
         # Build the prompt string
-        prompt = f"MODE: {mode}\nTARGET: {target}\nPROMPT: {inp}\n\nREWRITE:"
+        prompt = format_prompt(mode, target, inp)
         full = prompt + " " + out
         tok = tokenizer(
             full,
@@ -70,6 +92,180 @@ def preprocess_examples(examples, tokenizer, max_seq_length):
         labels.append(input_ids.copy())
     return {"input_ids": inputs, "labels": labels}
 
+def tokenize_examples(examples, tokenizer, max_seq_length):
+    """
+    Unpadded variant of ``preprocess_examples``: one EOS closes each example
+    and counts in the loss; padding is left to the collator, which masks it
+    with -100. ``length`` feeds the length-grouped sampler.
+    """
+    input_ids = encode_examples(
+        tokenizer, examples["mode"], examples["target"], examples["input"], examples["output"],
+        max_seq_length,
+    )
+    labels = [ids.copy() for ids in input_ids]
+    lengths = [len(ids) for ids in input_ids]
+    return {
+        "input_ids": input_ids,
+        "attention_mask": [[1] * n for n in lengths],
+        "labels": labels,
+        "length": lengths,
+    }
+
+def pack_examples(examples, max_seq_length):
+    """
+    Greedily concatenate tokenized examples (in order) into sequences of at
+    most ``max_seq_length`` tokens. Examples are never split; each already
+    ends in EOS so the model sees the boundary.
+    """
+    packed = {"input_ids": [], "attention_mask": [], "labels": [], "length": []}
+    cur_ids, cur_labels = [], []
+
+    def flush():
+        if cur_ids:
+            packed["input_ids"].append(cur_ids)
+            packed["attention_mask"].append([1] * len(cur_ids))
+            packed["labels"].append(cur_labels)
+            packed["length"].append(len(cur_ids))
+
+    for ids, lab in zip(examples["input_ids"], examples["labels"]):
+        if cur_ids and len(cur_ids) + len(ids) > max_seq_length:
+            flush()
+            cur_ids, cur_labels = [], []
+        cur_ids = cur_ids + ids
+        cur_labels = cur_labels + lab
+    flush()
+    return packed
+
+def build_datasets(ds, tokenizer, args):
+    if args.padding == "max_length":
+        ds = ds.map(
+            lambda ex: preprocess_examples(ex, tokenizer, args.max_seq_length),
+            batched=True,
+            remove_columns=ds["train"].column_names,
+        )
+        return ds, DataCollatorForLanguageModeling(tokenizer, mlm=False)
+
+    ds = ds.map(
+        lambda ex: tokenize_examples(ex, tokenizer, args.max_seq_length),
+        batched=True,
+        remove_columns=ds["train"].column_names,
+    )
+    if args.packing:
+        ds = ds.map(
+            lambda ex: pack_examples(ex, args.max_seq_length),
+            batched=True,
+            batch_size=1000,
+            remove_columns=ds["train"].column_names,
+        )
+    collator = DataCollatorForSeq2Seq(
+        tokenizer, padding="longest", pad_to_multiple_of=8, label_pad_token_id=-100
+    )
+    return ds, collator
+
+def cached_datasets(tokenizer, args):
+    """
+    Train/validation as memory-mapped views over the token cache: no JSON
+    parsing or tokenization on a warm start, and the token arrays are shared
+    through the page cache rather than copied into each process.
+    """
+    if args.padding != "dynamic" or args.packing:
+        raise ValueError("--token_cache supports --padding dynamic without --packing")
+    data_files = {"train": args.train_file, "validation": args.validation_file}
+    with Timer() as t:
+        cache = build_token_cache(tokenizer, data_files, args.max_seq_length, args.token_cache)
+        ds = {split: TokenizedSplit(cache, split) for split in data_files}
+    logger.info(f"Token cache ready in {t.seconds:.2f}s: {cache}")
+    collator = DataCollatorForSeq2Seq(
+        tokenizer, padding="longest", pad_to_multiple_of=8, label_pad_token_id=-100
+    )
+    return ds, collator
+
+class CountingTrainer(Trainer):
+    """
+    Trainer that counts tokens in training batches only. Eval batches go
+    through the plain collator, and time spent in ``evaluate`` is tracked
+    so it can be left out of training tokens/s. With ``group_by_length``,
+    a train set that already knows its lengths (``TokenizedSplit.lengths``)
+    hands them to the sampler instead of having every row decoded to
+    measure it.
+    """
+
+    def __init__(self, *args, token_counter: TokenCounter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_counter = token_counter
+        self.eval_seconds = 0.0
+
+    def get_train_dataloader(self):
+        collator = self.data_collator
+        self.data_collator = self.token_counter
+        try:
+            return super().get_train_dataloader()
+        finally:
+            self.data_collator = collator
+
+    def _get_train_sampler(self, *args, **kwargs):
+        lengths = getattr(self.train_dataset, "lengths", None)
+        if self.args.group_by_length and lengths is not None:
+            return LengthGroupedSampler(
+                self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                lengths=lengths.tolist(),
+            )
+        return super()._get_train_sampler(*args, **kwargs)
+
+    def evaluate(self, *args, **kwargs):
+        with Timer() as t:
+            metrics = super().evaluate(*args, **kwargs)
+        self.eval_seconds += t.seconds
+        return metrics
+
+def legacy_pad_id(args, tokenizer):
+    return tokenizer.pad_token_id if args.padding == "max_length" else None
+
+def benchmark_paths(model, tokenizer, raw_ds, args):
+    """
+    Throughput comparison: run ``benchmark_steps`` forward/backward passes on
+    the legacy fixed-length path, the dynamic/bucketed path and the packed
+    path with identical micro-batch size, and report tokens/second for each.
+    """
+    from dataclasses import replace
+
+    variants = [
+        ("max_length (legacy)", replace(args, padding="max_length", packing=False)),
+        ("dynamic + buckets",   replace(args, padding="dynamic", packing=False)),
+        ("dynamic + packing",   replace(args, padding="dynamic", packing=True)),
+    ]
+    optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=args.learning_rate)
+    model.train()
+    rows = []
+    for name, v in variants:
+        ds, collator = build_datasets(raw_ds, tokenizer, v)
+        train = ds["train"]
+        sampler = None
+        if v.padding == "dynamic":
+            sampler = LengthGroupedSampler(args.micro_batch_size, lengths=train["length"])
+        keep = [c for c in train.column_names if c in ("input_ids", "attention_mask", "labels")]
+        counter = TokenCounter(collator, legacy_pad_id(v, tokenizer))
+        loader = DataLoader(train.select_columns(keep), batch_size=args.micro_batch_size,
+                            sampler=sampler, shuffle=sampler is None, collate_fn=counter)
+        with Timer() as t:
+            for step, batch in enumerate(loader):
+                if step >= args.benchmark_steps:
+                    break
+                batch = {k: b.to(model.device) for k, b in batch.items()}
+                model(**batch).loss.backward()
+                optimizer.step()
+                optimizer.zero_grad()
+        rows.append({"path": name, **counter.report(t.seconds)})
+
+    logger.info("%-22s %10s %12s %10s", "path", "pad %", "real tok/s", "seconds")
+    for r in rows:
+        logger.info("%-22s %9.1f%% %12.1f %10.2f", r["path"], 100 * r["pad_fraction"],
+                    r["real_tokens_per_sec"], r["seconds"])
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "throughput_benchmark.json"), "w") as f:
+        json.dump(rows, f, indent=2)
+    return rows
+
 def main():
     args = parse_args()
 
@@ -95,16 +291,16 @@ def main():
 
     # load datasets
     data_files = {"train": args.train_file, "validation": args.validation_file}
-    ds = load_dataset("json", data_files=data_files)
+    if args.benchmark_steps:
+        benchmark_paths(model, tokenizer, load_dataset("json", data_files=data_files), args)
+        return
 
     # preprocess
-    ds = ds.map(
-        lambda ex: preprocess_examples(ex, tokenizer, args.max_seq_length),
-        batched=True,
-        remove_columns=ds["train"].column_names,
-    )
-
-    data_collator = DataCollatorForLanguageModeling(tokenizer, mlm=False)
+    if args.token_cache:
+        ds, collator = cached_datasets(tokenizer, args)
+    else:
+        ds, collator = build_datasets(load_dataset("json", data_files=data_files), tokenizer, args)
+    token_counter = TokenCounter(collator, legacy_pad_id(args, tokenizer))
 
     # compute gradient accumulation
     gradient_accumulation_steps = args.batch_size // args.micro_batch_size
@@ -124,18 +320,35 @@ def main():
         save_steps=500,
         load_best_model_at_end=True,
         report_to="none",  # disable WandB/others
+        # bucket similar lengths together so dynamic padding stays small
+        group_by_length=args.group_by_length and args.padding == "dynamic",
+        length_column_name="length",
     )
 
-    trainer = Trainer(
+    trainer = CountingTrainer(
         model=model,
         args=training_args,
         train_dataset=ds["train"],
         eval_dataset=ds["validation"],
-        data_collator=data_collator,
+        data_collator=collator,
         tokenizer=tokenizer,
+        token_counter=token_counter,
     )
 
-    trainer.train()
+    with Timer() as t:
+        trainer.train()
+    throughput = {
+        "padding": args.padding,
+        "packing": args.packing,
+        "group_by_length": training_args.group_by_length,
+        "eval_seconds": round(trainer.eval_seconds, 2),
+        **token_counter.report(t.seconds - trainer.eval_seconds),
+    }
+    logger.info(f"Throughput: {throughput}")
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "throughput.json"), "w") as f:
+        json.dump(throughput, f, indent=2)
+
     # save the LoRA adapter
     model.save_pretrained(args.output_dir)
     logger.info(f"LoRA adapter and config saved to {args.output_dir}")
@@ -0,0 +1,86 @@
+# utils.py
+"""Helpers shared by the fine-tuning scripts."""
+import time
+
+PROMPT_TEMPLATE = "MODE: {mode}\nTARGET: {target}\nPROMPT: {input}\n\nREWRITE:"
+
+
+def format_prompt(mode: str, target: str, inp: str) -> str:
+    """The exact prefix the adapter is trained on (and must be served with)."""
+    return PROMPT_TEMPLATE.format(mode=mode, target=target, input=inp)
+
+
+def fit_prompts(tokenizer, modes, targets, inputs, max_length: int) -> tuple[list[str], int]:
+    """
+    Prompts that fit in ``max_length`` tokens with the template intact: an
+    over-long input is cut, never the trailing "REWRITE:" the model continues
+    from. Returns the prompts and how many inputs had to be cut.
+    """
+    frames = tokenizer([format_prompt(m, t, "") for m, t in zip(modes, targets)])["input_ids"]
+    encoded = tokenizer(list(inputs), add_special_tokens=False)["input_ids"]
+    prompts, cut = [], 0
+    for m, t, inp, frame, ids in zip(modes, targets, inputs, frames, encoded):
+        room = max(0, max_length - len(frame))
+        if len(ids) > room:
+            inp = tokenizer.decode(ids[:room])
+            cut += 1
+        prompts.append(format_prompt(m, t, inp))
+    return prompts, cut
+
+
+def encode_examples(tokenizer, modes, targets, inputs, outputs, max_seq_length: int) -> list[list[int]]:
+    """
+    Tokenize full training sequences (prompt + " " + rewrite) in one batched
+    call, truncated to leave room for the closing EOS that is appended.
+    """
+    texts = [format_prompt(m, t, i) + " " + o for m, t, i, o in zip(modes, targets, inputs, outputs)]
+    enc = tokenizer(texts, truncation=True, max_length=max_seq_length - 1)
+    return [ids + [tokenizer.eos_token_id] for ids in enc["input_ids"]]
+
+
+class TokenCounter:
+    """
+    Wraps a data collator and counts real vs padded tokens for every batch it
+    builds, so runs can report tokens/second. "Real" is attention_mask == 1,
+    or input_ids != pad_token_id when one is given — the legacy max_length path
+    pre-pads every example, so its mask is all ones.
+    """
+
+    def __init__(self, collator, pad_token_id: int | None = None):
+        self.collator = collator
+        self.pad_token_id = pad_token_id
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.batches = 0
+
+    def __call__(self, features):
+        batch = self.collator(features)
+        self.batches += 1
+        self.padded_tokens += batch["input_ids"].numel()
+        if self.pad_token_id is not None:
+            self.real_tokens += int((batch["input_ids"] != self.pad_token_id).sum())
+        elif "attention_mask" in batch:
+            self.real_tokens += int(batch["attention_mask"].sum())
+        else:
+            self.real_tokens += batch["input_ids"].numel()
+        return batch
+
+    def report(self, seconds: float) -> dict:
+        return {
+            "seconds":             round(seconds, 2),
+            "batches":             self.batches,
+            "real_tokens":         self.real_tokens,
+            "padded_tokens":       self.padded_tokens,
+            "pad_fraction":        round(1 - self.real_tokens / max(1, self.padded_tokens), 4),
+            "real_tokens_per_sec": round(self.real_tokens / max(seconds, 1e-9), 1),
+            "all_tokens_per_sec":  round(self.padded_tokens / max(seconds, 1e-9), 1),
+        }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
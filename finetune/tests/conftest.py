@@ -0,0 +1,36 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+WORDS = ("MODE: TARGET: PROMPT: REWRITE: rewrite shorten casual gpt4o claude write a poem about the sea "
+         "summarize this report for executives in three bullet points clear specific").split()
+
+
+@pytest.fixture(scope="session")
+def tokenizer():
+    """A whitespace-level fast tokenizer over ``WORDS``, so no download is needed."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {w: i for i, w in enumerate(["<eos>", "<unk>", *WORDS])}
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tok.decoder = decoders.WordPiece(prefix="##")       # rejoins words with spaces
+    fast = PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<eos>", unk_token="<unk>")
+    fast.pad_token = fast.eos_token
+    return fast
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tokenizer):
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=256, n_embd=16, n_layer=1, n_head=2,
+                        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    return GPT2LMHeadModel(config).eval()
@@ -0,0 +1,86 @@
+# tests/test_evaluate.py
+from types import SimpleNamespace
+
+import pytest
+
+import evaluate
+from utils import fit_prompts, format_prompt
+
+
+def test_bleu_and_rouge():
+    ref = evaluate.tokens("Write a poem about the sea.")
+    assert evaluate.bleu(ref, ref) == pytest.approx(1.0)
+    assert evaluate.rouge_l(ref, ref) == pytest.approx(1.0)
+    assert evaluate.bleu([], ref) == evaluate.rouge_l(ref, []) == 0.0
+    assert 0 < evaluate.rouge_l(evaluate.tokens("a poem about rain"), ref) < 1
+
+
+def test_constraint_retention():
+    source = 'Summarise the 2023 report at https://x.io in "three bullets"'
+    assert evaluate.constraint_retention(source, "2023 report, https://x.io, three bullets") == 1.0
+    assert evaluate.constraint_retention(source, "a report") == 0.0
+    assert evaluate.constraint_retention("write a poem", "anything") is None
+
+
+def test_fit_prompts_cuts_the_input_not_the_template(tokenizer):
+    long = " ".join(["sea"] * 100)
+    prompts, cut = fit_prompts(tokenizer, ["rewrite", "shorten"], ["gpt4o", "claude"],
+                               [long, "write a poem"], max_length=20)
+    assert cut == 1
+    assert prompts[1] == format_prompt("shorten", "claude", "write a poem")
+    assert prompts[0].endswith("\n\nREWRITE:")
+    assert len(tokenizer(prompts[0])["input_ids"]) == 20
+
+
+def test_generate_all_returns_predictions_in_input_order(tokenizer, tiny_model):
+    tokenizer.padding_side = tokenizer.truncation_side = "left"
+    inputs = ["write a poem", " ".join(["sea"] * 60), "summarize this report"]
+    prompts, _ = fit_prompts(tokenizer, ["rewrite"] * 3, ["gpt4o"] * 3, inputs, max_length=32)
+    args = SimpleNamespace(batch_size=2, max_input_length=32, max_new_tokens=4)
+    preds, batches = evaluate.generate_all(tiny_model, tokenizer, prompts, args)
+    # same as generating each prompt on its own: left padding doesn't change greedy output
+    alone = [evaluate.generate_all(tiny_model, tokenizer, [p], args)[0][0] for p in prompts]
+    assert preds == alone
+    assert [b["size"] for b in batches] == [2, 1]
+
+
+def test_summarize():
+    examples = [{"input": "write 3 lines", "output": "write three lines"},
+                {"input": "a poem", "output": "a poem about the sea"}]
+    report = evaluate.summarize(examples, ["write 3 lines", "a poem about the sea"],
+                                [{"size": 2, "seconds": 1.0, "generated_tokens": 10}])
+    assert report["examples"] == 2
+    assert report["rouge_l"] > 0.5
+    assert report["constraint_retention"] == 1.0
+    assert report["examples_per_sec"] == 2.0 and report["latency_p50"] == 0.5
+
+
+def test_empty_test_set_is_a_clear_error(tmp_path, monkeypatch, capsys):
+    empty = tmp_path / "test.jsonl"
+    empty.write_text("")
+    monkeypatch.setattr("sys.argv", ["evaluate.py", "--model_name_or_path", "x", "--test_file", str(empty)])
+    with pytest.raises(SystemExit):
+        evaluate.main()
+    assert "has no examples" in capsys.readouterr().err
+
+
+def test_main_writes_a_report(tmp_path, monkeypatch, tokenizer, tiny_model):
+    import json
+
+    model_dir = tmp_path / "model"
+    tiny_model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    test_file = tmp_path / "test.jsonl"
+    rows = [{"mode": "rewrite", "target": "gpt4o", "input": inp, "output": "write a poem about the sea"}
+            for inp in ("write a poem", " ".join(["sea"] * 200))]
+    test_file.write_text("\n".join(json.dumps(r) for r in rows))
+    output = tmp_path / "eval.json"
+    monkeypatch.setattr("sys.argv", [
+        "evaluate.py", "--model_name_or_path", str(model_dir), "--test_file", str(test_file),
+        "--max_input_length", "64", "--max_new_tokens", "4", "--output", str(output)])
+    evaluate.main()
+
+    report = json.loads(output.read_text())
+    assert report["config"]["examples"] == 2
+    assert report["config"]["truncated_inputs"] == 1
+    assert report["results"]["base"]["examples"] == 2
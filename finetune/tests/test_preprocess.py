@@ -0,0 +1,78 @@
+# tests/test_preprocess.py
+import hashlib
+import json
+
+import pytest
+
+import preprocess
+from preprocess import assign_split, minhash_bands, normalize_record, split_raw
+
+LONG = ("Summarize this quarterly report for the executive team in three bullet points, "
+        "keeping every revenue figure, naming each region, and ending with one clear recommendation")
+
+
+def test_normalize_record_maps_aliases_and_cleans_text():
+    rec = normalize_record({"original_prompt": "  write a   poem \r\n\n\n\nabout the sea ",
+                            "rewritten_prompt": "Write a poem about the sea.", "target_model": "Claude"})
+    assert rec == {"mode": "rewrite", "target": "claude",
+                   "input": "write a poem\n\nabout the sea", "output": "Write a poem about the sea."}
+
+
+@pytest.mark.parametrize("raw", [
+    {"prompt": "write a poem"},                          # no output
+    {"prompt": "write a poem", "output": " write a poem "},  # unchanged rewrite
+    {"prompt": 3, "output": "three"},
+])
+def test_normalize_record_rejects_unusable_records(raw):
+    assert normalize_record(raw) is None
+
+
+def test_near_duplicates_share_a_band():
+    assert set(minhash_bands(LONG)) & set(minhash_bands(LONG + " please"))
+    assert not set(minhash_bands(LONG)) & set(minhash_bands("write a short poem about the sea at night"))
+
+
+def test_split_is_keyed_on_the_prompt():
+    key = hashlib.sha256(b"write a poem").digest()
+    assert assign_split(key, "seed", 0.3, 0.3) == assign_split(key, "seed", 0.3, 0.3)
+    splits = {assign_split(hashlib.sha256(str(i).encode()).digest(), "seed", 0.2, 0.2) for i in range(200)}
+    assert splits == {"train", "dev", "test"}
+
+
+def write_raw(path):
+    rows = [
+        {"input": LONG, "output": "Three bullets: revenue, regions, recommendation."},
+        {"input": LONG.upper(), "output": "Three bullets: revenue, regions, recommendation."},   # exact (prompt case)
+        {"input": LONG + " please", "output": "Three bullets: revenue, regions, recommendation."},  # near
+        {"input": "write a poem", "output": "Write a rhyming poem about the sea."},
+        {"input": "tell me a joke", "output": "Tell one short, clean joke about cats."},
+        {"input": "missing output"},
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r) + "\n")
+        f.write("{not json\n")
+
+
+def read_splits(out_dir):
+    return {s: (out_dir / f"{s}.jsonl").read_text(encoding="utf-8") for s in ("train", "dev", "test")}
+
+
+def test_split_raw_dedups_and_counts(tmp_path):
+    write_raw(tmp_path / "raw.jsonl")
+    stats = split_raw(str(tmp_path / "raw.jsonl"), str(tmp_path / "out"), workers=1)
+    assert stats["exact_duplicates"] == 1
+    assert stats["near_duplicates"] == 1
+    assert stats["bad_json"] == 1 and stats["missing_fields"] == 1
+    assert stats["kept"] == 3 and stats["read"] == 7
+    kept = [json.loads(line) for text in read_splits(tmp_path / "out").values() for line in text.splitlines()]
+    assert sorted(r["input"] for r in kept) == sorted([LONG, "write a poem", "tell me a joke"])
+
+
+def test_split_raw_output_does_not_depend_on_workers(tmp_path, monkeypatch):
+    write_raw(tmp_path / "raw.jsonl")
+    monkeypatch.setattr(preprocess, "SPLIT_CHUNK", 2)       # several chunks, finishing out of order
+    one = split_raw(str(tmp_path / "raw.jsonl"), str(tmp_path / "one"), workers=1)
+    two = split_raw(str(tmp_path / "raw.jsonl"), str(tmp_path / "two"), workers=2)
+    assert read_splits(tmp_path / "one") == read_splits(tmp_path / "two")
+    assert {k: v for k, v in one.items() if "sec" not in k} == {k: v for k, v in two.items() if "sec" not in k}
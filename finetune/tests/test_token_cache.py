@@ -0,0 +1,84 @@
+# tests/test_token_cache.py
+import json
+import os
+
+import numpy as np
+import pytest
+
+import train
+from preprocess import TokenizedSplit, build_token_cache, cache_path
+
+RECORDS = [
+    {"mode": "rewrite", "target": "gpt4o", "input": "write a poem", "output": "write a clear poem about the sea"},
+    {"mode": "shorten", "target": "claude", "input": "summarize this report for executives",
+     "output": "three bullet points"},
+    {"mode": "casual", "target": "gpt4o", "input": "the sea", "output": "write about the sea"},
+]
+
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def files(tmp_path):
+    return {"train": write_jsonl(tmp_path / "train.jsonl", RECORDS),
+            "validation": write_jsonl(tmp_path / "dev.jsonl", RECORDS[:1])}
+
+
+def test_cached_rows_match_tokenize_examples(tokenizer, files, tmp_path):
+    cache = build_token_cache(tokenizer, files, 24, str(tmp_path / "cache"))
+    split = TokenizedSplit(cache, "train")
+    expected = train.tokenize_examples({k: [r[k] for r in RECORDS] for k in RECORDS[0]}, tokenizer, 24)
+    assert len(split) == 3
+    for i in range(3):
+        row = split[i]
+        assert row["input_ids"] == expected["input_ids"][i]
+        assert row["labels"] == row["input_ids"]
+        assert row["attention_mask"] == [1] * len(row["input_ids"])
+    assert split.lengths.tolist() == expected["length"]
+    assert len(TokenizedSplit(cache, "validation")) == 1
+
+
+def test_cache_is_reused_until_its_inputs_change(tokenizer, files, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = build_token_cache(tokenizer, files, 24, cache_dir)
+    stamp = os.path.getmtime(os.path.join(first, "train.tokens.bin"))
+    assert build_token_cache(tokenizer, files, 24, cache_dir) == first
+    assert os.path.getmtime(os.path.join(first, "train.tokens.bin")) == stamp
+    assert cache_path(cache_dir, tokenizer, 16, files) != first          # max_seq_length is in the key
+    write_jsonl(files["train"], RECORDS[:2])
+    assert cache_path(cache_dir, tokenizer, 24, files) != first          # so is the data
+
+
+def test_empty_split(tokenizer, tmp_path):
+    files = {"train": write_jsonl(tmp_path / "train.jsonl", RECORDS),
+             "validation": write_jsonl(tmp_path / "dev.jsonl", [])}
+    cache = build_token_cache(tokenizer, files, 24, str(tmp_path / "cache"))
+    empty = TokenizedSplit(cache, "validation")
+    assert len(empty) == 0
+    assert empty.lengths.tolist() == []
+
+
+def test_length_grouped_sampler_uses_cached_lengths(tokenizer, tiny_model, files, tmp_path):
+    transformers = pytest.importorskip("transformers")
+    cache = build_token_cache(tokenizer, files, 24, str(tmp_path / "cache"))
+    split = TokenizedSplit(cache, "train")
+
+    class NoDecode(TokenizedSplit):
+        def __getitem__(self, i):
+            raise AssertionError("the sampler should not decode rows to measure them")
+
+    split.__class__ = NoDecode
+    training_args = transformers.TrainingArguments(output_dir=str(tmp_path / "out"), per_device_train_batch_size=2,
+                                                   report_to=[], use_cpu=True)
+    training_args.group_by_length = True    # what train.py sets; a TrainingArguments field before transformers 5
+    trainer = train.CountingTrainer(model=tiny_model, args=training_args, train_dataset=split, token_counter=None)
+    sampler = trainer._get_train_sampler()
+    assert isinstance(sampler, train.LengthGroupedSampler)
+    assert sampler.lengths == split.lengths.tolist()
+    assert sorted(sampler) == [0, 1, 2]
+    assert np.argmax(split.lengths) == next(iter(sampler))     # the longest batch leads
@@ -0,0 +1,75 @@
+# tests/test_train.py
+from types import SimpleNamespace
+
+import pytest
+
+datasets = pytest.importorskip("datasets")
+
+import train
+from utils import TokenCounter
+
+ROWS = {
+    "mode":   ["rewrite", "shorten", "casual"],
+    "target": ["gpt4o", "claude", "gpt4o"],
+    "input":  ["write a poem", "summarize this report for executives in three bullet points", "the sea"],
+    "output": ["write a clear poem about the sea", "three bullet points", "write about the sea"],
+}
+
+
+def args(**kw):
+    return SimpleNamespace(**{"padding": "dynamic", "packing": False, "max_seq_length": 32, **kw})
+
+
+def test_tokenize_examples_ends_each_example_with_eos(tokenizer):
+    rows = train.tokenize_examples(ROWS, tokenizer, max_seq_length=12)
+    for ids, labels, mask, n in zip(rows["input_ids"], rows["labels"], rows["attention_mask"], rows["length"]):
+        assert ids[-1] == tokenizer.eos_token_id
+        assert labels == ids and mask == [1] * n and n == len(ids) <= 12
+    assert rows["length"][1] == 12              # the long example is truncated, EOS kept
+    assert len(set(train.tokenize_examples(ROWS, tokenizer, max_seq_length=64)["length"])) == 3   # unpadded
+
+
+def test_pack_examples_never_splits_an_example(tokenizer):
+    rows = train.tokenize_examples(ROWS, tokenizer, max_seq_length=32)
+    limit = max(rows["length"][0] + rows["length"][2], rows["length"][1])
+    packed = train.pack_examples(rows, max_seq_length=limit)
+    assert all(n <= limit for n in packed["length"])
+    assert sum(packed["input_ids"], []) == sum(rows["input_ids"], [])      # order and tokens kept
+    ends = {i for i, t in enumerate(sum(packed["input_ids"], [])) if t == tokenizer.eos_token_id}
+    boundaries, total = set(), 0
+    for ids in packed["input_ids"]:
+        total += len(ids)
+        boundaries.add(total - 1)
+    assert boundaries <= ends                   # every packed row ends on an example's EOS
+
+
+def test_dynamic_padding_pads_per_batch_and_masks_the_padding(tokenizer):
+    ds = datasets.DatasetDict({"train": datasets.Dataset.from_dict(ROWS)})
+    built, collator = train.build_datasets(ds, tokenizer, args())
+    features = [built["train"][i] for i in range(3)]
+    longest = max(len(f["input_ids"]) for f in features)
+    counter = TokenCounter(collator)
+    batch = counter([{k: f[k] for k in ("input_ids", "attention_mask", "labels")} for f in features])
+    width = batch["input_ids"].shape[1]
+    assert width % 8 == 0 and longest <= width < longest + 8
+    assert int((batch["labels"] != -100).sum()) == sum(len(f["input_ids"]) for f in features)
+    assert counter.real_tokens == sum(len(f["input_ids"]) for f in features)
+    assert counter.padded_tokens == 3 * width
+
+
+def test_packing_fills_rows(tokenizer):
+    ds = datasets.DatasetDict({"train": datasets.Dataset.from_dict(ROWS)})
+    unpacked, _ = train.build_datasets(ds, tokenizer, args())
+    packed, _ = train.build_datasets(ds, tokenizer, args(packing=True))
+    assert len(packed["train"]) < len(unpacked["train"])
+    assert sum(packed["train"]["length"]) == sum(unpacked["train"]["length"])
+
+
+def test_legacy_max_length_path_counts_padding_by_pad_id(tokenizer):
+    ds = datasets.DatasetDict({"train": datasets.Dataset.from_dict(ROWS)})
+    built, collator = train.build_datasets(ds, tokenizer, args(padding="max_length"))
+    assert {len(ids) for ids in built["train"]["input_ids"]} == {32}
+    counter = TokenCounter(collator, pad_token_id=train.legacy_pad_id(args(padding="max_length"), tokenizer))
+    counter([{"input_ids": ids} for ids in built["train"]["input_ids"]])
+    assert counter.padded_tokens == 3 * 32
+    assert counter.real_tokens < counter.padded_tokens